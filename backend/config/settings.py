@@ -118,6 +118,49 @@ else:
     }
 
 
+# Order matching: 'sync' matches inline on placement; 'async' acknowledges
+# orders immediately and leaves matching to `manage.py run_matcher` workers
+# (one per market shard). Only async keeps order books cached in memory;
+# sync walks just the resting orders each match fills, a batch at a time.
+ORDER_MATCHING_MODE = config('ORDER_MATCHING_MODE', default='sync')
+
+# Market orders fill at each level's price, up to the current price plus this much
+MARKET_ORDER_SLIPPAGE = config('MARKET_ORDER_SLIPPAGE', default='0.05')
+
+# Most markets settled at once by batch settlement (each uses its own DB connection)
+SETTLEMENT_MAX_CONCURRENCY = config('SETTLEMENT_MAX_CONCURRENCY', default=4, cast=int)
+
+# Account that takes the other side of every fill in LMSR-priced markets
+AMM_HOUSE_USERNAME = config('AMM_HOUSE_USERNAME', default='panra-house')
+
+# How often run_scheduler recomputes the leaderboard rank table
+LEADERBOARD_REFRESH_SECONDS = config('LEADERBOARD_REFRESH_SECONDS', default=60, cast=int)
+
+# Rank history keeps a row per trader per day for this many days, then one per week
+RANK_HISTORY_DAILY_DAYS = config('RANK_HISTORY_DAILY_DAYS', default=90, cast=int)
+
+# Cache: Redis if CACHE_URL is set (e.g. redis://host:6379/1, needs the redis
+# package), otherwise per-process memory for local dev
+CACHE_URL = config('CACHE_URL', default=None)
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# How long a user's profile stats stay cached (they're also dropped when the user trades)
+USER_STATS_CACHE_SECONDS = config('USER_STATS_CACHE_SECONDS', default=60, cast=int)
+
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
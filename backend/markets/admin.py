@@ -1,44 +1,85 @@
 from django.contrib import admin, messages
-from .models import Market, MarketOutcome
-from .settlement import settle_market
+from .models import Market, MarketOutcome, SettlementJob
+from .settlement import close_market, enqueue_settlement
 
 
 @admin.register(Market)
 class MarketAdmin(admin.ModelAdmin):
-    list_display = ['title', 'status', 'yes_price', 'no_price', 'total_volume', 'created_at', 'end_date']
-    list_filter = ['status', 'category', 'created_at']
+    list_display = ['title', 'status', 'pricing_mode', 'yes_price', 'no_price', 'total_volume', 'created_at', 'end_date']
+    list_filter = ['status', 'pricing_mode', 'category', 'created_at']
     search_fields = ['title', 'question', 'description']
     prepopulated_fields = {'slug': ('title',)}
-    readonly_fields = ['yes_price', 'no_price', 'total_volume', 'total_liquidity']
-    actions = ['settle_as_yes', 'settle_as_no']
+    readonly_fields = ['yes_price', 'no_price', 'total_volume', 'total_liquidity', 'lmsr_q_yes', 'lmsr_q_no']
+    actions = ['close_trading', 'settle_as_yes', 'settle_as_no']
 
-    def settle_as_yes(self, request, queryset):
-        settled = 0
+    def close_trading(self, request, queryset):
+        closed, cancelled = 0, 0
+        for market in queryset.filter(status__in=['open', 'closed']):
+            cancelled += close_market(market)['cancelled']
+            closed += 1
+        self.message_user(
+            request,
+            f"Closed {closed} market(s) and cancelled {cancelled} resting order(s) with refunds.",
+            level=messages.SUCCESS,
+        )
+
+    close_trading.short_description = "Close trading and refund resting orders"
+
+    def _queue_settlements(self, request, queryset, outcome):
+        queued = 0
         for market in queryset:
             try:
-                summary = settle_market(market, 'yes')
-                settled += 1
+                enqueue_settlement(market, outcome, created_by=request.user)
+                queued += 1
             except ValueError as e:
                 self.message_user(request, f"Could not settle '{market.slug}': {e}", level=messages.ERROR)
-        if settled:
-            self.message_user(request, f"Settled {settled} market(s) as YES.", level=messages.SUCCESS)
+        if queued:
+            self.message_user(
+                request,
+                f"Queued settlement of {queued} market(s) as {outcome.upper()}. "
+                f"Progress is shown under Settlement jobs (run_settlement_worker must be running).",
+                level=messages.SUCCESS,
+            )
+
+    def settle_as_yes(self, request, queryset):
+        self._queue_settlements(request, queryset, 'yes')
 
     settle_as_yes.short_description = "Settle selected markets as YES"
 
     def settle_as_no(self, request, queryset):
-        settled = 0
-        for market in queryset:
-            try:
-                summary = settle_market(market, 'no')
-                settled += 1
-            except ValueError as e:
-                self.message_user(request, f"Could not settle '{market.slug}': {e}", level=messages.ERROR)
-        if settled:
-            self.message_user(request, f"Settled {settled} market(s) as NO.", level=messages.SUCCESS)
+        self._queue_settlements(request, queryset, 'no')
 
     settle_as_no.short_description = "Settle selected markets as NO"
 
 
+@admin.register(SettlementJob)
+class SettlementJobAdmin(admin.ModelAdmin):
+    list_display = ['market', 'outcome', 'status', 'progress_display', 'total_payout', 'created_at', 'finished_at']
+    list_filter = ['status', 'outcome', 'created_at']
+    search_fields = ['market__title', 'market__slug']
+    readonly_fields = [
+        'market', 'outcome', 'status', 'progress_display', 'chunk_size', 'last_position_id',
+        'positions_total', 'positions_done', 'total_payout', 'error', 'created_by',
+        'created_at', 'started_at', 'finished_at', 'updated_at',
+    ]
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress_display(self, obj):
+        return f"{obj.progress}% ({obj.positions_done}/{obj.positions_total})"
+
+    progress_display.short_description = "Progress"
+
+    def retry(self, request, queryset):
+        # Failed jobs resume from their checkpoint
+        retried = queryset.filter(status='failed').update(status='running', error='')
+        self.message_user(request, f"Requeued {retried} failed job(s).", level=messages.SUCCESS)
+
+    retry.short_description = "Retry selected failed jobs"
+
+
 @admin.register(MarketOutcome)
 class MarketOutcomeAdmin(admin.ModelAdmin):
     list_display = ['market', 'name', 'price', 'volume']
@@ -0,0 +1,67 @@
+"""
+Run the market scheduler (see markets/scheduler.py).
+
+Safe to start on every node; only the holder of the scheduler lease runs
+tasks:
+
+    python manage.py run_scheduler
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from markets.scheduler import acquire_lease, default_holder, release_lease, run_due_tasks
+
+
+class Command(BaseCommand):
+    help = 'Close markets when their end_date passes, refresh leaderboard ranks and run other scheduled tasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            default=60,
+            help='How long a leader holds the lease without renewing it (default 60).',
+        )
+        parser.add_argument('--once', action='store_true', help='Run due tasks once (if leader) and exit.')
+
+    def handle(self, *args, **options):
+        lease_seconds = options['lease_seconds']
+        if lease_seconds < 3:
+            raise CommandError('--lease-seconds must be at least 3.')
+        # Followers retry well before a dead leader's lease runs out
+        renew_every = lease_seconds / 3
+        holder = default_holder()
+
+        def still_leader():
+            return acquire_lease(holder, lease_seconds)
+
+        self.stdout.write(self.style.SUCCESS(f'Scheduler started as {holder}.'))
+        try:
+            while True:
+                if not acquire_lease(holder, lease_seconds):
+                    if options['once']:
+                        self.stdout.write('Another node holds the scheduler lease.')
+                        break
+                    time.sleep(renew_every)
+                    continue
+
+                results, next_due = run_due_tasks(before_task=still_leader)
+                for name, result in results.items():
+                    self.stdout.write(f'{name}: {len(result) if hasattr(result, "__len__") else result}')
+                if options['once']:
+                    break
+
+                sleep_for = renew_every
+                if next_due is not None:
+                    sleep_for = max(0.5, (next_due - timezone.now()).total_seconds())
+                # Hold the lease through the sleep: if this node dies, it still lapses lease_seconds after wake-up
+                if not acquire_lease(holder, sleep_for + lease_seconds):
+                    continue
+                time.sleep(sleep_for)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            release_lease(holder)
+        self.stdout.write(self.style.SUCCESS('Scheduler stopped.'))
@@ -0,0 +1,55 @@
+"""
+Run queued market settlements (see markets.settlement.enqueue_settlement).
+
+Each step settles one chunk of positions and commits it with the job's
+checkpoint, so the worker can be stopped or killed at any time and picks up
+where it left off:
+
+    python manage.py run_settlement_worker
+    python manage.py run_settlement_worker --concurrency 4   # 4 markets at a time
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from markets.settlement import run_settlement_loop, settlement_concurrency
+
+
+class Command(BaseCommand):
+  help = "Process queued settlement jobs chunk by chunk."
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--idle-sleep",
+      type=float,
+      default=2.0,
+      help="Seconds to wait when no job is queued (default 2).",
+    )
+    parser.add_argument("--once", action="store_true", help="Run until no job is left, then exit.")
+    parser.add_argument(
+      "--concurrency",
+      type=int,
+      default=1,
+      help="Jobs (markets) settled at the same time (capped by SETTLEMENT_MAX_CONCURRENCY; 1 on SQLite).",
+    )
+
+  def handle(self, *args, **options):
+    workers = settlement_concurrency(options["concurrency"])
+    self.stdout.write(self.style.SUCCESS(f"Settlement worker started with {workers} process(es)."))
+    finished = 0
+    try:
+      if workers == 1:
+        finished = run_settlement_loop(options["idle_sleep"], options["once"])
+      else:
+        # Children must open their own connections, never reuse the parent's
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+          loops = [
+            pool.submit(run_settlement_loop, options["idle_sleep"], options["once"], True)
+            for _ in range(workers)
+          ]
+          finished = sum(loop.result() for loop in loops)
+    except KeyboardInterrupt:
+      pass
+    self.stdout.write(self.style.SUCCESS(f"Settlement worker stopped. Finished {finished} job(s)."))
@@ -1,25 +1,47 @@
+import csv
+
 from django.core.management.base import BaseCommand, CommandError
 
 from markets.models import Market
-from markets.settlement import settle_market
+from markets.settlement import settle_market_bulk, settle_markets_concurrently
 
 
 class Command(BaseCommand):
-  help = "Settle a binary market by slug and outcome (yes/no)."
+  help = (
+    "Settle a binary market by slug and outcome (yes/no), or several at once with "
+    "--batch slug:outcome ... / --csv file.csv (columns: slug,outcome)."
+  )
 
   def add_arguments(self, parser):
-    parser.add_argument("slug", type=str, help="Slug of the market to settle")
+    parser.add_argument("slug", type=str, nargs="?", help="Slug of the market to settle")
     parser.add_argument(
       "--outcome",
       type=str,
-      required=True,
       choices=["yes", "no"],
       help="Outcome to settle the market as (yes or no)",
     )
+    parser.add_argument(
+      "--batch",
+      nargs="+",
+      metavar="SLUG:OUTCOME",
+      help="Settle several markets concurrently, e.g. --batch afcon-final:yes budget-vote:no",
+    )
+    parser.add_argument("--csv", type=str, help="CSV file of markets to settle concurrently (slug,outcome)")
+    parser.add_argument(
+      "--concurrency",
+      type=int,
+      default=None,
+      help="Markets settled at the same time in batch mode (capped by SETTLEMENT_MAX_CONCURRENCY)",
+    )
 
   def handle(self, *args, **options):
+    if options["batch"] or options["csv"]:
+      return self.handle_batch(options)
+
     slug = options["slug"]
     outcome = options["outcome"]
+    if not slug or not outcome:
+      raise CommandError("Give a slug and --outcome, or use --batch / --csv.")
 
     try:
       market = Market.objects.get(slug=slug)
@@ -29,13 +51,67 @@ class Command(BaseCommand):
     self.stdout.write(self.style.WARNING(f"Settling market '{market.title}' ({slug}) as {outcome.upper()}..."))
 
     try:
-      summary = settle_market(market, outcome, logger=None)
+      summary = settle_market_bulk(market, outcome, logger=None)
     except ValueError as e:
       raise CommandError(str(e))
 
     self.stdout.write(
       self.style.SUCCESS(
-        f"Done. Users updated: {summary['users_updated']}, total payout: {summary['total_payout']}."
+        f"Done. Users updated: {summary['users_updated']}, total payout: {summary['total_payout']}, "
+        f"resting orders cancelled: {summary['orders_cancelled']}."
+      )
+    )
+
+  def handle_batch(self, options):
+    requests = self.parse_requests(options)
+    slugs = [slug for slug, _ in requests]
+    if len(set(slugs)) != len(slugs):
+      raise CommandError("Each market may only be listed once.")
+
+    self.stdout.write(self.style.WARNING(f"Settling {len(requests)} market(s)..."))
+    summary = settle_markets_concurrently(requests, concurrency=options["concurrency"])
+
+    for result in summary["markets"]:
+      line = f"  {result['market']:<40} {result['outcome'].upper():<4} {result['status']:<7} {result['seconds']:>8.2f}s"
+      if result["status"] == "done":
+        self.stdout.write(f"{line}  positions: {result['positions']}, payout: {result['total_payout']}")
+      else:
+        self.stdout.write(self.style.ERROR(f"{line}  {result.get('error', '')}"))
+
+    style = self.style.SUCCESS if not summary["failed"] else self.style.WARNING
+    self.stdout.write(
+      style(
+        f"Done in {summary['seconds']:.2f}s with {summary['concurrency']} process(es). "
+        f"Settled: {summary['settled']}, failed: {summary['failed']}, "
+        f"positions: {summary['positions']}, total payout: {summary['total_payout']}."
       )
     )
 
+  def parse_requests(self, options):
+    rows = []
+    for item in options["batch"] or []:
+      slug, sep, outcome = item.rpartition(":")
+      if not sep:
+        raise CommandError(f"Expected SLUG:OUTCOME, got '{item}'.")
+      rows.append((slug, outcome))
+    if options["csv"]:
+      try:
+        with open(options["csv"], newline="") as f:
+          for row in csv.reader(f):
+            if not row or row[0].strip().lower() in ("", "slug") or row[0].startswith("#"):
+              continue
+            if len(row) < 2:
+              raise CommandError(f"Expected slug,outcome, got '{','.join(row)}'.")
+            rows.append((row[0].strip(), row[1].strip()))
+      except OSError as e:
+        raise CommandError(str(e))
+
+    requests = []
+    for slug, outcome in rows:
+      outcome = outcome.lower()
+      if outcome not in ("yes", "no"):
+        raise CommandError(f"Outcome for '{slug}' must be yes or no, got '{outcome}'.")
+      requests.append((slug, outcome))
+    if not requests:
+      raise CommandError("No markets to settle.")
+    return requests
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0003_add_resolution_criteria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='market',
+            name='book_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:51
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_vwap_state(apps, schema_editor):
+    """Seed each market's rolling VWAP window from its last 100 trades."""
+    Market = apps.get_model('markets', 'Market')
+    Trade = apps.get_model('trading', 'Trade')
+    zero = Decimal('0')
+    one = Decimal('1')
+
+    for market in Market.objects.all().iterator():
+        recent = list(Trade.objects.filter(market=market).order_by('-executed_at')[:100])
+        if not recent:
+            continue
+        window = []
+        sums = [zero, zero, zero, zero]
+        for trade in reversed(recent):
+            is_complementary = abs(trade.total_value - trade.quantity) < Decimal('0.01')
+            own_value = (trade.price * trade.quantity) if is_complementary else trade.total_value
+            other_value = (one - trade.price) * trade.quantity
+            if trade.side == 'yes':
+                entry = (own_value, trade.quantity, other_value, trade.quantity) if is_complementary \
+                    else (own_value, trade.quantity, zero, zero)
+            else:
+                entry = (other_value, trade.quantity, own_value, trade.quantity) if is_complementary \
+                    else (zero, zero, own_value, trade.quantity)
+            window.append([str(value) for value in entry])
+            sums = [total + value for total, value in zip(sums, entry)]
+        last = recent[0]
+        market.vwap_window = window
+        market.vwap_yes_value, market.vwap_yes_quantity, market.vwap_no_value, market.vwap_no_quantity = sums
+        market.last_trade_price = last.price if last.side == 'yes' else one - last.price
+        market.last_trade_at = last.executed_at
+        market.save(update_fields=[
+            'vwap_window', 'vwap_yes_value', 'vwap_yes_quantity', 'vwap_no_value', 'vwap_no_quantity',
+            'last_trade_price', 'last_trade_at',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0004_market_book_seq'),
+        ('trading', '0004_order_time_in_force'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='market',
+            name='last_trade_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='last_trade_price',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='reference_price',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='YES price at the start of the current 24h change window', max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='reference_price_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='vwap_no_quantity',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='vwap_no_value',
+            field=models.DecimalField(decimal_places=6, default=0, editable=False, max_digits=26),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='vwap_window',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='vwap_yes_quantity',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='vwap_yes_value',
+            field=models.DecimalField(decimal_places=6, default=0, editable=False, max_digits=26),
+        ),
+        migrations.RunPython(backfill_vwap_state, migrations.RunPython.noop),
+    ]
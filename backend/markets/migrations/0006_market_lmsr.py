@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:57
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0005_market_vwap_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='market',
+            name='lmsr_b',
+            field=models.DecimalField(decimal_places=2, default=100.0, help_text='LMSR liquidity parameter b (house loss is at most b * ln 2)', max_digits=20, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='lmsr_q_no',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='lmsr_q_yes',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='market',
+            name='pricing_mode',
+            field=models.CharField(choices=[('book', 'Order Book'), ('lmsr', 'LMSR Market Maker')], default='book', help_text="Choose before trading starts; LMSR markets don't use the order book", max_length=10),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0006_market_lmsr'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outcome', models.CharField(choices=[('yes', 'Yes'), ('no', 'No')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('chunk_size', models.IntegerField(default=1000)),
+                ('last_position_id', models.BigIntegerField(default=0)),
+                ('positions_total', models.IntegerField(default=0)),
+                ('positions_done', models.IntegerField(default=0)),
+                ('total_payout', models.DecimalField(decimal_places=2, default=0.0, max_digits=20)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='settlement_jobs', to=settings.AUTH_USER_MODEL)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlement_jobs', to='markets.market')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='markets_set_status_df6574_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:18
+
+from datetime import timedelta
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_price_buckets(apps, schema_editor):
+    """
+    Bucket each market's trades from the last 48 hours by hour and seed the
+    VWAP sums from the last 24 of them. Pre-trade prices weren't recorded, so
+    a bucket opens and closes at its first and last trade's YES price (the
+    latest one closes at the market's current price).
+    """
+    Market = apps.get_model('markets', 'Market')
+    MarketPriceBucket = apps.get_model('markets', 'MarketPriceBucket')
+    Trade = apps.get_model('trading', 'Trade')
+    zero = Decimal('0')
+    one = Decimal('1')
+    current_hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+    window_start = current_hour - timedelta(hours=23)
+    since = current_hour - timedelta(hours=47)
+
+    for market in Market.objects.all().iterator():
+        trades = Trade.objects.filter(market=market, executed_at__gte=since).order_by('executed_at', 'id')
+        buckets = {}
+        for trade in trades:
+            is_complementary = abs(trade.total_value - trade.quantity) < Decimal('0.01')
+            own_value = (trade.price * trade.quantity) if is_complementary else trade.total_value
+            other_value = (one - trade.price) * trade.quantity
+            if trade.side == 'yes':
+                entry = (own_value, trade.quantity, other_value, trade.quantity) if is_complementary \
+                    else (own_value, trade.quantity, zero, zero)
+            else:
+                entry = (other_value, trade.quantity, own_value, trade.quantity) if is_complementary \
+                    else (zero, zero, own_value, trade.quantity)
+            if market.pricing_mode == 'lmsr':
+                entry = (zero, zero, zero, zero)
+            yes_price = trade.price if trade.side == 'yes' else one - trade.price
+            hour = trade.executed_at.replace(minute=0, second=0, microsecond=0)
+            bucket = buckets.get(hour)
+            if bucket is None:
+                bucket = buckets[hour] = MarketPriceBucket(
+                    market=market, hour=hour,
+                    yes_value=zero, yes_quantity=zero, no_value=zero, no_quantity=zero,
+                    open_price=yes_price,
+                )
+            bucket.yes_value += entry[0]
+            bucket.yes_quantity += entry[1]
+            bucket.no_value += entry[2]
+            bucket.no_quantity += entry[3]
+            bucket.close_price = yes_price
+        if not buckets:
+            continue
+        buckets[max(buckets)].close_price = market.yes_price
+        MarketPriceBucket.objects.bulk_create(buckets.values())
+
+        sums = [zero, zero, zero, zero]
+        for hour, bucket in buckets.items():
+            if hour >= window_start:
+                sums = [
+                    total + value for total, value in
+                    zip(sums, (bucket.yes_value, bucket.yes_quantity, bucket.no_value, bucket.no_quantity))
+                ]
+        market.vwap_window_start = window_start
+        market.vwap_yes_value, market.vwap_yes_quantity, market.vwap_no_value, market.vwap_no_quantity = sums
+        market.save(update_fields=[
+            'vwap_window_start', 'vwap_yes_value', 'vwap_yes_quantity', 'vwap_no_value', 'vwap_no_quantity',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0008_scheduler'),
+        ('trading', '0009_order_book_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='market',
+            name='vwap_window_start',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='MarketPriceBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text='Start of the hour')),
+                ('yes_value', models.DecimalField(decimal_places=6, default=0, max_digits=26)),
+                ('yes_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('no_value', models.DecimalField(decimal_places=6, default=0, max_digits=26)),
+                ('no_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('open_price', models.DecimalField(decimal_places=4, max_digits=5)),
+                ('close_price', models.DecimalField(decimal_places=4, max_digits=5)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_buckets', to='markets.market')),
+            ],
+            options={
+                'ordering': ['market', 'hour'],
+                'constraints': [models.UniqueConstraint(fields=('market', 'hour'), name='unique_market_price_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_price_buckets, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='market',
+            name='reference_price',
+        ),
+        migrations.RemoveField(
+            model_name='market',
+            name='reference_price_at',
+        ),
+        migrations.RemoveField(
+            model_name='market',
+            name='vwap_window',
+        ),
+    ]
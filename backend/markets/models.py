@@ -1,9 +1,41 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 User = get_user_model()
 
+# Span of Market.price_change_24h
+PRICE_CHANGE_WINDOW = timedelta(hours=24)
+# Width of a MarketPriceBucket
+PRICE_BUCKET_SPAN = timedelta(hours=1)
+
+
+def price_bucket_start(when):
+    """Start of the MarketPriceBucket that `when` falls in."""
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def price_24h_ago(now=None):
+    """
+    Subquery for the outer market's YES price PRICE_CHANGE_WINDOW ago, to the
+    hour: the close of the last bucket that ended by then, or, for a market
+    whose first trade is more recent, the open of its first bucket. Null when
+    the market has never traded.
+    """
+    cutoff = (now or timezone.now()) - PRICE_CHANGE_WINDOW
+    buckets = MarketPriceBucket.objects.filter(market=OuterRef('pk'))
+    return Coalesce(
+        Subquery(buckets.filter(hour__lte=cutoff - PRICE_BUCKET_SPAN).order_by('-hour').values('close_price')[:1]),
+        Subquery(buckets.order_by('hour').values('open_price')[:1]),
+        output_field=models.DecimalField(max_digits=5, decimal_places=4),
+    )
+
 
 class Market(models.Model):
     """Prediction market model."""
@@ -15,6 +47,11 @@ class Market(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    PRICING_MODE_CHOICES = [
+        ('book', 'Order Book'),
+        ('lmsr', 'LMSR Market Maker'),
+    ]
+    
     RESOLUTION_CHOICES = [
         ('yes', 'Yes'),
         ('no', 'No'),
@@ -64,24 +101,169 @@ class Market(models.Model):
         validators=[MinValueValidator(0.0000), MaxValueValidator(1.0000)]
     )
     
+    # Pricing: 'book' matches users against each other; 'lmsr' fills every order
+    # against the house market maker (see trading/amm.py)
+    pricing_mode = models.CharField(
+        max_length=10,
+        choices=PRICING_MODE_CHOICES,
+        default='book',
+        help_text="Choose before trading starts; LMSR markets don't use the order book"
+    )
+    lmsr_b = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=100.00,
+        validators=[MinValueValidator(1)],
+        help_text="LMSR liquidity parameter b (house loss is at most b * ln 2)"
+    )
+    lmsr_q_yes = models.DecimalField(max_digits=20, decimal_places=2, default=0.00, editable=False)
+    lmsr_q_no = models.DecimalField(max_digits=20, decimal_places=2, default=0.00, editable=False)
+    
+    # Bumped on every change to the resting orders (see trading/orderbook.py)
+    book_seq = models.BigIntegerField(default=0, editable=False)
+    
+    # Rolling VWAP state over the hourly price buckets from vwap_window_start on
+    # (see trading.matching.update_market_price); the vwap_* sums are kept equal
+    # to those buckets' totals so no re-summing is needed.
+    vwap_window_start = models.DateTimeField(null=True, blank=True, editable=False)
+    vwap_yes_value = models.DecimalField(max_digits=26, decimal_places=6, default=0, editable=False)
+    vwap_yes_quantity = models.DecimalField(max_digits=20, decimal_places=2, default=0, editable=False)
+    vwap_no_value = models.DecimalField(max_digits=26, decimal_places=6, default=0, editable=False)
+    vwap_no_quantity = models.DecimalField(max_digits=20, decimal_places=2, default=0, editable=False)
+    
+    # Cheap "last price" for market lists
+    last_trade_price = models.DecimalField(max_digits=5, decimal_places=4, null=True, blank=True)
+    last_trade_at = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', '-created_at']),
             models.Index(fields=['category', '-created_at']),
+            # run_scheduler: next open market to end / open markets past their end
+            models.Index(fields=['status', 'end_date']),
         ]
     
     def __str__(self):
         return self.title
     
+    @property
+    def price_change_24h(self):
+        """
+        YES price change since PRICE_CHANGE_WINDOW ago (see price_24h_ago).
+        Querysets that list markets annotate `price_24h_ago` to save a query
+        per market.
+        """
+        if hasattr(self, 'price_24h_ago'):
+            reference = self.price_24h_ago
+        else:
+            reference = Market.objects.filter(pk=self.pk).values_list(price_24h_ago(), flat=True).first()
+        if reference is None:
+            return Decimal('0.0000')
+        return (Decimal(str(self.yes_price)) - reference).quantize(Decimal('0.0001'))
+    
     def save(self, *args, **kwargs):
-        from decimal import Decimal
         one = Decimal('1.0000')
         if self.yes_price + self.no_price != one:
             self.no_price = one - self.yes_price
         super().save(*args, **kwargs)
 
 
+class MarketPriceBucket(models.Model):
+    """
+    One hour of a market's trading: VWAP sums of the fills in it, and the YES
+    price before its first and after its last fill. Written under the market
+    row lock by trading.matching.record_price_bucket.
+    """
+    
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name='price_buckets')
+    hour = models.DateTimeField(help_text="Start of the hour")
+    yes_value = models.DecimalField(max_digits=26, decimal_places=6, default=0)
+    yes_quantity = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    no_value = models.DecimalField(max_digits=26, decimal_places=6, default=0)
+    no_quantity = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    open_price = models.DecimalField(max_digits=5, decimal_places=4)
+    close_price = models.DecimalField(max_digits=5, decimal_places=4)
+    
+    class Meta:
+        ordering = ['market', 'hour']
+        constraints = [
+            # Also the (market, hour) index the VWAP and 24h-change lookups scan
+            models.UniqueConstraint(fields=['market', 'hour'], name='unique_market_price_bucket'),
+        ]
+    
+    def __str__(self):
+        return f"{self.market.title} @ {self.hour:%Y-%m-%d %H:00}"
+
+
+class SettlementJob(models.Model):
+    """
+    A market settlement run in the background by `manage.py run_settlement_worker`.
+    
+    Positions are settled in chunks, each committed together with the
+    checkpoint (last_position_id), so a killed worker resumes where it stopped.
+    """
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name='settlement_jobs')
+    outcome = models.CharField(max_length=20, choices=[('yes', 'Yes'), ('no', 'No')])
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    
+    # Progress / checkpoint
+    chunk_size = models.IntegerField(default=1000)
+    last_position_id = models.BigIntegerField(default=0)
+    positions_total = models.IntegerField(default=0)
+    positions_done = models.IntegerField(default=0)
+    total_payout = models.DecimalField(max_digits=20, decimal_places=2, default=0.00)
+    error = models.TextField(blank=True)
+    
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='settlement_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"Settle {self.market.slug} as {self.outcome.upper()} ({self.status})"
+    
+    @property
+    def progress(self):
+        """Share of positions settled, 0-100."""
+        if self.status == 'done':
+            return 100
+        if not self.positions_total:
+            return 0
+        return min(100, int(self.positions_done * 100 / self.positions_total))
+
+
+class SchedulerLease(models.Model):
+    """
+    Leadership lease for `manage.py run_scheduler`.
+    
+    Any number of nodes may run the scheduler; only the holder of an unexpired
+    lease runs tasks. The row is locked while the lease is taken or renewed.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=255, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    renewed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.holder or 'free'}"
+
+
 class MarketOutcome(models.Model):
     """Individual outcome for a market (for markets with multiple outcomes)."""
     market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name='outcomes')
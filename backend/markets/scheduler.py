@@ -0,0 +1,143 @@
+"""
+Market Scheduler
+
+Time-driven jobs run by `manage.py run_scheduler`:
+- close markets once their end_date passes (one UPDATE), then run the
+  post-close hooks for them (sweeping the order book, see settlement.close_market)
+- recompute the leaderboard rank table (users.leaderboard)
+- archive and reset the weekly / monthly points when their window closes
+  (users.points)
+- snapshot every trader's rank each night (users.history)
+
+Instead of polling on a fixed interval the scheduler sleeps until the next
+task is due (e.g. the earliest end_date of an open market). The rank refresh
+runs every LEADERBOARD_REFRESH_SECONDS, which bounds every sleep and so also
+picks up newly created markets.
+
+Several nodes may run the scheduler. Leadership is a row-locked lease
+(SchedulerLease); only the current holder runs tasks, the others wait for it
+to expire. The leader renews the lease before each task and stops if it has
+lost it (a long task outlasted the lease and another node took over), and
+takes it through each sleep, so it never wakes just to renew.
+"""
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from users.history import next_leaderboard_snapshot, snapshot_leaderboard
+from users.leaderboard import next_rank_refresh, refresh_leaderboard_ranks
+from users.points import next_points_rollover, roll_points_windows
+
+from .models import Market, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'run_scheduler'
+
+
+def default_holder():
+    """Identifies this scheduler process in the lease row."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(holder, ttl_seconds, name=LEASE_NAME):
+    """
+    Take or renew the scheduler lease. Returns True if `holder` is the leader
+    until now + ttl_seconds.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        try:
+            lease, _ = SchedulerLease.objects.select_for_update().get_or_create(name=name)
+        except IntegrityError:
+            lease = SchedulerLease.objects.select_for_update().get(name=name)
+        if lease.holder != holder and lease.expires_at and lease.expires_at > now:
+            return False
+        lease.holder = holder
+        lease.expires_at = now + timedelta(seconds=ttl_seconds)
+        lease.renewed_at = now
+        lease.save(update_fields=['holder', 'expires_at', 'renewed_at'])
+        return True
+
+
+def release_lease(holder, name=LEASE_NAME):
+    """Give up the lease (on shutdown) so another node takes over right away."""
+    SchedulerLease.objects.filter(name=name, holder=holder).update(expires_at=timezone.now())
+
+
+def sweep_closed_market(market):
+    from .settlement import close_market
+    result = close_market(market)
+    if result['cancelled']:
+        logger.info(f"[scheduler] {market.slug}: cancelled {result['cancelled']} resting order(s), refunded {result['refunded']}")
+
+
+# Called with each market the scheduler closes
+POST_CLOSE_HOOKS = [sweep_closed_market]
+
+
+def next_market_close():
+    """The earliest end_date of an open market, or None."""
+    return Market.objects.filter(status='open').aggregate(next_close=Min('end_date'))['next_close']
+
+
+def close_due_markets(now=None):
+    """
+    Close every open market whose end_date has passed with one UPDATE, then
+    run POST_CLOSE_HOOKS for each. Returns the closed markets.
+    """
+    now = now or timezone.now()
+    due = list(Market.objects.filter(status='open', end_date__lte=now).values_list('pk', flat=True))
+    if not due:
+        return []
+
+    Market.objects.filter(pk__in=due, status='open').update(status='closed')
+
+    markets = list(Market.objects.filter(pk__in=due, status='closed'))
+    for market in markets:
+        for hook in POST_CLOSE_HOOKS:
+            try:
+                hook(market)
+            except Exception as e:
+                logger.error(f"[scheduler] Post-close hook {hook.__name__} failed for {market.slug}: {e}", exc_info=True)
+    logger.info(f"[scheduler] Closed {len(markets)} market(s) past end_date")
+    return markets
+
+
+# (name, next_due() -> datetime | None, run(now) -> list)
+SCHEDULED_TASKS = [
+    ('close_due_markets', next_market_close, close_due_markets),
+    ('refresh_leaderboard_ranks', next_rank_refresh, refresh_leaderboard_ranks),
+    ('roll_points_windows', next_points_rollover, roll_points_windows),
+    ('snapshot_leaderboard', next_leaderboard_snapshot, snapshot_leaderboard),
+]
+
+
+def run_due_tasks(now=None, before_task=None):
+    """
+    Run every task that is due. Returns (results, next_due) where results maps
+    task name -> result and next_due is when the next task is due (or None).
+
+    `before_task()` is called before each due task (run_scheduler renews its
+    lease there); if it returns False the remaining tasks are left for the
+    node that holds the lease now.
+    """
+    now = now or timezone.now()
+    results = {}
+    for name, next_due, run in SCHEDULED_TASKS:
+        due_at = next_due()
+        if due_at is not None and due_at <= now:
+            if before_task is not None and not before_task():
+                logger.warning(f"[scheduler] Lost the scheduler lease before {name}; leaving it to the new leader")
+                break
+            try:
+                results[name] = run(now)
+            except Exception as e:
+                logger.error(f"[scheduler] Task {name} failed: {e}", exc_info=True)
+    upcoming = [due_at for due_at in (next_due() for _, next_due, _ in SCHEDULED_TASKS) if due_at is not None]
+    return results, min(upcoming) if upcoming else None
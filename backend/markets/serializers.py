@@ -13,6 +13,8 @@ class MarketSerializer(serializers.ModelSerializer):
     yes_price = serializers.DecimalField(max_digits=5, decimal_places=4, read_only=True)
     no_price = serializers.DecimalField(max_digits=5, decimal_places=4, read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
+    last_trade_price = serializers.DecimalField(max_digits=5, decimal_places=4, read_only=True)
+    price_change_24h = serializers.DecimalField(max_digits=5, decimal_places=4, read_only=True)
     
     class Meta:
         model = Market
@@ -20,9 +22,10 @@ class MarketSerializer(serializers.ModelSerializer):
             'id', 'title', 'description', 'slug', 'question', 'resolution_criteria',
             'category', 'image_url', 'status', 'resolution', 'created_at', 'end_date',
             'resolution_date', 'created_by_username', 'total_volume',
-            'total_liquidity', 'yes_price', 'no_price'
+            'total_liquidity', 'yes_price', 'no_price',
+            'last_trade_price', 'last_trade_at', 'price_change_24h', 'pricing_mode'
         ]
-        read_only_fields = ['id', 'created_at', 'yes_price', 'no_price']
+        read_only_fields = ['id', 'created_at', 'yes_price', 'no_price', 'last_trade_at', 'pricing_mode']
 
 
 class MarketDetailSerializer(MarketSerializer):
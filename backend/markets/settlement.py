@@ -1,28 +1,69 @@
 from decimal import Decimal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Literal, Optional
 
-from django.db import transaction
+from django.conf import settings
+from django.db import connection, connections, transaction
 from django.utils import timezone
 
-from markets.models import Market
+from markets.models import Market, SettlementJob
 from trading.models import Position
+from trading.valuation import record_position_changes, snapshot
+from users.ledger import balance_entry, record_credit_entries
+from users.points import points_event, record_points_events
 
 OutcomeType = Literal["yes", "no"]
 
+SETTLEMENT_CHUNK_SIZE = 1000
+ACTIVE_JOB_STATUSES = ["queued", "running"]
+# Jobs that still own the market's settlement (a failed one is retried, never replaced)
+UNFINISHED_JOB_STATUSES = ACTIVE_JOB_STATUSES + ["failed"]
 
-def settle_market(market: Market, outcome: OutcomeType, logger: Optional[object] = None) -> dict:
+# User columns written by a settlement (payout + stats + the auto_now fields a full save would touch)
+SETTLEMENT_USER_FIELDS = [
+  "credits",
+  "base_credits",
+  "last_activity_at",
+  "updated_at",
+  "markets_predicted_correctly",
+  "win_streak",
+  "best_win_streak",
+  "accuracy_percentage",
+  "roi_percentage",
+  "total_points",
+]
+
+
+def settle_market_bulk(
+  market: Market,
+  outcome: OutcomeType,
+  logger: Optional[object] = None,
+  chunk_size: int = SETTLEMENT_CHUNK_SIZE,
+) -> dict:
   """
   Core settlement logic for a binary market.
 
-  - Marks the market as resolved (YES/NO)
+  - Cancels the market's resting orders and refunds their escrow (see close_market)
   - Pays out winners (1 credit per winning share)
   - Clears positions in that market
-  - Updates user stats and points via User.update_stats_after_market_resolution
+  - Updates user stats and points (User.apply_market_resolution)
+  - Marks the market as resolved (YES/NO) and charges the house the payouts
+    of its LMSR fills (see _mark_resolved)
+
+  Positions are processed in primary-key chunks. Each chunk costs a fixed
+  number of statements however many holders it has:
+  - one locked SELECT of the positions and one of their users (with profiles)
+  - payouts and stats applied in memory with the User helpers
+    (apply_credits_change / apply_market_resolution)
+  - one bulk UPDATE of the users' credit and stat columns (and one INSERT
+    each of their credit ledger and points events, plus one UPDATE of their
+    weekly / monthly points)
+  - one UPDATE zeroing the chunk's positions (and one removing them from
+    portfolio valuations)
 
   Returns a summary dict for logging / admin messages.
   """
-  from users.models import User  # Local import to avoid circulars
-
   if outcome not in ("yes", "no"):
     raise ValueError("Outcome must be 'yes' or 'no'")
 
@@ -34,58 +75,369 @@ def settle_market(market: Market, outcome: OutcomeType, logger: Optional[object]
     "outcome": outcome,
     "users_updated": 0,
     "total_payout": Decimal("0.00"),
+    "orders_cancelled": 0,
   }
 
   with transaction.atomic():
-    positions = Position.objects.select_for_update().filter(market=market)
-
-    # If no one traded, just resolve the market and exit.
-    if not positions.exists():
-      market.status = "resolved"
-      market.resolution = outcome
-      market.resolution_date = timezone.now()
-      market.save(update_fields=["status", "resolution", "resolution_date"])
-      return summary
-
-    for position in positions:
-      user: User = position.user
-
-      winning_shares = position.yes_shares if outcome == "yes" else position.no_shares
-      losing_shares = position.no_shares if outcome == "yes" else position.yes_shares
-
-      payout = winning_shares  # 1 credit per winning share
-      was_correct = winning_shares > 0
-
-      # Credit winners
-      if payout > 0:
-        from users.models import User as UserModel  # type: ignore
-
-        # Use the user's helper so decay/regen fields stay consistent
-        user.update_credits_from_trade(payout)
-        summary["total_payout"] += payout
-
-      # Update stats (win/loss, accuracy, streak, ROI, points)
-      user.update_stats_after_market_resolution(market, was_correct)
-      summary["users_updated"] += 1
-
-      # Clear the position in this market (no more open exposure after resolution)
-      position.yes_shares = Decimal("0.00")
-      position.no_shares = Decimal("0.00")
-      position.yes_avg_cost = Decimal("0.0000")
-      position.no_avg_cost = Decimal("0.0000")
-      position.save(update_fields=["yes_shares", "no_shares", "yes_avg_cost", "no_avg_cost", "updated_at"])
-
-    # Finally, mark the market as resolved
-    market.status = "resolved"
-    market.resolution = outcome
-    market.resolution_date = timezone.now()
-    market.save(update_fields=["status", "resolution", "resolution_date"])
+    _lock_unresolved(market)
+    summary["orders_cancelled"] = close_market(market, stop_trading=False)["cancelled"]
+    last_id = 0
+    while last_id is not None:
+      last_id = _settle_positions_chunk(market, outcome, last_id, chunk_size, summary)
+    _mark_resolved(market, outcome)
 
   if logger:
     logger.info(
-      f"[settle_market] Market {market.slug} resolved as {outcome}. "
+      f"[settle_market_bulk] Market {market.slug} resolved as {outcome}. "
       f"Users updated: {summary['users_updated']}, total payout: {summary['total_payout']}"
     )
 
   return summary
 
+
+def close_market(market: Market, stop_trading: bool = True) -> dict:
+  """
+  Stop trading in a market and sweep its book: every open order is cancelled
+  and its unfilled escrow refunded in a fixed number of statements
+  (trading.cancellation.cancel_open_orders), which also takes the refunds
+  back out of the market's volume/liquidity.
+
+  With stop_trading=True an open market is also marked closed. Safe to call
+  repeatedly; returns {"cancelled": <orders>, "refunded": <credits>}.
+  """
+  from trading.cancellation import cancel_open_orders
+  from trading.models import Order
+
+  with transaction.atomic():
+    if stop_trading and market.status == "open":
+      market.status = "closed"
+      Market.objects.filter(pk=market.pk, status="open").update(status="closed")
+    result = cancel_open_orders(Order.objects.filter(market_id=market.pk))
+    if result["cancelled"]:
+      market.refresh_from_db(fields=["total_volume", "total_liquidity", "book_seq"])
+    return result
+
+
+def _settle_positions_chunk(market: Market, outcome: OutcomeType, after_id: int, chunk_size: int, summary: dict):
+  """
+  Settle the next `chunk_size` positions after `after_id`, adding to `summary`.
+
+  Returns the last position id settled, or None when none were left.
+  Caller runs this inside a transaction.
+  """
+  from users.models import User  # Local import to avoid circulars
+
+  positions = list(
+    Position.objects.select_for_update()
+    .filter(market=market, pk__gt=after_id)
+    .order_by("pk")[:chunk_size]
+  )
+  if not positions:
+    return None
+
+  # Lock users in pk order so concurrent settlements sharing users can't deadlock
+  users = {
+    user.pk: user
+    for user in User.objects.select_for_update(of=("self",))
+    .select_related("profile")
+    .filter(pk__in=[position.user_id for position in positions])
+    .order_by("pk")
+  }
+  entries = []
+  point_events = []
+  for position in positions:
+    user = users[position.user_id]
+
+    winning_shares = position.yes_shares if outcome == "yes" else position.no_shares
+    payout = winning_shares  # 1 credit per winning share
+    was_correct = winning_shares > 0
+
+    if payout > 0:
+      before = user.credits
+      user.apply_credits_change(payout)
+      entries.append(balance_entry(user.pk, before, user.credits, "settlement", market_id=market.pk))
+      summary["total_payout"] += payout
+
+    points_before = user.total_points
+    user.apply_market_resolution(was_correct)
+    point_events.append(points_event(user.pk, points_before, user.total_points, "settlement", market.pk))
+    # What a full save would do to the auto_now fields
+    user.last_activity_at = user.updated_at = timezone.now()
+    summary["users_updated"] += 1
+
+  User.objects.bulk_update(users.values(), SETTLEMENT_USER_FIELDS)
+  record_credit_entries(entries)
+  record_points_events(point_events)
+  record_position_changes(market, [(position.user_id, snapshot(position), None) for position in positions])
+  Position.objects.filter(pk__in=[position.pk for position in positions]).update(
+    yes_shares=Decimal("0.00"),
+    no_shares=Decimal("0.00"),
+    yes_avg_cost=Decimal("0.0000"),
+    no_avg_cost=Decimal("0.0000"),
+    updated_at=timezone.now(),
+  )
+  return positions[-1].pk
+
+
+def _lock_unresolved(market: Market) -> None:
+  """
+  Lock the market row and reload it, so the valuation deltas and the house
+  charge use the prices and LMSR q of the last committed trade. Raises if
+  another settlement resolved it first, or if a SettlementJob owns it: the
+  job may already have settled part of its positions, so it must finish
+  them itself (enqueue_settlement takes the same lock).
+  """
+  market.refresh_from_db(from_queryset=Market.objects.select_for_update())
+  if market.status == "resolved":
+    raise ValueError(f"Market '{market.slug}' is already resolved.")
+  job = market.settlement_jobs.filter(status__in=UNFINISHED_JOB_STATUSES).order_by("id").first()
+  if job is not None:
+    raise ValueError(
+      f"Market '{market.slug}' is being settled by job #{job.pk} ({job.status}); "
+      f"let it finish or retry it from Settlement jobs."
+    )
+
+
+def _mark_resolved(market: Market, outcome: OutcomeType) -> None:
+  """Resolve the market and charge the house its LMSR payouts (see trading.amm.settle_house)."""
+  from trading.amm import settle_house
+
+  settle_house(market, outcome)
+  market.status = "resolved"
+  market.resolution = outcome
+  market.resolution_date = timezone.now()
+  market.save(update_fields=["status", "resolution", "resolution_date"])
+
+
+def enqueue_settlement(
+  market: Market,
+  outcome: OutcomeType,
+  created_by=None,
+  chunk_size: int = SETTLEMENT_CHUNK_SIZE,
+) -> SettlementJob:
+  """
+  Queue a background settlement for `manage.py run_settlement_worker`.
+
+  Trading is stopped right away (the market is closed and its book swept)
+  so no positions appear behind the job's checkpoint. Refused while the
+  market has a queued, running or failed job: a failed job has settled the
+  positions before its checkpoint, so it is retried rather than replaced.
+  """
+  if outcome not in ("yes", "no"):
+    raise ValueError("Outcome must be 'yes' or 'no'")
+
+  with transaction.atomic():
+    market = Market.objects.select_for_update().get(pk=market.pk)
+    if market.status == "resolved":
+      raise ValueError(f"Market '{market.slug}' is already resolved.")
+    if market.settlement_jobs.filter(status__in=ACTIVE_JOB_STATUSES).exists():
+      raise ValueError(f"Market '{market.slug}' already has a settlement in progress.")
+    # Its holders before the checkpoint are already settled; only that job may finish them
+    if market.settlement_jobs.filter(status="failed").exists():
+      raise ValueError(
+        f"Market '{market.slug}' has a failed settlement job. "
+        f"Retry it from Settlement jobs; it resumes from its checkpoint with its original outcome."
+      )
+
+    close_market(market)
+
+    return SettlementJob.objects.create(
+      market=market,
+      outcome=outcome,
+      chunk_size=chunk_size,
+      created_by=created_by,
+    )
+
+
+def run_settlement_step(logger: Optional[object] = None, job_id: Optional[int] = None) -> Optional[SettlementJob]:
+  """
+  Settle one chunk of the oldest active settlement job (or of job `job_id`).
+
+  The chunk and the job's checkpoint commit together, and the job row stays
+  locked meanwhile, so concurrent workers skip it and a killed worker's chunk
+  is simply rolled back and redone. The last step resolves the market.
+
+  Returns the job worked on, or None if nothing is queued.
+  """
+  job = None
+  try:
+    with transaction.atomic():
+      jobs = SettlementJob.objects.select_for_update(skip_locked=True).filter(status__in=ACTIVE_JOB_STATUSES)
+      if job_id is not None:
+        jobs = jobs.filter(pk=job_id)
+      job = jobs.order_by("id").first()
+      if job is None:
+        return None
+      market = Market.objects.select_for_update().get(pk=job.market_id)
+
+      now = timezone.now()
+      if job.status == "queued":
+        job.status = "running"
+        job.started_at = now
+        job.positions_total = Position.objects.filter(market=market, pk__gt=job.last_position_id).count()
+
+      summary = {"users_updated": 0, "total_payout": Decimal("0.00")}
+      last_id = _settle_positions_chunk(market, job.outcome, job.last_position_id, job.chunk_size, summary)
+      if last_id is None:
+        _mark_resolved(market, job.outcome)
+        job.status = "done"
+        job.finished_at = now
+      else:
+        job.last_position_id = last_id
+        job.positions_done += summary["users_updated"]
+        job.total_payout += summary["total_payout"]
+      job.save()
+  except Exception as e:
+    if job is None:
+      raise
+    SettlementJob.objects.filter(pk=job.pk).update(status="failed", error=str(e), updated_at=timezone.now())
+    if logger:
+      logger.error(f"[settlement] Job {job.pk} failed: {e}")
+    job.status = "failed"
+    job.error = str(e)
+    return job
+
+  if logger and job.status == "done":
+    logger.info(
+      f"[settlement] Market {market.slug} resolved as {job.outcome}. "
+      f"Positions settled: {job.positions_done}, total payout: {job.total_payout}"
+    )
+  return job
+
+
+def settlement_concurrency(requested: Optional[int] = None) -> int:
+  """
+  Processes to settle with: `requested` (default SETTLEMENT_MAX_CONCURRENCY)
+  capped by that setting so DB connections aren't exhausted. SQLite allows
+  one writer at a time, so it always gets 1.
+  """
+  cap = max(1, int(settings.SETTLEMENT_MAX_CONCURRENCY))
+  if connection.vendor == "sqlite":
+    return 1
+  return max(1, min(requested or cap, cap))
+
+
+def _settle_in_worker(job_id: int, slug: str, outcome: OutcomeType, in_pool: bool = True) -> dict:
+  """Run one settlement job to completion (in a pool process, or inline with in_pool=False)."""
+  import django
+  from django.apps import apps
+
+  if not apps.ready:  # spawned (not forked) pool process
+    django.setup()
+
+  started = time.monotonic()
+  result = {"market": slug, "outcome": outcome, "status": "failed", "positions": 0, "total_payout": Decimal("0.00")}
+  try:
+    while True:
+      job = run_settlement_step(job_id=job_id)
+      if job is None:
+        job = SettlementJob.objects.get(pk=job_id)
+      if job.status not in ACTIVE_JOB_STATUSES:
+        break
+    result.update(
+      status=job.status,
+      positions=job.positions_done,
+      total_payout=job.total_payout,
+      error=job.error,
+    )
+  except Exception as e:
+    result["error"] = str(e)
+  finally:
+    if in_pool:
+      connections.close_all()
+  result["seconds"] = round(time.monotonic() - started, 3)
+  return result
+
+
+def run_settlement_loop(idle_sleep: float = 2.0, once: bool = False, in_pool: bool = False) -> int:
+  """
+  Keep running settlement steps; used by run_settlement_worker.
+  Several loops can run side by side: each step skips jobs another loop holds.
+
+  Returns the number of jobs finished by this loop.
+  """
+  import logging
+
+  import django
+  from django.apps import apps
+
+  if not apps.ready:  # spawned (not forked) pool process
+    django.setup()
+
+  logger = logging.getLogger(__name__)
+  finished = 0
+  try:
+    while True:
+      job = run_settlement_step(logger=logger)
+      if job is None:
+        if once:
+          break
+        time.sleep(idle_sleep)
+      elif job.status not in ACTIVE_JOB_STATUSES:
+        finished += 1
+  finally:
+    if in_pool:
+      connections.close_all()
+  return finished
+
+
+def settle_markets_concurrently(
+  requests: list,
+  concurrency: Optional[int] = None,
+  created_by=None,
+  logger: Optional[object] = None,
+) -> dict:
+  """
+  Settle several markets at once from a list of (slug, outcome) pairs.
+
+  Markets share no positions, so each one is settled by its own process
+  (chunk by chunk, as a SettlementJob) with at most `concurrency` running
+  at a time. Markets that can't be queued are reported as failed; the rest
+  still settle.
+
+  Returns {"markets": [per-market results with timings], "settled", "failed",
+  "positions", "total_payout", "concurrency", "seconds"}.
+  """
+  started = time.monotonic()
+  workers = settlement_concurrency(concurrency)
+  results, jobs = [], []
+
+  for slug, outcome in requests:
+    try:
+      market = Market.objects.get(slug=slug)
+      job = enqueue_settlement(market, outcome, created_by=created_by)
+      jobs.append((job.pk, slug, outcome))
+    except (Market.DoesNotExist, ValueError) as e:
+      error = f"Market '{slug}' does not exist." if isinstance(e, Market.DoesNotExist) else str(e)
+      results.append({"market": slug, "outcome": outcome, "status": "failed", "error": error, "seconds": 0})
+
+  if workers == 1 or len(jobs) <= 1:
+    for job in jobs:
+      results.append(_settle_in_worker(*job, in_pool=False))
+  else:
+    # Children must open their own connections, never reuse the parent's
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+      futures = [pool.submit(_settle_in_worker, *job) for job in jobs]
+      for future in as_completed(futures):
+        results.append(future.result())
+
+  order = {slug: i for i, (slug, _) in enumerate(requests)}
+  results.sort(key=lambda result: order.get(result["market"], 0))
+  done = [result for result in results if result["status"] == "done"]
+  summary = {
+    "markets": results,
+    "settled": len(done),
+    "failed": len(results) - len(done),
+    "positions": sum(result["positions"] for result in done),
+    "total_payout": sum((result["total_payout"] for result in done), Decimal("0.00")),
+    "concurrency": workers,
+    "seconds": round(time.monotonic() - started, 3),
+  }
+
+  if logger:
+    logger.info(
+      f"[settle_markets_concurrently] Settled {summary['settled']}/{len(requests)} market(s) "
+      f"in {summary['seconds']}s with {workers} process(es). Total payout: {summary['total_payout']}"
+    )
+  return summary
@@ -1,10 +1,15 @@
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from .models import Market
+from .models import Market, price_24h_ago
 from .serializers import MarketSerializer, MarketDetailSerializer
+from trading.models import BookLevel
+from trading.participation import market_participants
+
+DEFAULT_BOOK_DEPTH = 10
+MAX_BOOK_DEPTH = 100
 
 
 class MarketViewSet(viewsets.ReadOnlyModelViewSet):
@@ -18,6 +23,10 @@ class MarketViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['-created_at']
     lookup_field = 'slug'
     
+    def get_queryset(self):
+        # price_change_24h reads the annotation instead of querying per market
+        return super().get_queryset().annotate(price_24h_ago=price_24h_ago())
+    
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return MarketDetailSerializer
@@ -39,7 +48,38 @@ class MarketViewSet(viewsets.ReadOnlyModelViewSet):
             'yes_price': market.yes_price,
             'no_price': market.no_price,
             'status': market.status,
+            'traders': market_participants(market).count(),
         })
-
-
-
+    
+    @action(detail=True, methods=['get'])
+    def book(self, request, slug=None):
+        """
+        Get the aggregated order book: size and order count per price level.
+        
+        ?depth=N limits each side to its N best levels (default 10, max 100).
+        Levels are maintained incrementally (trading.BookLevel). The ETag comes
+        from the market's book sequence, so clients polling with If-None-Match
+        get a 304 until the book actually changes.
+        """
+        market = self.get_object()
+        try:
+            depth = int(request.query_params.get('depth', DEFAULT_BOOK_DEPTH))
+        except (TypeError, ValueError):
+            depth = DEFAULT_BOOK_DEPTH
+        depth = max(1, min(depth, MAX_BOOK_DEPTH))
+        
+        etag = f'"book-{market.pk}-{market.book_seq}-{depth}"'
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        book = {'market': market.slug, 'seq': market.book_seq}
+        for side in ('yes', 'no'):
+            levels = BookLevel.objects.filter(market=market, side=side).order_by('-price').values(
+                'price', 'quantity', 'order_count'
+            )[:depth]
+            book[side] = [
+                {'price': level['price'], 'quantity': level['quantity'], 'orders': level['order_count']}
+                for level in levels
+            ]
+        return Response(book, headers={'ETag': etag})
@@ -1,13 +1,13 @@
 from django.contrib import admin
-from .models import Order, Trade, Position
+from .models import Order, Trade, Position, PortfolioValuation, UserMarket, BookLevel, MatchRequest
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'market', 'side', 'order_type', 'price', 'quantity', 'status', 'created_at']
-    list_filter = ['status', 'side', 'order_type', 'created_at']
+    list_display = ['id', 'user', 'market', 'side', 'order_type', 'time_in_force', 'price', 'quantity', 'status', 'created_at']
+    list_filter = ['status', 'side', 'order_type', 'time_in_force', 'created_at']
     search_fields = ['user__username', 'market__title']
-    readonly_fields = ['filled_quantity', 'filled_at']
+    readonly_fields = ['filled_quantity', 'on_book', 'filled_at']
 
 
 @admin.register(Trade)
@@ -25,4 +25,30 @@ class PositionAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'market__title']
 
 
+@admin.register(PortfolioValuation)
+class PortfolioValuationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'cost_basis', 'market_value', 'unrealized_pnl', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'cost_basis', 'market_value', 'unrealized_pnl', 'updated_at']
 
+
+@admin.register(UserMarket)
+class UserMarketAdmin(admin.ModelAdmin):
+    list_display = ['user', 'market', 'order_count', 'volume', 'first_order_at', 'last_order_at']
+    search_fields = ['user__username', 'market__title']
+    readonly_fields = ['user', 'market', 'order_count', 'volume', 'first_order_at', 'last_order_at']
+
+
+@admin.register(BookLevel)
+class BookLevelAdmin(admin.ModelAdmin):
+    list_display = ['market', 'side', 'price', 'quantity', 'order_count']
+    list_filter = ['side']
+    search_fields = ['market__title']
+
+
+@admin.register(MatchRequest)
+class MatchRequestAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'market', 'status', 'trades_created', 'attempts', 'created_at', 'processed_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['market__title', 'order__user__username']
+    readonly_fields = ['order', 'market', 'trades_created', 'attempts', 'error', 'created_at', 'processed_at']
@@ -0,0 +1,229 @@
+"""
+LMSR Automated Market Maker
+
+Markets with pricing_mode = 'lmsr' don't match users against each other.
+Every order is filled immediately by the house account using Hanson's
+logarithmic market scoring rule:
+
+    C(q_yes, q_no) = b * ln(e^(q_yes/b) + e^(q_no/b))
+    yes_price      = e^(q_yes/b) / (e^(q_yes/b) + e^(q_no/b))
+
+q_yes / q_no are the shares the house has sold on each side and b is the
+market's liquidity parameter (larger b = deeper market; the house can lose
+at most b * ln 2). Buying x shares costs C(after) - C(before).
+
+The house is credited each fill's cost as it happens, and when the market
+resolves it is charged the winning side's q, the payout its buyers receive
+(settle_house).
+
+Everything here is closed form, so a quote is a handful of float operations:
+- the most shares a limit order can buy is where the marginal price reaches
+  the limit: x = b * ln(P / (1 - P)) - (q_side - q_other)
+- their cost is b * ln(1 - p + p * e^(x/b)) for current price p, evaluated
+  in log space so large q / b never overflow
+
+Orders never rest in LMSR markets: whatever the house won't sell at or below
+the limit price is refunded, along with any price improvement.
+"""
+import math
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from users.ledger import credit_entry, record_credit_entries
+from users.models import CreditSnapshot, round_credits
+
+from .matching import apply_order_fill, record_price_bucket, refund_escrow, update_position
+from .models import Trade
+from .valuation import revalue_market
+
+SHARE_STEP = Decimal('0.01')
+PRICE_STEP = Decimal('0.0001')
+
+
+def _logaddexp(x, y):
+    """ln(e^x + e^y) without overflow."""
+    high, low = (x, y) if x >= y else (y, x)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _softplus(x):
+    """ln(1 + e^x) without overflow."""
+    return _logaddexp(0.0, x)
+
+
+def lmsr_cost(q_yes, q_no, b):
+    """The cost function C(q_yes, q_no)."""
+    b = float(b)
+    return b * _logaddexp(float(q_yes) / b, float(q_no) / b)
+
+
+def lmsr_price(q_yes, q_no, b, side='yes'):
+    """Marginal price of one more share of `side`."""
+    spread = (float(q_no) - float(q_yes)) / float(b)
+    if side == 'no':
+        spread = -spread
+    return math.exp(-_softplus(spread))
+
+
+def lmsr_buy_cost(q_side, q_other, b, quantity):
+    """Cost of buying `quantity` shares of one side given both sides' q."""
+    b = float(b)
+    z = (float(q_side) - float(q_other)) / b
+    log_price = -_softplus(-z)
+    log_other_price = -_softplus(z)
+    return b * _logaddexp(log_other_price, log_price + float(quantity) / b)
+
+
+def lmsr_max_shares(q_side, q_other, b, limit_price):
+    """Most shares of one side buyable before the marginal price passes `limit_price`."""
+    limit_price = float(limit_price)
+    if limit_price <= 0:
+        return 0.0
+    if limit_price >= 1:
+        return math.inf
+    b = float(b)
+    return max(0.0, b * math.log(limit_price / (1 - limit_price)) - (float(q_side) - float(q_other)))
+
+
+def quote_order(market, side, limit_price, quantity):
+    """
+    What the house would fill for a buy of `quantity` `side` shares limited
+    at `limit_price`: (shares, cost). Shares are whole cents of a share and
+    the cost is rounded up to the cent but never above shares * limit_price.
+    """
+    if side == 'yes':
+        q_side, q_other = market.lmsr_q_yes, market.lmsr_q_no
+    else:
+        q_side, q_other = market.lmsr_q_no, market.lmsr_q_yes
+
+    shares = lmsr_max_shares(q_side, q_other, market.lmsr_b, limit_price)
+    if shares < quantity:
+        quantity = Decimal(str(shares)).quantize(SHARE_STEP, rounding=ROUND_DOWN)
+    if quantity <= 0:
+        return Decimal('0.00'), Decimal('0.00')
+
+    cost = Decimal(str(lmsr_buy_cost(q_side, q_other, market.lmsr_b, quantity)))
+    cost = min(cost.quantize(Decimal('0.01'), rounding=ROUND_UP), limit_price * quantity)
+    return quantity, cost
+
+
+def get_house_user():
+    """The account on the other side of every AMM fill (created on first use)."""
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+
+    house, created = User.objects.get_or_create(
+        username=settings.AMM_HOUSE_USERNAME,
+        defaults={'email': '', 'credits': Decimal('0.00'), 'base_credits': Decimal('0.00')},
+    )
+    if created:
+        house.set_unusable_password()
+        house.save(update_fields=['password'])
+        # Ledger replays start from the default opening balance otherwise
+        CreditSnapshot.objects.create(user=house, balance=house.credits)
+    return house
+
+
+def fill_against_amm(market, order):
+    """
+    Fill an order from the house market maker (called by match_orders with
+    the market row locked).
+
+    The order buys as many shares as the LMSR sells at or below its limit
+    price (FOK: all or nothing). The user paid limit * quantity into escrow
+    at placement, so the unfilled part and the difference between the limit
+    and the actual LMSR cost are refunded. The house is credited the cost.
+
+    Returns: List of created Trade objects (at most one)
+    """
+    now = timezone.now()
+    remaining = order.quantity - order.filled_quantity
+    quantity, cost = quote_order(market, order.side, order.price, remaining)
+    if order.time_in_force == 'fok' and quantity < remaining:
+        quantity, cost = Decimal('0.00'), Decimal('0.00')
+
+    trades = []
+    if quantity > 0:
+        house = get_house_user()
+        average_price = (cost / quantity).quantize(PRICE_STEP)
+        trades.append(Trade.objects.create(
+            market=market,
+            buy_order=order,
+            sell_order=None,
+            buyer_id=order.user_id,
+            seller=house,
+            side=order.side,
+            price=average_price,
+            quantity=quantity,
+            total_value=cost,
+            executed_at=now,
+        ))
+        update_position(order.user, market, order.side, quantity, average_price, is_buy=True)
+        house_credit = round_credits(cost)
+        house.__class__.objects.filter(pk=house.pk).update(
+            credits=F('credits') + house_credit,
+            base_credits=F('credits') + house_credit,
+        )
+        record_credit_entries([
+            credit_entry(house.pk, house_credit, 'amm_fill', now=now, trade_id=trades[0].pk, market_id=market.pk)
+        ])
+        apply_order_fill(order, quantity, now)
+
+        old_yes_price = market.yes_price
+        if order.side == 'yes':
+            market.lmsr_q_yes += quantity
+        else:
+            market.lmsr_q_no += quantity
+        market.yes_price = Decimal(str(lmsr_price(market.lmsr_q_yes, market.lmsr_q_no, market.lmsr_b))).quantize(
+            PRICE_STEP, rounding=ROUND_DOWN
+        )
+        market.no_price = Decimal('1.0000') - market.yes_price
+        market.last_trade_price = average_price if order.side == 'yes' else Decimal('1') - average_price
+        market.last_trade_at = now
+        # LMSR prices don't come from the VWAP; the bucket only tracks the price
+        record_price_bucket(market, old_yes_price, [Decimal('0')] * 4, now)
+        market.save(update_fields=[
+            'lmsr_q_yes', 'lmsr_q_no', 'yes_price', 'no_price', 'last_trade_price', 'last_trade_at',
+        ])
+        revalue_market(market, old_yes_price, market.yes_price)
+
+    # Nothing rests in an LMSR market
+    if order.filled_quantity < order.quantity:
+        order.status = 'cancelled'
+    order.on_book = False
+    order.updated_at = now
+    order.save(update_fields=['filled_quantity', 'status', 'on_book', 'filled_at', 'updated_at'])
+
+    # The whole escrow leaves reserved credits: `cost` was spent, the rest comes back
+    escrow = order.price * remaining
+    refund_escrow(market, order.user_id, escrow - cost, order_id=order.pk, release=escrow)
+    return trades
+
+
+def settle_house(market, outcome, now=None):
+    """
+    Pay out the house's side of a resolved LMSR market (called by settlement
+    with the market row locked).
+
+    lmsr_q_yes / lmsr_q_no are the shares the house sold on each side, so
+    the winning side's q is what it owes: the holders are paid one credit
+    per winning share out of the settlement, and the house is debited the
+    same. Returns the amount charged.
+    """
+    liability = market.lmsr_q_yes if outcome == 'yes' else market.lmsr_q_no
+    if market.pricing_mode != 'lmsr' or liability <= 0:
+        return Decimal('0.00')
+
+    house = get_house_user()
+    house_debit = round_credits(liability)
+    house.__class__.objects.filter(pk=house.pk).update(
+        credits=F('credits') - house_debit,
+        base_credits=F('credits') - house_debit,
+    )
+    record_credit_entries([
+        credit_entry(house.pk, -house_debit, 'settlement', now=now, market_id=market.pk)
+    ])
+    return house_debit
@@ -0,0 +1,137 @@
+"""
+Bulk Order Cancellation
+
+Cancels any number of open orders with a fixed number of statements:
+1. Lock the affected markets (same lock order as matching), then the orders
+2. One aggregate groups the unfilled size by user, market and price level
+3. One UPDATE marks the orders cancelled
+4. One UPDATE refunds every user and unlocks their reserved credits (plus
+   one INSERT of their credit ledger entries) and one UPDATE adjusts every market's volume/liquidity
+5. Book levels and cached books are adjusted per market
+
+Used by the single and cancel-all order endpoints.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from users.escrow import RESERVED_FIELD
+from users.ledger import credit_entry, record_credit_entries
+from users.models import round_credits
+from users.stats import invalidate_user_stats
+
+from .models import Order
+from .orderbook import OPEN_STATUSES, apply_level_changes, remove_from_order_book
+
+ZERO = Decimal('0.00')
+CREDITS_FIELD = DecimalField(max_digits=20, decimal_places=2)
+
+
+def _amount_case(amounts, output_field=CREDITS_FIELD):
+    """CASE pk WHEN ... THEN amount END for a {pk: Decimal} dict."""
+    return Case(
+        *[When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()],
+        default=Value(ZERO),
+        output_field=output_field,
+    )
+
+
+def cancel_open_orders(orders):
+    """
+    Cancel the open orders in the `orders` queryset and refund their unfilled
+    escrow (unfilled quantity * limit price) from reserved to available credits.
+
+    Returns {'cancelled': <number of orders>, 'refunded': <total credits>}.
+    """
+    from django.contrib.auth import get_user_model
+    from markets.models import Market
+
+    User = get_user_model()
+    orders = orders.filter(status__in=OPEN_STATUSES)
+
+    with transaction.atomic():
+        market_ids = sorted(set(orders.values_list('market_id', flat=True)))
+        if not market_ids:
+            return {'cancelled': 0, 'refunded': ZERO}
+
+        markets = list(Market.objects.select_for_update().filter(pk__in=market_ids).order_by('pk'))
+
+        order_ids = defaultdict(list)
+        holder_orders = defaultdict(list)
+        for order_id, market_id, user_id in orders.filter(market_id__in=market_ids).select_for_update().values_list(
+            'id', 'market_id', 'user_id'
+        ):
+            order_ids[market_id].append(order_id)
+            holder_orders[(user_id, market_id)].append(order_id)
+        all_ids = [order_id for ids in order_ids.values() for order_id in ids]
+        if not all_ids:
+            return {'cancelled': 0, 'refunded': ZERO}
+
+        groups = Order.objects.filter(pk__in=all_ids).values(
+            'user_id', 'market_id', 'side', 'price', 'on_book'
+        ).annotate(
+            unfilled=Sum(F('quantity') - F('filled_quantity')),
+            orders=Count('id'),
+        )
+
+        holder_refunds = defaultdict(Decimal)
+        level_changes = defaultdict(lambda: defaultdict(lambda: [ZERO, 0]))
+        for group in groups:
+            unfilled = Decimal(str(group['unfilled']))
+            if unfilled <= 0:
+                continue
+            holder_refunds[(group['user_id'], group['market_id'])] += unfilled * group['price']
+            if group['on_book']:
+                level = level_changes[group['market_id']][(group['side'], group['price'])]
+                level[0] -= unfilled
+                level[1] -= group['orders']
+
+        now = timezone.now()
+        Order.objects.filter(pk__in=all_ids).update(status='cancelled', on_book=False, updated_at=now)
+
+        # Refunds are rounded per user and market, so each ledger entry is exactly what was credited
+        user_refunds = defaultdict(Decimal)
+        user_releases = defaultdict(Decimal)
+        market_refunds = defaultdict(Decimal)
+        entries = []
+        for (user_id, market_id), amount in holder_refunds.items():
+            user_releases[user_id] += amount
+            amount = round_credits(amount)
+            if not amount:
+                continue
+            user_refunds[user_id] += amount
+            market_refunds[market_id] += amount
+            holder_order_ids = holder_orders[(user_id, market_id)]
+            entries.append(credit_entry(
+                user_id, amount, 'order_refund', now=now,
+                market_id=market_id, order_id=holder_order_ids[0] if len(holder_order_ids) == 1 else None,
+            ))
+        if user_releases:
+            refund = _amount_case(user_refunds)
+            User.objects.filter(pk__in=list(user_releases)).update(
+                credits=F('credits') + refund,
+                base_credits=F('credits') + refund,
+                reserved_credits=F('reserved_credits') - _amount_case(user_releases, RESERVED_FIELD),
+                last_activity_at=now,
+                updated_at=now,
+            )
+            record_credit_entries(entries)
+            invalidate_user_stats(user_releases)
+        if market_refunds:
+            refund = _amount_case(market_refunds)
+            Market.objects.filter(pk__in=list(market_refunds)).update(
+                total_volume=Greatest(F('total_volume') - refund, Value(ZERO)),
+                total_liquidity=Greatest(F('total_liquidity') - refund, Value(ZERO)),
+            )
+
+        for market in markets:
+            if market.pk not in order_ids:
+                continue
+            apply_level_changes(market.pk, level_changes[market.pk])
+            remove_from_order_book(market, order_ids[market.pk])
+
+    return {'cancelled': len(all_ids), 'refunded': sum(user_refunds.values(), ZERO)}
@@ -0,0 +1,212 @@
+"""
+Benchmark order placement and matching.
+
+Pushes synthetic order streams through OrderViewSet (perform_create +
+match_orders) on whatever database is configured, so the same run works on
+local SQLite and on Postgres via DATABASE_URL:
+
+    python manage.py bench_matching --orders 1000 --output bench.json
+
+Streams:
+- uniform: random markets, sides and prices across the whole range
+- skewed:  prices clustered around 0.50, so most orders cross
+- bursty:  one market, runs of same-side orders followed by runs that sweep them
+
+Reports orders/sec, p50/p99 latency and queries per order per stream as JSON.
+All synthetic users, markets and orders are rolled back unless --keep is given.
+"""
+import json
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from markets.models import Market
+from trading.models import Trade
+from trading.orderbook import invalidate_order_book
+from trading.views import OrderViewSet
+
+STREAMS = ['uniform', 'skewed', 'bursty']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def price(value):
+    return Decimal(str(min(0.99, max(0.01, round(value, 2)))))
+
+
+def uniform_stream(rng, count, markets):
+    for _ in range(count):
+        yield rng.choice(markets), rng.choice(['yes', 'no']), price(rng.uniform(0.01, 0.99)), rng.randint(1, 20)
+
+
+def skewed_stream(rng, count, markets):
+    for _ in range(count):
+        yield rng.choice(markets), rng.choice(['yes', 'no']), price(rng.gauss(0.5, 0.04)), rng.randint(1, 20)
+
+
+def bursty_stream(rng, count, markets):
+    market = markets[0]
+    side = 'no'
+    while count > 0:
+        burst = min(count, rng.randint(10, 50))
+        for _ in range(burst):
+            if side == 'no':
+                yield market, 'no', price(rng.uniform(0.30, 0.50)), rng.randint(1, 10)
+            else:
+                yield market, 'yes', price(rng.uniform(0.55, 0.75)), rng.randint(5, 40)
+        count -= burst
+        side = 'yes' if side == 'no' else 'no'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order placement and matching with synthetic order streams.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500, help='Orders per stream (default 500).')
+        parser.add_argument(
+            '--streams',
+            default=','.join(STREAMS),
+            help=f'Comma-separated streams to run (default {",".join(STREAMS)}).',
+        )
+        parser.add_argument('--users', type=int, default=20, help='Synthetic traders (default 20).')
+        parser.add_argument('--markets', type=int, default=5, help='Markets per stream (default 5).')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed (default 1).')
+        parser.add_argument(
+            '--matching',
+            choices=['sync', 'async'],
+            default='sync',
+            help='ORDER_MATCHING_MODE to benchmark (default sync; async measures placement only).',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file as well as stdout.')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic data instead of rolling it back.')
+
+    def handle(self, *args, **options):
+        streams = [name.strip() for name in options['streams'].split(',') if name.strip()]
+        unknown = set(streams) - set(STREAMS)
+        if unknown:
+            raise CommandError(f'Unknown stream(s): {", ".join(sorted(unknown))}')
+        if options['orders'] < 1 or options['users'] < 2 or options['markets'] < 1:
+            raise CommandError('Need at least 1 order, 2 users and 1 market.')
+
+        report = {
+            'database': connection.vendor,
+            'matching': options['matching'],
+            'orders_per_stream': options['orders'],
+            'users': options['users'],
+            'markets': options['markets'],
+            'seed': options['seed'],
+            'run_at': timezone.now().isoformat(),
+            'streams': {},
+        }
+        with override_settings(ORDER_MATCHING_MODE=options['matching']):
+            for name in streams:
+                report['streams'][name] = self.run_stream(name, options)
+                summary = report['streams'][name]
+                self.stderr.write(
+                    f"{name}: {summary['orders_per_sec']} orders/s, "
+                    f"p50 {summary['latency_ms']['p50']} ms, p99 {summary['latency_ms']['p99']} ms, "
+                    f"{summary['queries_per_order']['mean']} queries/order"
+                )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def run_stream(self, name, options):
+        rng = random.Random(f"{options['seed']}-{name}")
+        stream = {'uniform': uniform_stream, 'skewed': skewed_stream, 'bursty': bursty_stream}[name]
+        factory = APIRequestFactory()
+        view = OrderViewSet.as_view({'post': 'create'})
+        market_ids = []
+
+        try:
+            with transaction.atomic():
+                users, markets = self.create_fixtures(name, options)
+                market_ids = [market.pk for market in markets]
+                latencies, queries, errors = [], [], 0
+
+                started = time.perf_counter()
+                for market, side, limit, quantity in stream(rng, options['orders'], markets):
+                    request = factory.post('/api/trading/orders/', {
+                        'market': market.pk,
+                        'side': side,
+                        'price': str(limit),
+                        'quantity': str(quantity),
+                    }, format='json')
+                    force_authenticate(request, user=rng.choice(users))
+                    # The query log is capped, so keep it short for exact counts
+                    connection.queries_log.clear()
+                    with CaptureQueriesContext(connection) as captured:
+                        order_started = time.perf_counter()
+                        response = view(request)
+                        latencies.append((time.perf_counter() - order_started) * 1000)
+                    queries.append(len(captured.captured_queries))
+                    if response.status_code != 201:
+                        errors += 1
+                elapsed = time.perf_counter() - started
+                trades = Trade.objects.filter(market_id__in=market_ids).count()
+
+                if not options['keep']:
+                    transaction.set_rollback(True)
+        finally:
+            # Rolled-back book_seq values would let cached books look current
+            for market_id in market_ids:
+                invalidate_order_book(market_id)
+
+        return {
+            'orders': len(latencies),
+            'errors': errors,
+            'trades': trades,
+            'seconds': round(elapsed, 3),
+            'orders_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'max': round(max(latencies), 3),
+            },
+            'queries_per_order': {
+                'mean': round(sum(queries) / len(queries), 2),
+                'p50': percentile(queries, 50),
+                'max': max(queries),
+            },
+        }
+
+    def create_fixtures(self, name, options):
+        User = get_user_model()
+        tag = f'bench-{name}-{int(time.time())}'
+        users = []
+        for i in range(options['users']):
+            user = User(username=f'{tag}-u{i}', credits=Decimal('1000000.00'), base_credits=Decimal('1000000.00'))
+            user.set_unusable_password()
+            users.append(user)
+        users = User.objects.bulk_create(users)
+
+        end_date = timezone.now() + timedelta(days=7)
+        markets = Market.objects.bulk_create([
+            Market(
+                title=f'{tag} market {i}',
+                description='Benchmark market',
+                slug=f'{tag}-m{i}',
+                question='Benchmark?',
+                end_date=end_date,
+            )
+            for i in range(options['markets'])
+        ])
+        return users, markets
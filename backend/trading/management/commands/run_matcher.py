@@ -0,0 +1,57 @@
+"""
+Run the order matching sequencer for one shard of markets.
+
+Only needed when ORDER_MATCHING_MODE=async. Start one process per shard:
+
+    python manage.py run_matcher --shard 0 --shards 4
+    python manage.py run_matcher --shard 1 --shards 4
+    ...
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trading.sequencer import process_queue, prune_match_requests
+
+PRUNE_EVERY_SECONDS = 60
+
+
+class Command(BaseCommand):
+    help = 'Drain queued orders for one market shard and match them in arrival order.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', type=int, default=0, help='Shard this worker owns (default 0).')
+        parser.add_argument('--shards', type=int, default=1, help='Total number of shards (default 1).')
+        parser.add_argument('--batch-size', type=int, default=100, help='Requests per queue read (default 100).')
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=0.25,
+            help='Seconds to wait when the queue is empty (default 0.25).',
+        )
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+
+    def handle(self, *args, **options):
+        shard = options['shard']
+        shards = options['shards']
+        if shards < 1 or not 0 <= shard < shards:
+            raise CommandError('--shard must be between 0 and --shards - 1.')
+
+        self.stdout.write(self.style.SUCCESS(f'Matcher started for shard {shard}/{shards}.'))
+        total = 0
+        last_prune = 0
+        try:
+            while True:
+                processed = process_queue(shard=shard, shards=shards, batch_size=options['batch_size'])
+                total += processed
+                if time.monotonic() - last_prune >= PRUNE_EVERY_SECONDS:
+                    prune_match_requests(shard=shard, shards=shards)
+                    last_prune = time.monotonic()
+                if options['once'] and processed < options['batch_size']:
+                    break
+                if not processed:
+                    time.sleep(options['idle_sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Matcher stopped. Processed {total} request(s).'))
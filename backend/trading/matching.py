@@ -8,11 +8,30 @@ This module implements a robust order matching system that:
 4. Updates positions and credits accurately
 5. Maintains price consistency (yes_price + no_price = 1.00)
 """
+from collections import defaultdict
 from django.db import transaction
+from django.db.models import F, Q, Sum
 from django.utils import timezone
 from decimal import Decimal, ROUND_DOWN
 from .models import Order, Trade, Position
-from markets.models import Market
+from .orderbook import (
+    MAX_TICK,
+    OPEN_STATUSES,
+    OrderBook,
+    advance_book_seq,
+    apply_level_changes,
+    books_are_cached,
+    get_order_book,
+    invalidate_order_book,
+    price_to_ticks,
+    rebuild_order_book,
+    ticks_to_price,
+)
+from .valuation import record_position_changes, revalue_market, snapshot
+from markets.models import Market, MarketPriceBucket, PRICE_BUCKET_SPAN, price_bucket_start
+from users.escrow import release_reserved_credits
+from users.ledger import credit_entry, record_credit_entries
+from users.models import round_credits
 
 
 def match_orders(new_order):
@@ -23,108 +42,424 @@ def match_orders(new_order):
     - User A buys YES at 60¢, User B buys NO at 40¢ → complementary (60+40=100¢)
     - Both pay; A gets YES shares, B gets NO shares.
     
+    Resting orders come from the market's in-memory OrderBook in async mode
+    (see orderbook.py), or in sync mode from the orders table a batch at a
+    time (_load_fills); either way only the orders actually filled are
+    visited. The market row is locked for the whole match, which serializes matching
+    per market and keeps the cached book consistent. The order is re-read
+    under that lock; if it was cancelled or swept meanwhile, or the market
+    is no longer open, nothing is matched.
+    
+    Time in force: GTC remainders rest on the book. IOC (and market) orders
+    refund their unfilled part in this same transaction; FOK orders either
+    fill completely or are cancelled and refunded in full.
+    
+    Limit orders pay their own price on every fill. Market orders sweep the
+    opposite side best price first and pay each level's price (see
+    _opposite_levels); the escrow they held at their cap beyond that is
+    refunded here too.
+    
+    Markets in LMSR pricing mode skip the book entirely and fill against the
+    house market maker (see amm.py).
+    
     Returns: List of created Trade objects
     """
     with transaction.atomic():
-        trades = []
-        remaining_quantity = new_order.quantity
+        market = Market.objects.select_for_update().get(pk=new_order.market_id)
+        # The caller's copy may predate a cancel / sweep: re-check the order under the lock
+        current = Order.objects.select_for_update().filter(pk=new_order.pk).values(
+            'status', 'filled_quantity', 'on_book'
+        ).first()
+        if current is None or current['status'] not in OPEN_STATUSES or market.status != 'open':
+            return []
+        new_order.status = current['status']
+        new_order.filled_quantity = Decimal(str(current['filled_quantity']))
+        new_order.on_book = current['on_book']
         
-        # Opposite-side matching: Buy YES at P ↔ Buy NO at (1-P)
-        if new_order.side == 'yes':
-            # Buying YES at P - match with Buy NO at (1-P)
-            # Their NO price must be <= (1 - our YES price) for compatibility
-            our_yes_price = new_order.price
-            compatible_no_price = Decimal('1') - our_yes_price
-            matching_orders = Order.objects.filter(
-                market=new_order.market,
-                side='no',
-                status__in=['pending', 'partial'],
-                price__lte=compatible_no_price
-            ).exclude(user=new_order.user).order_by('price', 'created_at')
-        else:
-            # Buying NO at P - match with Buy YES at (1-P)
-            our_no_price = new_order.price
-            compatible_yes_price = Decimal('1') - our_no_price
-            matching_orders = Order.objects.filter(
-                market=new_order.market,
-                side='yes',
-                status__in=['pending', 'partial'],
-                price__lte=compatible_yes_price
-            ).exclude(user=new_order.user).order_by('price', 'created_at')
+        if market.pricing_mode == 'lmsr':
+            from .amm import fill_against_amm
+            return fill_against_amm(market, new_order)
+        try:
+            if books_are_cached():
+                book = get_order_book(market)
+                # A freshly rebuilt book may already contain the new order itself
+                book.remove(new_order.id)
+                book, fills, resting_orders = _collect_fills(book, market, new_order)
+            else:
+                book, fills, resting_orders = _load_fills(market, new_order)
         
-        for matching_order in matching_orders:
-            if remaining_quantity <= 0:
-                break
+            now = timezone.now()
+            executions = []
+            level_changes = defaultdict(lambda: [Decimal('0.00'), 0])
+            remaining_quantity = new_order.quantity - new_order.filled_quantity
+            # Market orders escrowed their cap: what their fills cost less is refunded
+            price_improvement = Decimal('0.00')
             
-            available_quantity = matching_order.quantity - matching_order.filled_quantity
-            fill_quantity = min(remaining_quantity, available_quantity)
+            # Re-matching an order that was already resting (e.g. seed data): take it off first
+            if new_order.on_book:
+                level_changes[(new_order.side, new_order.price)][0] -= remaining_quantity
+                level_changes[(new_order.side, new_order.price)][1] -= 1
+                new_order.on_book = False
             
-            if fill_quantity <= 0:
-                continue
+            # Fill-or-kill: the whole order now, or nothing
+            if new_order.time_in_force == 'fok' and sum(fill for _, fill in fills) < remaining_quantity:
+                fills = []
             
-            # Assign yes/no orders and prices (yes_price + no_price = 1.00)
-            if new_order.side == 'yes':
-                yes_order = new_order
-                no_order = matching_order
-                yes_price = new_order.price
-                no_price = matching_order.price
-            else:
-                yes_order = matching_order
-                no_order = new_order
-                yes_price = matching_order.price
-                no_price = new_order.price
+            for entry, fill_quantity in fills:
+                matching_order = resting_orders[entry.order_id]
+                matching_order.market = market
+                
+                # Assign yes/no orders and prices (yes_price + no_price = 1.00)
+                fill_price = _fill_price(new_order, matching_order)
+                price_improvement += (new_order.price - fill_price) * fill_quantity
+                if new_order.side == 'yes':
+                    yes_order = new_order
+                    no_order = matching_order
+                    yes_price = fill_price
+                    no_price = matching_order.price
+                else:
+                    yes_order = matching_order
+                    no_order = new_order
+                    yes_price = matching_order.price
+                    no_price = fill_price
+                
+                executions.append(build_trade_complementary(
+                    yes_order=yes_order,
+                    no_order=no_order,
+                    yes_price=yes_price,
+                    no_price=no_price,
+                    quantity=fill_quantity,
+                    executed_at=now,
+                ))
+                
+                apply_order_fill(new_order, fill_quantity, now)
+                apply_order_fill(matching_order, fill_quantity, now)
+                book.reduce(entry.order_id, fill_quantity)
+                remaining_quantity -= fill_quantity
+                
+                level = level_changes[(matching_order.side, matching_order.price)]
+                level[0] -= fill_quantity
+                if not matching_order.on_book:
+                    level[1] -= 1
+            
+            if remaining_quantity > 0 and new_order.rests_on_book:
+                new_order.on_book = True
+                level_changes[(new_order.side, new_order.price)][0] += remaining_quantity
+                level_changes[(new_order.side, new_order.price)][1] += 1
+            elif remaining_quantity > 0:
+                # IOC / FOK / market orders never rest: cancel what's left
+                new_order.status = 'cancelled'
+                new_order.updated_at = now
             
-            trade = create_trade_complementary(
-                yes_order=yes_order,
-                no_order=no_order,
-                yes_price=yes_price,
-                no_price=no_price,
-                quantity=fill_quantity
+            trades = persist_fills(
+                market,
+                executions,
+                [new_order] + [resting_orders[entry.order_id] for entry, _ in fills],
             )
-            trades.append(trade)
             
-            update_order_after_trade(new_order, fill_quantity)
-            update_order_after_trade(matching_order, fill_quantity)
-            remaining_quantity -= fill_quantity
+            if not executions:
+                new_order.save(update_fields=['status', 'on_book', 'updated_at'])
+            if price_improvement > 0:
+                refund_escrow(market, new_order.user_id, price_improvement, order_id=new_order.pk)
+            if new_order.status == 'cancelled':
+                refund_unfilled(market, new_order, remaining_quantity)
+            elif new_order.on_book:
+                book.add(new_order.id, new_order.user_id, new_order.side, new_order.price, remaining_quantity)
+            apply_level_changes(market.pk, level_changes)
+            advance_book_seq(market, book)
+        except Exception:
+            # The cached book may be half-updated; make the next match rebuild it
+            invalidate_order_book(market.pk)
+            raise
         
         if trades:
-            update_market_price(new_order.market, trades)
+            update_market_price(market, trades)
         
         return trades
 
 
-def create_trade_complementary(yes_order, no_order, yes_price, no_price, quantity):
+def _opposite_levels(new_order):
+    """
+    (side, max_ticks, min_ticks) of the resting orders `new_order` can fill
+    against, walked lowest price first up to max_ticks, or highest first down
+    to min_ticks when min_ticks is set.
+
+    Limit orders take opposite orders priced at or below the complement of
+    their own price. Market orders sweep the opposite side as asks instead:
+    a resting order at q sells the order's side at 1 - q, so they take those
+    at or above 1 - cap, best price (highest q) first.
+    """
+    opposite_side = 'no' if new_order.side == 'yes' else 'yes'
+    complement = MAX_TICK - price_to_ticks(new_order.price)
+    if new_order.order_type == 'market':
+        return opposite_side, MAX_TICK, complement
+    return opposite_side, complement, None
+
+
+def _fill_price(new_order, matching_order):
+    """
+    What `new_order` pays per share filled against `matching_order`: its own
+    price for a limit order, the level's price (the complement of the
+    resting order's) for a market order, never above its cap.
+    """
+    if new_order.order_type == 'market':
+        return min(Decimal('1.0000') - matching_order.price, new_order.price)
+    return new_order.price
+
+
+def _collect_fills(book, market, new_order):
+    """
+    Pick the resting orders the new order fills and load them from the DB.
+    
+    Opposite-side matching: Buy YES at P ↔ Buy NO at (1-P), so only levels
+    priced at or below the complementary price are walked. The DB rows are
+    locked and checked against the book; if they disagree the book was
+    changed behind our back, so it is rebuilt and walked again.
+    
+    Returns: (book, [(RestingOrder, fill_quantity), ...], {order_id: Order})
+    """
+    opposite_side, max_ticks, min_ticks = _opposite_levels(new_order)
+    quantity = new_order.quantity - new_order.filled_quantity
+    rebuilt = False
+    
+    while True:
+        fills = book.collect_fills(
+            opposite_side, max_ticks, quantity, exclude_user_id=new_order.user_id, min_ticks=min_ticks
+        )
+        if not fills:
+            return book, [], {}
+        resting_orders = Order.objects.select_for_update().select_related('user').in_bulk(
+            [entry.order_id for entry, _ in fills]
+        )
+        if rebuilt or all(
+            _book_entry_is_current(entry, fill, resting_orders.get(entry.order_id))
+            for entry, fill in fills
+        ):
+            return book, fills, resting_orders
+        # Rows are locked now, so a rebuild inside this transaction is exact
+        book = rebuild_order_book(market)
+        book.remove(new_order.id)
+        rebuilt = True
+
+
+FILL_BATCH_SIZE = 50  # Resting orders fetched per query by _load_fills
+
+
+def _load_fills(market, new_order):
+    """
+    Sync-mode _collect_fills: lock the resting orders the new order fills,
+    straight from the orders table.
+
+    The opposite side's on-book orders are walked in book priority (price,
+    best first for the order as in _opposite_levels, then time) through the
+    partial book index, FILL_BATCH_SIZE rows per
+    query, and the walk stops as soon as the order's quantity is covered,
+    so a deep book costs no more than the levels actually swept. The market
+    row lock keeps the rows from moving underneath. The returned book only
+    holds the fetched orders.
+
+    Returns: (book, [(RestingOrder, fill_quantity), ...], {order_id: Order})
+    """
+    opposite_side, max_ticks, min_ticks = _opposite_levels(new_order)
+    # Walking down from the top for market orders, up from the bottom otherwise
+    past = 'lt' if min_ticks is not None else 'gt'
+    remaining = new_order.quantity - new_order.filled_quantity
+    book = OrderBook(market.pk, seq=market.book_seq)
+    fills, resting_orders = [], {}
+    crossing = Order.objects.select_for_update().select_related('user').filter(
+        market_id=market.pk,
+        side=opposite_side,
+        on_book=True,
+        status__in=OPEN_STATUSES,
+        price__lte=ticks_to_price(max_ticks),
+    ).exclude(user_id=new_order.user_id)
+    if min_ticks is not None:
+        crossing = crossing.filter(price__gte=ticks_to_price(min_ticks))
+    crossing = crossing.order_by('-price' if min_ticks is not None else 'price', 'created_at', 'id')
+
+    last = None
+    while remaining > 0:
+        batch = crossing
+        if last is not None:
+            # Keyset past the previous batch; the price bound lets it seek the index
+            batch = batch.filter(
+                Q(**{f'price__{past}': last.price})
+                | Q(price=last.price, created_at__gt=last.created_at)
+                | Q(price=last.price, created_at=last.created_at, id__gt=last.id),
+                **{f'price__{past}e': last.price},
+            )
+        batch = list(batch[:FILL_BATCH_SIZE])
+        for order in batch:
+            resting = order.quantity - order.filled_quantity
+            fill = min(remaining, resting)
+            if fill <= 0:
+                continue
+            entry = book.add(order.id, order.user_id, order.side, order.price, resting)
+            fills.append((entry, fill))
+            resting_orders[order.id] = order
+            remaining -= fill
+            if remaining <= 0:
+                break
+        if len(batch) < FILL_BATCH_SIZE:
+            break
+        last = batch[-1]
+    return book, fills, resting_orders
+
+
+def refund_unfilled(market, order, unfilled):
+    """
+    Return the escrow of an order's unfilled quantity, the same way a cancel
+    does. Caller holds the market row lock and saves the order itself.
+    """
+    if unfilled <= 0:
+        return Decimal('0.00')
+    return refund_escrow(market, order.user_id, unfilled * order.price, order_id=order.pk)
+
+
+def refund_escrow(market, user_id, refund, order_id=None, release=None):
+    """
+    Give escrowed credits back to a user and take them out of the market's
+    volume/liquidity. `release` is how much of the user's reserved credits
+    the order frees; by default the refund itself (unfilled escrow goes
+    straight back). Caller holds the market row lock.
+    """
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    
+    release = refund if release is None else release
+    refund = max(refund, Decimal('0.00'))
+    if not refund and not release:
+        return Decimal('0.00')
+    
+    now = timezone.now()
+    credit = round_credits(refund)
+    User.objects.filter(pk=user_id).update(
+        credits=F('credits') + credit,
+        base_credits=F('credits') + credit,
+        reserved_credits=F('reserved_credits') - release,
+        last_activity_at=now,
+        updated_at=now,
+    )
+    if credit:
+        record_credit_entries([
+            credit_entry(user_id, credit, 'order_refund', now=now, order_id=order_id, market_id=market.pk)
+        ])
+    
+    if refund:
+        market.total_volume = max(0, market.total_volume - refund)
+        market.total_liquidity = max(0, market.total_liquidity - refund)
+        market.save(update_fields=['total_volume', 'total_liquidity'])
+    return refund
+
+
+def _book_entry_is_current(entry, fill_quantity, order):
+    """True if the DB row still has at least what the book says is resting."""
+    if order is None or order.status not in OPEN_STATUSES:
+        return False
+    return order.quantity - order.filled_quantity == entry.remaining
+
+
+def build_trade_complementary(yes_order, no_order, yes_price, no_price, quantity, executed_at=None):
     """
-    Create a trade when matching Buy YES with Buy NO (complementary orders).
+    Build (but don't save) a trade matching Buy YES with Buy NO (complementary orders).
     Both users pay; yes_buyer gets YES shares, no_buyer gets NO shares.
+    
+    Returns: (Trade, no_price) - the NO side's price isn't stored on the trade
     """
-    yes_buyer = yes_order.user
-    no_buyer = no_order.user
-    market = yes_order.market
     quantity = Decimal(str(quantity))
     
     yes_cost = yes_price * quantity
     no_cost = no_price * quantity
     
-    trade = Trade.objects.create(
-        market=market,
+    trade = Trade(
+        market=yes_order.market,
         buy_order=yes_order,
         sell_order=no_order,
-        buyer=yes_buyer,
-        seller=no_buyer,
+        buyer=yes_order.user,
+        seller=no_order.user,
         side='yes',
         price=yes_price,
         quantity=quantity,
         total_value=yes_cost + no_cost,
-        executed_at=timezone.now()
+        executed_at=executed_at or timezone.now()
     )
+    return trade, no_price
+
+
+def persist_fills(market, executions, orders):
+    """
+    Write the result of one matching pass in a fixed number of statements,
+    however many resting orders were swept:
+    - every trade in one INSERT
+    - positions of all users involved: one locked SELECT, one upsert
+    - their portfolio valuations: one INSERT of missing rows, one UPDATE
+    - touched orders in one UPDATE of just the fill / book columns
     
-    # Credits already deducted when orders were placed; only update positions
-    # Volume/liquidity already updated when orders were placed; no double-count
-    update_position(yes_buyer, market, 'yes', quantity, yes_price, is_buy=True)
-    update_position(no_buyer, market, 'no', quantity, no_price, is_buy=True)
+    - the spent escrow out of the users' reserved credits in one UPDATE
     
-    return trade
+    Credits were already deducted when the orders were placed and volume /
+    liquidity were counted then too, so only positions and reserved credits
+    change here.
+    
+    Returns: List of created Trade objects
+    """
+    if not executions:
+        return []
+    
+    trades = Trade.objects.bulk_create([trade for trade, _ in executions])
+    
+    # Each side paid its own limit price at placement: that escrow is now spent
+    spent = defaultdict(Decimal)
+    for trade, no_price in executions:
+        spent[trade.buyer_id] += trade.price * trade.quantity
+        spent[trade.seller_id] += no_price * trade.quantity
+    release_reserved_credits(spent)
+    
+    user_ids = {trade.buyer_id for trade in trades} | {trade.seller_id for trade in trades}
+    positions = {
+        position.user_id: position
+        for position in Position.objects.select_for_update().filter(market=market, user_id__in=user_ids)
+    }
+    before = {user_id: snapshot(position) for user_id, position in positions.items()}
+    for trade, no_price in executions:
+        for user_id, side, price in ((trade.buyer_id, 'yes', trade.price), (trade.seller_id, 'no', no_price)):
+            position = positions.get(user_id)
+            if position is None:
+                position = positions[user_id] = Position(
+                    user_id=user_id,
+                    market=market,
+                    yes_shares=Decimal('0.00'),
+                    no_shares=Decimal('0.00'),
+                    yes_avg_cost=Decimal('0.0000'),
+                    no_avg_cost=Decimal('0.0000'),
+                )
+            apply_position_change(position, side, trade.quantity, price, is_buy=True)
+    
+    # Fresh instances so new and existing rows go through one INSERT ... ON CONFLICT
+    Position.objects.bulk_create(
+        [
+            Position(
+                user_id=position.user_id,
+                market=market,
+                yes_shares=position.yes_shares,
+                no_shares=position.no_shares,
+                yes_avg_cost=position.yes_avg_cost,
+                no_avg_cost=position.no_avg_cost,
+            )
+            for position in positions.values()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'market'],
+        update_fields=['yes_shares', 'no_shares', 'yes_avg_cost', 'no_avg_cost', 'updated_at'],
+    )
+    
+    record_position_changes(market, [
+        (user_id, before.get(user_id), snapshot(position)) for user_id, position in positions.items()
+    ])
+    
+    Order.objects.bulk_update(orders, ['filled_quantity', 'status', 'on_book', 'filled_at', 'updated_at'])
+    
+    return trades
 
 
 def create_trade(buy_order, sell_order, price, quantity):
@@ -170,14 +505,14 @@ def create_trade(buy_order, sell_order, price, quantity):
     # Buyer pays: price * quantity
     # Buyer receives: quantity shares
     buyer_cost = total_value
-    buyer.update_credits_from_trade(-buyer_cost)
+    buyer.update_credits_from_trade(-buyer_cost, trade_id=trade.pk, market_id=trade.market_id)
     update_position(buyer, buy_order.market, side, quantity, price, is_buy=True)
     
     # Update seller's position and credits
     # Seller receives: price * quantity
     # Seller gives up: quantity shares
     seller_proceeds = total_value
-    seller.update_credits_from_trade(seller_proceeds)
+    seller.update_credits_from_trade(seller_proceeds, trade_id=trade.pk, market_id=trade.market_id)
     update_position(seller, sell_order.market, side, quantity, price, is_buy=False)
     
     # Update market volume
@@ -209,7 +544,14 @@ def update_position(user, market, side, quantity, price, is_buy=True):
             'no_avg_cost': Decimal('0.0000'),
         }
     )
-    
+    before = snapshot(position)
+    apply_position_change(position, side, quantity, price, is_buy=is_buy)
+    position.save()
+    record_position_changes(market, [(position.user_id, before, snapshot(position))])
+
+
+def apply_position_change(position, side, quantity, price, is_buy=True):
+    """Apply a trade to a Position in memory (see update_position); doesn't save."""
     if side == 'yes':
         if is_buy:
             # Buying YES shares
@@ -252,21 +594,109 @@ def update_position(user, market, side, quantity, price, is_buy=True):
             position.no_shares = max(Decimal('0.00'), position.no_shares - quantity)
             if position.no_shares == 0:
                 position.no_avg_cost = Decimal('0.0000')
-    
-    position.save()
 
 
 def update_order_after_trade(order, filled_quantity):
     """Update order status after a trade."""
+    apply_order_fill(order, filled_quantity)
+    order.save()
+
+
+def apply_order_fill(order, filled_quantity, now=None):
+    """Apply a fill to an Order in memory (see update_order_after_trade); doesn't save."""
+    now = now or timezone.now()
     order.filled_quantity += filled_quantity
     
     if order.filled_quantity >= order.quantity:
         order.status = 'filled'
-        order.filled_at = timezone.now()
+        order.filled_at = now
+        order.on_book = False
     else:
         order.status = 'partial'
+    # bulk_update doesn't apply auto_now
+    order.updated_at = now
+
+
+VWAP_WINDOW_BUCKETS = 24  # Hourly price buckets in the rolling VWAP window
+
+
+def vwap_contribution(trade):
+    """
+    What a trade adds to the VWAP sums: (yes_value, yes_qty, no_value, no_qty).
     
-    order.save()
+    Complementary trades (total_value == quantity) count towards both sides,
+    at price and 1 - price; any other trade only counts for its own side.
+    """
+    is_complementary = abs(trade.total_value - trade.quantity) < Decimal('0.01')
+    zero = Decimal('0')
+    if trade.side == 'yes':
+        yes_value = (trade.price * trade.quantity) if is_complementary else trade.total_value
+        if is_complementary:
+            return yes_value, trade.quantity, (Decimal('1') - trade.price) * trade.quantity, trade.quantity
+        return yes_value, trade.quantity, zero, zero
+    no_value = (trade.price * trade.quantity) if is_complementary else trade.total_value
+    if is_complementary:
+        return (Decimal('1') - trade.price) * trade.quantity, trade.quantity, no_value, trade.quantity
+    return zero, zero, no_value, trade.quantity
+
+
+def record_price_bucket(market, old_yes_price, sums, now):
+    """
+    Fold fills into the market's price bucket for the hour of `now`: add
+    their VWAP contribution `sums` and close the bucket at the market's new
+    YES price. The first fill of the hour opens it at `old_yes_price`.
+    Called with the market row locked, so the bucket can't be created twice.
+    """
+    hour = price_bucket_start(now)
+    yes_value, yes_quantity, no_value, no_quantity = sums
+    updated = MarketPriceBucket.objects.filter(market=market, hour=hour).update(
+        yes_value=F('yes_value') + yes_value,
+        yes_quantity=F('yes_quantity') + yes_quantity,
+        no_value=F('no_value') + no_value,
+        no_quantity=F('no_quantity') + no_quantity,
+        close_price=market.yes_price,
+    )
+    if not updated:
+        MarketPriceBucket.objects.create(
+            market=market,
+            hour=hour,
+            yes_value=yes_value,
+            yes_quantity=yes_quantity,
+            no_value=no_value,
+            no_quantity=no_quantity,
+            open_price=old_yes_price,
+            close_price=market.yes_price,
+        )
+
+
+def expire_vwap_buckets(market, now):
+    """
+    Move the market's VWAP window up to the last VWAP_WINDOW_BUCKETS hours,
+    taking the buckets that drop out of it off the running vwap_* sums (one
+    aggregate, only when the window moves). Returns the sums.
+    """
+    sums = [
+        Decimal(str(market.vwap_yes_value)),
+        Decimal(str(market.vwap_yes_quantity)),
+        Decimal(str(market.vwap_no_value)),
+        Decimal(str(market.vwap_no_quantity)),
+    ]
+    window_start = price_bucket_start(now) - (VWAP_WINDOW_BUCKETS - 1) * PRICE_BUCKET_SPAN
+    if market.vwap_window_start is not None and market.vwap_window_start < window_start:
+        expired = MarketPriceBucket.objects.filter(
+            market=market, hour__gte=market.vwap_window_start, hour__lt=window_start
+        ).aggregate(
+            yes_value=Sum('yes_value'),
+            yes_quantity=Sum('yes_quantity'),
+            no_value=Sum('no_value'),
+            no_quantity=Sum('no_quantity'),
+        )
+        for i, key in enumerate(['yes_value', 'yes_quantity', 'no_value', 'no_quantity']):
+            sums[i] -= expired[key] or Decimal('0')
+        market.vwap_window_start = window_start
+    elif market.vwap_window_start is None:
+        market.vwap_window_start = window_start
+    return sums
 
 
 def update_market_price(market, trades):
@@ -276,38 +706,24 @@ def update_market_price(market, trades):
     This ensures prices reflect actual trading activity and maintain:
     - yes_price + no_price = 1.00
     - Prices reflect recent trading volume
+    
+    The VWAP covers the last VWAP_WINDOW_BUCKETS hours of fills. Each hour's
+    contribution is kept in a MarketPriceBucket row and the window's totals
+    in the market's running vwap_* sums, so each new fill is added, and the
+    hours that age out subtracted, without reading the trades table.
     """
     if not trades:
         return
     
-    # Calculate VWAP for YES and NO
-    yes_total_value = Decimal('0.00')
-    yes_total_quantity = Decimal('0.00')
-    no_total_value = Decimal('0.00')
-    no_total_quantity = Decimal('0.00')
-    
-    # Get recent trades for this market (last 100 trades)
-    recent_trades = Trade.objects.filter(
-        market=market
-    ).order_by('-executed_at')[:100]
-    
-    for trade in recent_trades:
-        # Complementary trades: total_value = yes_cost + no_cost = quantity
-        is_complementary = abs(trade.total_value - trade.quantity) < Decimal('0.01')
-        if trade.side == 'yes':
-            yes_val = (trade.price * trade.quantity) if is_complementary else trade.total_value
-            yes_total_value += yes_val
-            yes_total_quantity += trade.quantity
-            if is_complementary:
-                no_total_value += (Decimal('1') - trade.price) * trade.quantity
-                no_total_quantity += trade.quantity
-        else:
-            no_val = (trade.price * trade.quantity) if is_complementary else trade.total_value
-            no_total_value += no_val
-            no_total_quantity += trade.quantity
-            if is_complementary:
-                yes_total_value += (Decimal('1') - trade.price) * trade.quantity
-                yes_total_quantity += trade.quantity
+    old_yes_price = market.yes_price
+    now = trades[-1].executed_at
+    sums = expire_vwap_buckets(market, now)
+    added = [Decimal('0')] * 4
+    for trade in trades:
+        for i, value in enumerate(vwap_contribution(trade)):
+            added[i] += value
+    sums = [total + value for total, value in zip(sums, added)]
+    yes_total_value, yes_total_quantity, no_total_value, no_total_quantity = sums
     
     # Calculate VWAP
     if yes_total_quantity > 0:
@@ -339,5 +755,16 @@ def update_market_price(market, trades):
     # Ensure they sum to 1.00 exactly
     market.no_price = Decimal('1.0000') - market.yes_price
     
-    market.save(update_fields=['yes_price', 'no_price'])
-
+    last_trade = trades[-1]
+    market.last_trade_price = last_trade.price if last_trade.side == 'yes' else Decimal('1') - last_trade.price
+    market.last_trade_at = last_trade.executed_at
+    
+    market.vwap_yes_value, market.vwap_yes_quantity, market.vwap_no_value, market.vwap_no_quantity = sums
+    
+    record_price_bucket(market, old_yes_price, added, now)
+    market.save(update_fields=[
+        'yes_price', 'no_price',
+        'vwap_window_start', 'vwap_yes_value', 'vwap_yes_quantity', 'vwap_no_value', 'vwap_no_quantity',
+        'last_trade_price', 'last_trade_at',
+    ])
+    revalue_market(market, old_yes_price, market.yes_price)
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0004_market_book_seq'),
+        ('trading', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('trades_created', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_requests', to='markets.market')),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='match_request', to='trading.order')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'market', 'id'], name='trading_mat_status_8ce6df_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0003_matchrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='time_in_force',
+            field=models.CharField(choices=[('gtc', 'Good Till Cancelled'), ('ioc', 'Immediate Or Cancel'), ('fok', 'Fill Or Kill')], default='gtc', help_text='IOC/FOK orders never rest on the book; any unfilled part is refunded', max_length=3),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def backfill_book(apps, schema_editor):
+    """Mark currently resting orders as on the book and aggregate their levels."""
+    Order = apps.get_model('trading', 'Order')
+    BookLevel = apps.get_model('trading', 'BookLevel')
+
+    resting = Order.objects.filter(
+        status__in=['pending', 'partial'],
+        time_in_force='gtc',
+    ).exclude(match_request__status='queued')
+    resting.update(on_book=True)
+
+    levels = (
+        Order.objects.filter(on_book=True)
+        .values('market_id', 'side', 'price')
+        .annotate(quantity=Sum(F('quantity') - F('filled_quantity')), order_count=Count('id'))
+    )
+    BookLevel.objects.bulk_create(
+        [BookLevel(**level) for level in levels if level['quantity'] > 0],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0005_market_vwap_state'),
+        ('trading', '0004_order_time_in_force'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='on_book',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='BookLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('side', models.CharField(choices=[('yes', 'Yes'), ('no', 'No')], max_length=10)),
+                ('price', models.DecimalField(decimal_places=4, max_digits=5)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0.0, max_digits=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='book_levels', to='markets.market')),
+            ],
+            options={
+                'ordering': ['market', 'side', '-price'],
+                'unique_together': {('market', 'side', 'price')},
+            },
+        ),
+        migrations.RunPython(backfill_book, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+
+def backfill_valuations(apps, schema_editor):
+    """Value every user's current positions at today's market prices."""
+    Position = apps.get_model('trading', 'Position')
+    PortfolioValuation = apps.get_model('trading', 'PortfolioValuation')
+
+    value_field = DecimalField(max_digits=26, decimal_places=6)
+    rows = Position.objects.values('user_id').annotate(
+        cost=Sum(F('yes_shares') * F('yes_avg_cost') + F('no_shares') * F('no_avg_cost'), output_field=value_field),
+        value=Sum(F('yes_shares') * F('market__yes_price') + F('no_shares') * F('market__no_price'), output_field=value_field),
+    )
+    PortfolioValuation.objects.bulk_create(
+        [
+            PortfolioValuation(
+                user_id=row['user_id'],
+                cost_basis=row['cost'] or 0,
+                market_value=row['value'] or 0,
+                unrealized_pnl=(row['value'] or 0) - (row['cost'] or 0),
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0005_book_levels'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cost_basis', models.DecimalField(decimal_places=6, default=0, max_digits=26)),
+                ('market_value', models.DecimalField(decimal_places=6, default=0, max_digits=26)),
+                ('unrealized_pnl', models.DecimalField(decimal_places=6, default=0, max_digits=26)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='portfolio', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill_valuations, migrations.RunPython.noop),
+    ]
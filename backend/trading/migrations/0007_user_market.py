@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Func, Max, Min, OuterRef, Subquery, Sum
+
+
+def backfill_participation(apps, schema_editor):
+    """One row per (user, market) already ordered in; the counters are set to match."""
+    Order = apps.get_model('trading', 'Order')
+    UserMarket = apps.get_model('trading', 'UserMarket')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    rows = Order.objects.order_by().values('user_id', 'market_id').annotate(
+        first=Min('created_at'),
+        last=Max('created_at'),
+        volume=Sum(F('price') * F('quantity'), output_field=models.DecimalField(max_digits=26, decimal_places=6)),
+        orders=Count('id'),
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(UserMarket(
+            user_id=row['user_id'],
+            market_id=row['market_id'],
+            first_order_at=row['first'],
+            last_order_at=row['last'],
+            volume=row['volume'] or 0,
+            order_count=row['orders'],
+        ))
+        if len(batch) == 2000:
+            UserMarket.objects.bulk_create(batch)
+            batch = []
+    UserMarket.objects.bulk_create(batch)
+
+    markets = UserMarket.objects.filter(user_id=OuterRef('pk')).order_by().annotate(
+        n=Func(F('pk'), function='COUNT')
+    ).values('n')
+    User.objects.update(total_markets_traded=Subquery(markets))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0008_scheduler'),
+        ('trading', '0006_portfolio_valuation'),
+        ('users', '0008_user_board_order_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMarket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_order_at', models.DateTimeField()),
+                ('last_order_at', models.DateTimeField()),
+                ('volume', models.DecimalField(decimal_places=6, default=0, max_digits=26)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='markets.market')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='market_participations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_order_at'], name='trading_use_user_id_c12fd6_idx'), models.Index(fields=['market'], name='trading_use_market__c7bf99_idx')],
+                'unique_together': {('user', 'market')},
+            },
+        ),
+        migrations.RunPython(backfill_participation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0007_user_market'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchrequest',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0008_scheduler'),
+        ('trading', '0008_match_request_attempts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('on_book', True)), fields=['market', 'side', 'price', 'created_at', 'id'], name='trading_order_book_idx'),
+        ),
+    ]
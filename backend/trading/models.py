@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from markets.models import Market
@@ -26,12 +27,24 @@ class Order(models.Model):
         ('partial', 'Partially Filled'),
     ]
     
+    TIME_IN_FORCE_CHOICES = [
+        ('gtc', 'Good Till Cancelled'),
+        ('ioc', 'Immediate Or Cancel'),
+        ('fok', 'Fill Or Kill'),
+    ]
+    
     market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name='orders')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     
     # Order details
     side = models.CharField(max_length=10, choices=SIDE_CHOICES)  # 'yes' or 'no'
     order_type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='limit')
+    time_in_force = models.CharField(
+        max_length=3,
+        choices=TIME_IN_FORCE_CHOICES,
+        default='gtc',
+        help_text="IOC/FOK orders never rest on the book; any unfilled part is refunded"
+    )
     price = models.DecimalField(
         max_digits=5, 
         decimal_places=4,
@@ -48,6 +61,8 @@ class Order(models.Model):
     # Order status
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     filled_quantity = models.DecimalField(max_digits=20, decimal_places=2, default=0.00)
+    # True while the unfilled part is resting on the book (counted in BookLevel)
+    on_book = models.BooleanField(default=False)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -59,10 +74,21 @@ class Order(models.Model):
         indexes = [
             models.Index(fields=['market', 'status', 'side', 'price']),
             models.Index(fields=['user', '-created_at']),
+            # Resting orders in book priority, walked by sync-mode matching
+            models.Index(
+                fields=['market', 'side', 'price', 'created_at', 'id'],
+                name='trading_order_book_idx',
+                condition=Q(on_book=True),
+            ),
         ]
     
     def __str__(self):
         return f"{self.user.username} - {self.side.upper()} {self.quantity} @ {self.price}"
+    
+    @property
+    def rests_on_book(self):
+        """Only GTC orders may rest on the book (market orders are always IOC/FOK)."""
+        return self.time_in_force == 'gtc'
 
 
 class Trade(models.Model):
@@ -132,4 +158,100 @@ class Position(models.Model):
         return f"{self.user.username} - {self.market.title}: YES={self.yes_shares}, NO={self.no_shares}"
 
 
+class PortfolioValuation(models.Model):
+    """
+    Mark-to-market totals of a user's open positions (see valuation.py).
+    
+    Kept up to date incrementally as positions change and revalued with one
+    UPDATE per market when its price moves, so stats pages read one row
+    instead of walking positions.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='portfolio')
+    cost_basis = models.DecimalField(max_digits=26, decimal_places=6, default=0)
+    market_value = models.DecimalField(max_digits=26, decimal_places=6, default=0)
+    unrealized_pnl = models.DecimalField(max_digits=26, decimal_places=6, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.username}: value={self.market_value} pnl={self.unrealized_pnl}"
+
+
+class UserMarket(models.Model):
+    """
+    A user's participation in a market: one row from their first order there
+    (see participation.py), so markets-traded counts and lists never scan
+    their order history.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='market_participations')
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name='participants')
+    first_order_at = models.DateTimeField()
+    last_order_at = models.DateTimeField()
+    # Escrow committed by the user's orders here (limit price * quantity)
+    volume = models.DecimalField(max_digits=26, decimal_places=6, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'market']
+        indexes = [
+            models.Index(fields=['user', '-last_order_at']),
+            models.Index(fields=['market']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} in {self.market.title}: {self.order_count} order(s)"
+
+
+class BookLevel(models.Model):
+    """
+    Aggregated resting size at one price on one side of a market's book.
+    
+    Maintained incrementally as orders rest, fill and are cancelled
+    (see orderbook.apply_level_changes), never recomputed per request.
+    """
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name='book_levels')
+    side = models.CharField(max_length=10, choices=Order.SIDE_CHOICES)
+    price = models.DecimalField(max_digits=5, decimal_places=4)
+    quantity = models.DecimalField(max_digits=20, decimal_places=2, default=0.00)
+    order_count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['market', 'side', 'price']
+        ordering = ['market', 'side', '-price']
+    
+    def __str__(self):
+        return f"{self.market.title} {self.side.upper()} {self.quantity} @ {self.price} ({self.order_count})"
+
 
+class MatchRequest(models.Model):
+    """
+    Queue entry for the matching sequencer (see sequencer.py).
+    
+    Every order is matched in the order its request was queued, by one
+    matcher per market shard.
+    """
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='match_request')
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name='match_requests')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    trades_created = models.IntegerField(default=0)
+    # Failed matching attempts so far (see sequencer.MATCH_MAX_ATTEMPTS)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'market', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"Match order {self.order_id} ({self.status})"
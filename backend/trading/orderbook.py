@@ -0,0 +1,305 @@
+"""
+In-Memory Order Book
+
+Keeps the resting orders of each market in memory so matching does not have
+to re-scan the orders table for every incoming order:
+1. Prices are stored as integer ticks (1 tick = 0.0001 credits)
+2. Each side of a market is a set of price levels, each level a FIFO queue
+3. Books are rebuilt from the open Order rows the first time a market is
+   matched in this worker, and again whenever they fall out of date
+
+Order.on_book marks the orders that are resting, and BookLevel keeps their
+aggregated size per price level in the DB for the depth endpoint.
+
+Every process that changes a market's resting orders bumps Market.book_seq
+while holding the market row lock. A cached book is only trusted when its
+seq matches the row, so books in other workers rebuild themselves instead
+of matching against stale state.
+
+Books are only cached with ORDER_MATCHING_MODE=async, where one run_matcher
+process owns each market and nothing else moves its seq between matches
+except cancels. In sync mode every web worker matches, so a cached book
+would be stale on almost every order; there matching skips the book and
+walks the locked resting rows in price-time order a batch at a time, only
+until the order is covered (see matching._load_fills).
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F, Q
+
+TICKS_PER_CREDIT = 10000
+MAX_TICK = TICKS_PER_CREDIT
+
+OPEN_STATUSES = ['pending', 'partial']
+
+
+def price_to_ticks(price):
+    """Convert a Decimal price (0.0000 - 1.0000) to integer ticks."""
+    return int((Decimal(str(price)) * TICKS_PER_CREDIT).to_integral_value())
+
+
+def ticks_to_price(ticks):
+    """Convert integer ticks back to a 4dp Decimal price."""
+    return (Decimal(ticks) / TICKS_PER_CREDIT).quantize(Decimal('0.0001'))
+
+
+class RestingOrder:
+    """A resting order as held in the book (only what matching needs)."""
+    __slots__ = ('order_id', 'user_id', 'side', 'ticks', 'remaining')
+
+    def __init__(self, order_id, user_id, side, ticks, remaining):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.side = side
+        self.ticks = ticks
+        self.remaining = remaining
+
+    def __repr__(self):
+        return f"RestingOrder({self.order_id}, {self.side} {self.remaining} @ {self.ticks})"
+
+
+class OrderBook:
+    """
+    Price-level order book for one market.
+
+    Levels are keyed by integer ticks and hold an OrderedDict of
+    order_id -> RestingOrder, which gives FIFO priority within a level and
+    O(1) removal on cancel.
+    """
+
+    def __init__(self, market_id, seq=0):
+        self.market_id = market_id
+        self.seq = seq
+        self._levels = {'yes': {}, 'no': {}}
+        self._ticks = {'yes': [], 'no': []}
+        self._index = {}
+
+    @classmethod
+    def load(cls, market_id, seq=0):
+        """Build a book from the market's open orders (one query)."""
+        from .models import Order
+
+        book = cls(market_id, seq=seq)
+        rows = Order.objects.filter(
+            market_id=market_id,
+            status__in=OPEN_STATUSES,
+            on_book=True,
+        ).order_by('created_at', 'id').values_list(
+            'id', 'user_id', 'side', 'price', 'quantity', 'filled_quantity'
+        )
+        for order_id, user_id, side, price, quantity, filled in rows:
+            book.add(order_id, user_id, side, price, quantity - filled)
+        return book
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, order_id):
+        return order_id in self._index
+
+    def add(self, order_id, user_id, side, price, remaining):
+        """Append an order to the back of its price level; returns its entry."""
+        if remaining <= 0:
+            return None
+        if order_id in self._index:
+            self.remove(order_id)
+        ticks = price_to_ticks(price)
+        levels = self._levels[side]
+        level = levels.get(ticks)
+        if level is None:
+            level = levels[ticks] = OrderedDict()
+            insort(self._ticks[side], ticks)
+        entry = RestingOrder(order_id, user_id, side, ticks, remaining)
+        level[order_id] = entry
+        self._index[order_id] = entry
+        return entry
+
+    def remove(self, order_id):
+        """Remove an order from the book. Unknown ids are ignored."""
+        entry = self._index.pop(order_id, None)
+        if entry is None:
+            return None
+        level = self._levels[entry.side][entry.ticks]
+        del level[order_id]
+        if not level:
+            del self._levels[entry.side][entry.ticks]
+            self._ticks[entry.side].remove(entry.ticks)
+        return entry
+
+    def reduce(self, order_id, quantity):
+        """Reduce an order's remaining quantity, dropping it once exhausted."""
+        entry = self._index.get(order_id)
+        if entry is None:
+            return
+        entry.remaining -= quantity
+        if entry.remaining <= 0:
+            self.remove(order_id)
+
+    def iter_orders(self, side, max_ticks=MAX_TICK, min_ticks=None):
+        """
+        Yield resting orders on `side` priced at or below `max_ticks`,
+        lowest price first and FIFO within a level. With `min_ticks`, yield
+        the ones priced at or above it instead, highest price first (how
+        market orders walk the book, see matching._opposite_levels).
+        """
+        ticks_list = self._ticks[side]
+        if min_ticks is None:
+            walk = ticks_list[:bisect_right(ticks_list, max_ticks)]
+        else:
+            walk = reversed(ticks_list[bisect_left(ticks_list, min_ticks):])
+        for ticks in walk:
+            level = self._levels[side].get(ticks)
+            if level:
+                yield from list(level.values())
+
+    def collect_fills(self, side, max_ticks, quantity, exclude_user_id=None, min_ticks=None):
+        """
+        Walk the book (see iter_orders) and return [(RestingOrder,
+        fill_quantity), ...] for up to `quantity` shares. The book itself is
+        not modified.
+        """
+        fills = []
+        remaining = quantity
+        for entry in self.iter_orders(side, max_ticks, min_ticks):
+            if remaining <= 0:
+                break
+            if entry.user_id == exclude_user_id:
+                continue
+            fill = min(remaining, entry.remaining)
+            if fill <= 0:
+                continue
+            fills.append((entry, fill))
+            remaining -= fill
+        return fills
+
+    def depth(self, side):
+        """Aggregated [(price, total_remaining, order_count), ...] for one side."""
+        levels = self._levels[side]
+        return [
+            (ticks_to_price(ticks), sum(e.remaining for e in levels[ticks].values()), len(levels[ticks]))
+            for ticks in self._ticks[side]
+        ]
+
+
+_books = {}
+_books_lock = threading.Lock()
+
+
+def books_are_cached():
+    """True when matching may keep books in memory (async mode, see module docstring)."""
+    return getattr(settings, 'ORDER_MATCHING_MODE', 'sync') == 'async'
+
+
+def get_order_book(market):
+    """
+    Return this worker's book for `market`, rebuilding it if it is missing or
+    its seq no longer matches Market.book_seq. Only used when
+    books_are_cached().
+
+    The caller must hold the market row lock (select_for_update) so the seq
+    cannot move while the book is in use.
+    """
+    with _books_lock:
+        book = _books.get(market.pk)
+        if book is None or book.seq != market.book_seq:
+            book = OrderBook.load(market.pk, seq=market.book_seq)
+            _books[market.pk] = book
+        return book
+
+
+def rebuild_order_book(market):
+    """Reload this worker's book for `market` from the DB unconditionally (see get_order_book)."""
+    book = OrderBook.load(market.pk, seq=market.book_seq)
+    with _books_lock:
+        _books[market.pk] = book
+    return book
+
+
+def invalidate_order_book(market_id):
+    """Drop this worker's cached book so the next match rebuilds it."""
+    with _books_lock:
+        _books.pop(market_id, None)
+
+
+def remove_from_order_book(market, order_ids):
+    """
+    Take orders off the book after they were cancelled.
+
+    Updates this worker's cached book in place when it is current and bumps
+    Market.book_seq either way. Caller holds the market row lock.
+    """
+    with _books_lock:
+        book = _books.get(market.pk)
+        if book is not None and book.seq == market.book_seq:
+            for order_id in order_ids:
+                book.remove(order_id)
+        else:
+            book = None
+    advance_book_seq(market, book)
+
+
+def advance_book_seq(market, book=None):
+    """
+    Record a change to the market's resting orders.
+
+    Increments Market.book_seq (caller holds the market row lock) and, if this
+    worker applied the same change to `book`, keeps the book current so it
+    does not need rebuilding.
+    """
+    from markets.models import Market
+
+    Market.objects.filter(pk=market.pk).update(book_seq=F('book_seq') + 1)
+    market.book_seq += 1
+    if book is not None:
+        book.seq = market.book_seq
+
+
+def apply_level_changes(market_id, changes):
+    """
+    Apply {(side, price): [quantity_delta, order_count_delta]} to BookLevel.
+    
+    Reads the affected levels once, then writes with at most one bulk
+    create, one bulk update and one delete. Caller holds the market row lock.
+    """
+    from .models import BookLevel
+
+    changes = {key: delta for key, delta in changes.items() if delta[0] or delta[1]}
+    if not changes:
+        return
+
+    lookup = Q()
+    for side, price in changes:
+        lookup |= Q(side=side, price=price)
+    levels = {
+        (level.side, level.price): level
+        for level in BookLevel.objects.select_for_update().filter(lookup, market_id=market_id)
+    }
+
+    to_create, to_update, to_delete = [], [], []
+    for (side, price), (quantity_delta, count_delta) in changes.items():
+        level = levels.get((side, price))
+        if level is None:
+            level = BookLevel(
+                market_id=market_id, side=side, price=price,
+                quantity=Decimal('0.00'), order_count=0,
+            )
+        level.quantity += quantity_delta
+        level.order_count += count_delta
+        if level.order_count <= 0 or level.quantity <= 0:
+            if level.pk:
+                to_delete.append(level.pk)
+        elif level.pk:
+            to_update.append(level)
+        else:
+            to_create.append(level)
+
+    if to_create:
+        BookLevel.objects.bulk_create(to_create)
+    if to_update:
+        BookLevel.objects.bulk_update(to_update, ['quantity', 'order_count'])
+    if to_delete:
+        BookLevel.objects.filter(pk__in=to_delete).delete()
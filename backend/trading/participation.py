@@ -0,0 +1,75 @@
+"""
+Market Participation
+
+UserMarket has one row per (user, market) the user has placed an order in.
+Placement records its orders with record_participation():
+- markets the user already traded get their volume / order count bumped
+  with one UPDATE each
+- a first order in a market inserts the row (in a savepoint; if another
+  transaction inserted it first, the UPDATE is retried instead) and bumps
+  User.total_markets_traded by one
+
+so the counter only moves when a row is created, and no query ever counts
+the user's distinct markets over their orders. Placement already holds the
+user's row lock (from reserving their credits), so one user's placements
+insert their rows one at a time.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import UserMarket
+
+
+def _bump(user_id, market_id, volume, count, now):
+    """Add to an existing row; returns whether there was one."""
+    return UserMarket.objects.filter(user_id=user_id, market_id=market_id).update(
+        volume=F('volume') + volume,
+        order_count=F('order_count') + count,
+        last_order_at=now,
+    ) > 0
+
+
+def record_participation(user_id, orders, now=None):
+    """
+    Record a user's new orders, given as (market_id, volume) pairs. Returns
+    the number of markets they traded for the first time.
+    """
+    from users.models import User
+
+    now = now or timezone.now()
+    volumes = defaultdict(Decimal)
+    counts = defaultdict(int)
+    for market_id, volume in orders:
+        volumes[market_id] += Decimal(str(volume))
+        counts[market_id] += 1
+
+    created = 0
+    for market_id, count in counts.items():
+        if _bump(user_id, market_id, volumes[market_id], count, now):
+            continue
+        try:
+            with transaction.atomic():
+                UserMarket.objects.create(
+                    user_id=user_id,
+                    market_id=market_id,
+                    first_order_at=now,
+                    last_order_at=now,
+                    volume=volumes[market_id],
+                    order_count=count,
+                )
+            created += 1
+        except IntegrityError:
+            _bump(user_id, market_id, volumes[market_id], count, now)
+
+    if created:
+        User.objects.filter(pk=user_id).update(total_markets_traded=F('total_markets_traded') + created)
+    return created
+
+
+def market_participants(market):
+    """Ids of the users who have placed orders in `market` (indexed, no order scan)."""
+    return UserMarket.objects.filter(market=market).values_list('user_id', flat=True)
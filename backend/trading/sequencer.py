@@ -0,0 +1,143 @@
+"""
+Matching Sequencer
+
+Routes every order for a market through one ordered queue so each market
+has a single writer:
+- sync mode (default): orders are matched inline right after placement;
+  the market row lock taken by match_orders puts concurrent orders in line
+- async mode: the order is acknowledged as soon as it is placed and a
+  MatchRequest is queued in the same transaction. `manage.py run_matcher`
+  workers drain the queue, one per market shard, so a market is only ever
+  matched by one process while different markets match in parallel
+
+Set ORDER_MATCHING_MODE=async to enable the throughput mode. Fills then show
+up on the order (status / filled_quantity) once its request is processed.
+
+A request whose match raises stays queued and is retried, up to
+MATCH_MAX_ATTEMPTS times; after that it is marked failed and its order is
+cancelled and refunded, so no escrow is left stranded on an order that will
+never match. Done requests are pruned after MATCH_REQUEST_RETENTION.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from .matching import match_orders
+from .models import MatchRequest, Order
+
+logger = logging.getLogger(__name__)
+
+MATCH_MAX_ATTEMPTS = 3
+MATCH_REQUEST_RETENTION = timedelta(hours=1)
+PRUNE_BATCH_SIZE = 1000
+
+
+def matching_is_async():
+    """True when orders are queued for the run_matcher workers."""
+    return getattr(settings, 'ORDER_MATCHING_MODE', 'sync') == 'async'
+
+
+def enqueue_match(order):
+    """
+    Queue an order for matching.
+
+    Call inside the transaction that created the order so the queue entry
+    commits or rolls back together with it.
+    """
+    return MatchRequest.objects.create(order=order, market_id=order.market_id)
+
+
+def shard_for_market(market_id, shards):
+    """Shard number a market's requests are routed to."""
+    return market_id % shards
+
+
+def process_queue(shard=0, shards=1, batch_size=100):
+    """
+    Match up to `batch_size` queued orders for markets in `shard`, oldest first.
+
+    Returns the number of requests processed.
+    """
+    requests = list(
+        MatchRequest.objects.filter(status='queued')
+        .annotate(shard=Mod('market_id', shards))
+        .filter(shard=shard)
+        .order_by('id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    for request_id in requests:
+        process_request(request_id)
+    return len(requests)
+
+
+def process_request(request_id):
+    """Match one queued order and record the outcome on its MatchRequest."""
+    try:
+        with transaction.atomic():
+            request = (
+                MatchRequest.objects.select_for_update(skip_locked=True)
+                .select_related('order', 'order__user')
+                .filter(pk=request_id, status='queued')
+                .first()
+            )
+            if request is None:
+                # Already handled (or being handled) by another matcher
+                return None
+            
+            order = request.order
+            # match_orders re-checks the order's status under the market lock
+            trades = match_orders(order)
+            
+            request.status = 'done'
+            request.trades_created = len(trades)
+            request.processed_at = timezone.now()
+            request.save(update_fields=['status', 'trades_created', 'processed_at'])
+            return request
+    except Exception as e:
+        logger.error(f"Error matching queued request {request_id}: {str(e)}", exc_info=True)
+        return _record_failure(request_id, e)
+
+
+def _record_failure(request_id, error):
+    """Count a failed attempt; on the last one mark the request failed and cancel its order."""
+    from .cancellation import cancel_open_orders
+
+    with transaction.atomic():
+        request = MatchRequest.objects.select_for_update().filter(pk=request_id, status='queued').first()
+        if request is None:
+            return None
+        request.attempts += 1
+        request.error = str(error)
+        if request.attempts < MATCH_MAX_ATTEMPTS:
+            request.save(update_fields=['attempts', 'error'])
+            return None
+        request.status = 'failed'
+        request.processed_at = timezone.now()
+        request.save(update_fields=['attempts', 'error', 'status', 'processed_at'])
+
+    # Given up: refund the order rather than leave its escrow held forever
+    try:
+        result = cancel_open_orders(Order.objects.filter(pk=request.order_id))
+        logger.warning(f"Cancelled order {request.order_id} after {request.attempts} failed match attempts: {result}")
+    except Exception as e:
+        logger.error(f"Could not cancel order {request.order_id} of failed request {request_id}: {e}", exc_info=True)
+    return request
+
+
+def prune_match_requests(shard=0, shards=1, older_than=MATCH_REQUEST_RETENTION, batch_size=PRUNE_BATCH_SIZE):
+    """Delete up to `batch_size` done requests of `shard` processed before `older_than` ago. Returns how many."""
+    stale = list(
+        MatchRequest.objects.filter(status='done', processed_at__lt=timezone.now() - older_than)
+        .annotate(shard=Mod('market_id', shards))
+        .filter(shard=shard)
+        .order_by('id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not stale:
+        return 0
+    deleted, _ = MatchRequest.objects.filter(pk__in=stale).delete()
+    return deleted
@@ -1,23 +1,35 @@
+from decimal import Decimal
+
+from django.conf import settings
 from rest_framework import serializers
-from .models import Order, Trade, Position
+from .models import Order, Trade, Position, UserMarket
 
 
 class OrderSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
     market_title = serializers.CharField(source='market.title', read_only=True)
     market_slug = serializers.SlugField(source='market.slug', read_only=True)
+    # Optional for market orders: defaults to the current price plus the slippage cap
+    price = serializers.DecimalField(max_digits=5, decimal_places=4, required=False)
     
     class Meta:
         model = Order
         fields = [
             'id', 'market', 'market_title', 'market_slug', 'user', 'user_username',
-            'side', 'order_type', 'price', 'quantity', 'status',
+            'side', 'order_type', 'time_in_force', 'price', 'quantity', 'status',
             'filled_quantity', 'created_at', 'updated_at', 'filled_at'
         ]
         read_only_fields = ['id', 'user', 'status', 'filled_quantity', 'created_at', 'updated_at', 'filled_at']
     
     def validate(self, data):
         """Validate order data."""
+        if data.get('order_type') == 'market':
+            data = self._price_market_order(data)
+        elif 'price' not in data:
+            raise serializers.ValidationError({
+                'price': 'Price is required for limit orders'
+            })
+        
         price = data.get('price', 0)
         quantity = data.get('quantity', 0)
         
@@ -32,6 +44,22 @@ class OrderSerializer(serializers.ModelSerializer):
             })
         
         return data
+    
+    def _price_market_order(self, data):
+        """
+        Market orders sweep the book immediately and never rest: they are
+        escrowed at a cap of current price + MARKET_ORDER_SLIPPAGE (or the
+        price the client sent), fill at each level's price up to that cap
+        (the rest of the escrow is refunded), and are always IOC or FOK.
+        """
+        if 'price' not in data:
+            market = data['market']
+            reference = market.yes_price if data.get('side') == 'yes' else market.no_price
+            slippage = Decimal(str(getattr(settings, 'MARKET_ORDER_SLIPPAGE', '0.05')))
+            data['price'] = min(reference + slippage, Decimal('1.0000'))
+        if data.get('time_in_force', 'gtc') == 'gtc':
+            data['time_in_force'] = 'ioc'
+        return data
 
 
 class TradeSerializer(serializers.ModelSerializer):
@@ -68,4 +96,15 @@ class PositionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'updated_at']
 
 
-
+class UserMarketSerializer(serializers.ModelSerializer):
+    market_title = serializers.CharField(source='market.title', read_only=True)
+    market_slug = serializers.SlugField(source='market.slug', read_only=True)
+    market_status = serializers.CharField(source='market.status', read_only=True)
+    
+    class Meta:
+        model = UserMarket
+        fields = [
+            'id', 'market', 'market_title', 'market_slug', 'market_status',
+            'first_order_at', 'last_order_at', 'volume', 'order_count'
+        ]
+        read_only_fields = fields
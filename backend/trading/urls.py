@@ -1,11 +1,12 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet, TradeViewSet, PositionViewSet
+from .views import OrderViewSet, TradeViewSet, PositionViewSet, UserMarketViewSet
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'trades', TradeViewSet, basename='trade')
 router.register(r'positions', PositionViewSet, basename='position')
+router.register(r'markets-traded', UserMarketViewSet, basename='user-market')
 
 urlpatterns = router.urls
 
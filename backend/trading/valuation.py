@@ -0,0 +1,143 @@
+"""
+Portfolio Valuations
+
+PortfolioValuation holds, per user, the mark-to-market totals of all open
+positions:
+- cost_basis     = sum(yes_shares * yes_avg_cost + no_shares * no_avg_cost)
+- market_value   = sum(yes_shares * yes_price + no_shares * no_price)
+- unrealized_pnl = market_value - cost_basis
+
+The totals are never recomputed on read. They change in two ways:
+1. Position changes (fills, settlement) apply per-user deltas at the
+   market's current price: one INSERT of missing rows + one CASE UPDATE
+2. A market's price move revalues every holder with a single UPDATE:
+   since no_price = 1 - yes_price, each holder's value moves by
+   (yes_shares - no_shares) * (new_yes_price - old_yes_price)
+
+rebuild_valuations() recomputes rows from scratch (backfill / repair).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+
+from users.stats import invalidate_user_stats
+
+from .models import PortfolioValuation, Position
+
+ZERO = Decimal('0')
+VALUE_FIELD = DecimalField(max_digits=26, decimal_places=6)
+
+
+def position_totals(yes_shares, no_shares, yes_avg_cost, no_avg_cost, yes_price):
+    """(cost_basis, market_value) of one position at `yes_price`."""
+    yes_price = Decimal(str(yes_price))
+    cost = yes_shares * yes_avg_cost + no_shares * no_avg_cost
+    value = yes_shares * yes_price + no_shares * (Decimal('1') - yes_price)
+    return cost, value
+
+
+def snapshot(position):
+    """The position fields valuation deltas are computed from."""
+    return (position.yes_shares, position.no_shares, position.yes_avg_cost, position.no_avg_cost)
+
+
+def position_delta(before, after, yes_price):
+    """[cost_delta, value_delta] between two position snapshots (None = no position)."""
+    old_cost, old_value = position_totals(*before, yes_price) if before else (ZERO, ZERO)
+    new_cost, new_value = position_totals(*after, yes_price) if after else (ZERO, ZERO)
+    return [new_cost - old_cost, new_value - old_value]
+
+
+def _delta_case(deltas, index):
+    return Case(
+        *[When(user_id=user_id, then=Value(delta[index])) for user_id, delta in deltas.items()],
+        default=Value(ZERO),
+        output_field=VALUE_FIELD,
+    )
+
+
+def apply_valuation_deltas(deltas):
+    """
+    Add {user_id: [cost_delta, value_delta]} to the users' valuations:
+    one INSERT for users without a row, one UPDATE for all of them.
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+
+    PortfolioValuation.objects.bulk_create(
+        [PortfolioValuation(user_id=user_id) for user_id in deltas],
+        ignore_conflicts=True,
+    )
+    cost_delta = _delta_case(deltas, 0)
+    value_delta = _delta_case(deltas, 1)
+    PortfolioValuation.objects.filter(user_id__in=list(deltas)).update(
+        cost_basis=F('cost_basis') + cost_delta,
+        market_value=F('market_value') + value_delta,
+        unrealized_pnl=F('unrealized_pnl') + value_delta - cost_delta,
+    )
+
+
+def record_position_changes(market, changes):
+    """
+    Apply [(user_id, before_snapshot, after_snapshot), ...] for positions in
+    `market`, valued at its current price.
+    """
+    # Their positions (and so their profile stats) changed
+    invalidate_user_stats([user_id for user_id, _, _ in changes])
+    deltas = defaultdict(lambda: [ZERO, ZERO])
+    for user_id, before, after in changes:
+        cost_delta, value_delta = position_delta(before, after, market.yes_price)
+        deltas[user_id][0] += cost_delta
+        deltas[user_id][1] += value_delta
+    apply_valuation_deltas(deltas)
+
+
+def revalue_market(market, old_yes_price, new_yes_price):
+    """Move every holder's valuation to the market's new price (one UPDATE)."""
+    price_move = Decimal(str(new_yes_price)) - Decimal(str(old_yes_price))
+    if not price_move:
+        return
+
+    holdings = Position.objects.filter(market=market, user_id=OuterRef('user_id')).annotate(
+        value_move=(F('yes_shares') - F('no_shares')) * Value(price_move, output_field=VALUE_FIELD),
+    ).values('value_move')[:1]
+    PortfolioValuation.objects.filter(
+        user_id__in=Position.objects.filter(market=market).exclude(yes_shares=0, no_shares=0).values('user_id')
+    ).update(
+        market_value=F('market_value') + Subquery(holdings, output_field=VALUE_FIELD),
+        unrealized_pnl=F('unrealized_pnl') + Subquery(holdings, output_field=VALUE_FIELD),
+    )
+
+
+def rebuild_valuations(user_ids=None):
+    """Recompute valuations from positions and market prices (all users or `user_ids`)."""
+    positions = Position.objects.all()
+    valuations = PortfolioValuation.objects.all()
+    if user_ids is not None:
+        positions = positions.filter(user_id__in=user_ids)
+        valuations = valuations.filter(user_id__in=user_ids)
+
+    totals = {
+        row['user_id']: (row['cost'] or ZERO, row['value'] or ZERO)
+        for row in positions.values('user_id').annotate(
+            cost=Sum(F('yes_shares') * F('yes_avg_cost') + F('no_shares') * F('no_avg_cost'), output_field=VALUE_FIELD),
+            value=Sum(
+                F('yes_shares') * F('market__yes_price') + F('no_shares') * F('market__no_price'),
+                output_field=VALUE_FIELD,
+            ),
+        )
+    }
+    valuations.exclude(user_id__in=list(totals)).update(cost_basis=ZERO, market_value=ZERO, unrealized_pnl=ZERO)
+    PortfolioValuation.objects.bulk_create(
+        [
+            PortfolioValuation(user_id=user_id, cost_basis=cost, market_value=value, unrealized_pnl=value - cost)
+            for user_id, (cost, value) in totals.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['cost_basis', 'market_value', 'unrealized_pnl', 'updated_at'],
+        batch_size=1000,
+    )
+    return len(totals)
@@ -4,15 +4,27 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from collections import defaultdict
 from decimal import Decimal
 # Lazy import - only import when needed (after package is installed)
-from .models import Order, Trade, Position
-from .serializers import OrderSerializer, TradeSerializer, PositionSerializer
+from .models import Order, Trade, Position, MatchRequest, UserMarket
+from .serializers import OrderSerializer, TradeSerializer, PositionSerializer, UserMarketSerializer
 from markets.models import Market
 from .matching import match_orders
+from .cancellation import cancel_open_orders
+from .participation import record_participation
+from .sequencer import enqueue_match, matching_is_async
+from users.escrow import reserve_credits
+from users.ledger import credit_entry, record_credit_entries
+from users.models import round_credits
+from users.points import points_event, record_points_events
+from users.stats import invalidate_user_stats
+
+MAX_BATCH_ORDERS = 50
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -55,38 +67,69 @@ class OrderViewSet(viewsets.ModelViewSet):
             raise ValidationError({
                 'non_field_errors': [f'This market is {market_obj.status} and no longer accepting orders.']
             })
+        if market_obj and market_obj.end_date <= timezone.now():
+            # run_scheduler closes it shortly; don't take orders in the meantime
+            raise ValidationError({
+                'non_field_errors': ['This market has ended and is no longer accepting orders.']
+            })
 
         price = validated_data['price']
         quantity = validated_data['quantity']
         cost = price * quantity
         
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
+        user = self.request.user
         
         with transaction.atomic():
-            user = User.objects.select_for_update().get(pk=self.request.user.pk)
-            current_credits = user.credits
-            
-            if current_credits < cost:
-                raise ValidationError({
-                    'non_field_errors': [f'Insufficient credits. You have {float(current_credits):.2f}, need {float(cost):.2f}']
-                })
+            # Check and escrow in one conditional UPDATE, no SELECT ... FOR UPDATE
+            if not reserve_credits(user.pk, round_credits(cost), cost):
+                self._insufficient_credits(user, cost)
             
             order = serializer.save(user=user)
+            record_credit_entries([
+                credit_entry(user.pk, -round_credits(cost), 'order_escrow', order_id=order.pk, market_id=order.market_id)
+            ])
             
-            # Deduct credits and save
-            user.credits = max(Decimal('0.00'), user.credits - cost)
-            user.base_credits = user.credits
-            user.save(update_fields=['credits', 'base_credits'])
+            record_participation(user.pk, [(order.market_id, cost)])
             
             # Update market volume/liquidity
             market = order.market
             market.total_volume += cost
             market.total_liquidity += cost
             market.save(update_fields=['total_volume', 'total_liquidity'])
+            
+            # Throughput mode: acknowledge now, the matcher fills it later
+            if matching_is_async():
+                enqueue_match(order)
+        
+        self._record_trading_activity(user, cost, [order.id])
+        
+        if matching_is_async():
+            return
+        
+        try:
+            trades = match_orders(order)
+            if trades:
+                order.refresh_from_db()
+        except Exception as e:
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.error(f"Error matching order {order.id}: {str(e)}")
+    
+    def _insufficient_credits(self, user, cost):
+        from django.contrib.auth import get_user_model
+        available = get_user_model().objects.values_list('credits', flat=True).get(pk=user.pk)
+        raise ValidationError({
+            'non_field_errors': [f'Insufficient credits. You have {float(available):.2f}, need {float(cost):.2f}']
+        })
+    
+    def _record_trading_activity(self, user, volume, order_ids):
+        """
+        Leaderboard tracking — runs AFTER the core order(s) succeed.
+        Failures here are logged but never block the order.
+        """
+        import logging
+        logger = logging.getLogger(__name__)
         
-        # Leaderboard tracking — runs AFTER the core order succeeds.
-        # Failures here are logged but never block the order.
         try:
             from users.models import UserProfile
             # Refresh user from DB to avoid stale state after atomic block
@@ -95,31 +138,101 @@ class OrderViewSet(viewsets.ModelViewSet):
             profile, created = UserProfile.objects.get_or_create(user=user)
             logger.info(f"[Leaderboard] user={user.username} profile={'created' if created else 'exists'} vol={profile.total_volume_traded}")
             
-            profile.total_volume_traded = Decimal(str(profile.total_volume_traded)) + cost
+            profile.total_volume_traded = Decimal(str(profile.total_volume_traded)) + volume
             profile.save(update_fields=['total_volume_traded'])
             
-            markets_count = Order.objects.filter(
-                user=user
-            ).values('market').distinct().count()
-            logger.info(f"[Leaderboard] user={user.username} distinct_markets={markets_count}")
-            
-            user.total_markets_traded = markets_count
+            # total_markets_traded was bumped with the order(s) (see participation.py)
+            points_before = user.total_points
             user.total_points = user.calculate_points()
             logger.info(f"[Leaderboard] user={user.username} points={user.total_points} markets={user.total_markets_traded}")
             
-            user.save(update_fields=['total_markets_traded', 'total_points'])
+            user.save(update_fields=['total_points'])
+            record_points_events([points_event(user.pk, points_before, user.total_points, 'order')])
             logger.info(f"[Leaderboard] user={user.username} save OK")
         except Exception as e:
-            logger.error(f"Leaderboard update failed for order {order.id}: {e}", exc_info=True)
+            logger.error(f"Leaderboard update failed for order(s) {order_ids}: {e}", exc_info=True)
         
-        try:
-            trades = match_orders(order)
-            if trades:
-                order.refresh_from_db()
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error matching order {order.id}: {str(e)}")
+        # Credits, points and (if filled) positions changed
+        invalidate_user_stats([user.pk])
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Place up to MAX_BATCH_ORDERS orders in one request (e.g. market maker ladders).
+        
+        Body: {"orders": [<order>, ...]}. Every order is validated first, then
+        the total escrow is checked and deducted under a single user lock, the
+        orders are inserted with one bulk_create, and each market's orders are
+        matched in price order. Either all orders are placed or none are.
+        """
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        payload = request.data.get('orders') if isinstance(request.data, dict) else request.data
+        if not isinstance(payload, list) or not payload:
+            raise ValidationError({'orders': ['Provide a non-empty list of orders.']})
+        if len(payload) > MAX_BATCH_ORDERS:
+            raise ValidationError({'orders': [f'At most {MAX_BATCH_ORDERS} orders per batch.']})
+        
+        serializer = self.get_serializer(data=payload, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+        
+        now = timezone.now()
+        for market_obj in {item['market'].pk: item['market'] for item in items}.values():
+            if market_obj.status != 'open':
+                raise ValidationError({
+                    'non_field_errors': [f'Market {market_obj.slug} is {market_obj.status} and no longer accepting orders.']
+                })
+            if market_obj.end_date <= now:
+                raise ValidationError({
+                    'non_field_errors': [f'Market {market_obj.slug} has ended and is no longer accepting orders.']
+                })
+        
+        market_costs = defaultdict(Decimal)
+        for item in items:
+            market_costs[item['market'].pk] += item['price'] * item['quantity']
+        total_cost = sum(market_costs.values())
+        
+        charges = [round_credits(item['price'] * item['quantity']) for item in items]
+        user = request.user
+        
+        with transaction.atomic():
+            if not reserve_credits(user.pk, sum(charges), total_cost):
+                self._insufficient_credits(user, total_cost)
+            
+            orders = Order.objects.bulk_create([Order(user=user, **item) for item in items])
+            record_credit_entries([
+                credit_entry(user.pk, -charge, 'order_escrow', order_id=order.pk, market_id=order.market_id)
+                for order, charge in zip(orders, charges)
+            ])
+            
+            record_participation(user.pk, [(order.market_id, order.price * order.quantity) for order in orders])
+            
+            for market_id, cost in market_costs.items():
+                Market.objects.filter(pk=market_id).update(
+                    total_volume=F('total_volume') + cost,
+                    total_liquidity=F('total_liquidity') + cost,
+                )
+            
+            if matching_is_async():
+                MatchRequest.objects.bulk_create([
+                    MatchRequest(order=order, market_id=order.market_id) for order in orders
+                ])
+        
+        self._record_trading_activity(user, total_cost, [order.id for order in orders])
+        
+        if not matching_is_async():
+            for order in sorted(orders, key=lambda o: (o.market_id, o.price)):
+                try:
+                    match_orders(order)
+                except Exception as e:
+                    logger.error(f"Error matching order {order.id}: {str(e)}")
+        
+        return Response(
+            {'results': self.get_serializer(orders, many=True).data},
+            status=status.HTTP_201_CREATED,
+        )
     
     @action(detail=False, methods=['get'])
     def open(self, request):
@@ -138,20 +251,39 @@ class OrderViewSet(viewsets.ModelViewSet):
         if order.status not in ['pending', 'partial']:
             return Response({'error': 'Order cannot be cancelled'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Refund credits for unfilled portion
-        unfilled = order.quantity - order.filled_quantity
-        if unfilled > 0:
-            refund = unfilled * order.price
-            order.user.update_credits_from_trade(refund)
-            # Reduce market volume/liquidity by unfilled amount
-            market = order.market
-            market.total_volume = max(0, market.total_volume - refund)
-            market.total_liquidity = max(0, market.total_liquidity - refund)
-            market.save(update_fields=['total_volume', 'total_liquidity'])
-        
-        order.status = 'cancelled'
-        order.save()
+        result = cancel_open_orders(Order.objects.filter(pk=order.pk))
+        if not result['cancelled']:
+            return Response({'error': 'Order cannot be cancelled'}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'status': 'Order cancelled'})
+    
+    @action(detail=False, methods=['post'], url_path='cancel-all')
+    def cancel_all(self, request):
+        """
+        Cancel all of the user's open orders, optionally only those in one
+        market (`market`) and/or on one side (`side`).
+        
+        Costs a fixed number of queries per market however many orders are
+        cancelled (see cancellation.cancel_open_orders).
+        """
+        params = request.data if hasattr(request.data, 'get') else {}
+        market_id = params.get('market') or request.query_params.get('market')
+        side = params.get('side') or request.query_params.get('side')
+        
+        orders = self.get_queryset()
+        if market_id:
+            if not str(market_id).isdigit():
+                raise ValidationError({'market': ['Market must be a market id.']})
+            orders = orders.filter(market_id=market_id)
+        if side:
+            if side not in dict(Order.SIDE_CHOICES):
+                raise ValidationError({'side': ['Side must be "yes" or "no".']})
+            orders = orders.filter(side=side)
+        
+        result = cancel_open_orders(orders)
+        return Response({
+            'cancelled': result['cancelled'],
+            'refunded': str(result['refunded']),
+        })
 
 
 class TradeViewSet(viewsets.ReadOnlyModelViewSet):
@@ -178,4 +310,10 @@ class PositionViewSet(viewsets.ReadOnlyModelViewSet):
         return Position.objects.filter(user=self.request.user)
 
 
-
+class UserMarketViewSet(viewsets.ReadOnlyModelViewSet):
+    """Markets the user has placed orders in, most recently traded first."""
+    serializer_class = UserMarketSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return UserMarket.objects.filter(user=self.request.user).select_related('market').order_by('-last_order_at')
@@ -1,16 +1,32 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, UserProfile
+from django.db import transaction
+from .ledger import record_credit_change
+from .models import (
+    CreditEntry,
+    CreditSnapshot,
+    LeaderboardRank,
+    PointsEvent,
+    PointsWindow,
+    PointsWindowEntry,
+    RankHistory,
+    User,
+    UserProfile,
+)
+from .stats import invalidate_user_stats
 
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ['username', 'email', 'credits', 'current_credits_display', 'is_staff', 'date_joined']
     list_filter = ['is_staff', 'is_superuser', 'date_joined']
-    readonly_fields = ['current_credits_display', 'last_activity_at']
+    readonly_fields = ['current_credits_display', 'reserved_credits', 'last_activity_at']
     fieldsets = BaseUserAdmin.fieldsets + (
         ('Practice Credits', {
-            'fields': ('credits', 'current_credits_display', 'base_credits', 'max_credits', 'last_activity_at'),
+            'fields': (
+                'credits', 'current_credits_display', 'reserved_credits', 'base_credits', 'max_credits',
+                'last_activity_at',
+            ),
             'description': 'Practice credits system (not real money)'
         }),
     )
@@ -19,6 +35,19 @@ class UserAdmin(BaseUserAdmin):
         """Display current credits after decay/regeneration calculation."""
         return f"{obj.get_current_credits():.2f}"
     current_credits_display.short_description = 'Current Credits'
+    
+    def save_model(self, request, obj, form, change):
+        """Balance edits made here go through the credit ledger as adjustments."""
+        if not change:
+            return super().save_model(request, obj, form, change)
+        with transaction.atomic():
+            stored = User.objects.select_for_update().values('credits', 'reserved_credits').get(pk=obj.pk)
+            # Reserved credits only move with orders; don't write back a stale copy
+            obj.reserved_credits = stored['reserved_credits']
+            super().save_model(request, obj, form, change)
+            if 'credits' in form.changed_data:
+                record_credit_change(obj.pk, stored['credits'], obj.credits, 'adjustment')
+            invalidate_user_stats([obj.pk])
 
 
 @admin.register(UserProfile)
@@ -28,3 +57,81 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 
 
+
+
+@admin.register(CreditEntry)
+class CreditEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'delta', 'reason', 'market', 'order', 'trade', 'created_at']
+    list_filter = ['reason', 'period']
+    search_fields = ['user__username']
+    raw_id_fields = ['user', 'order', 'trade', 'market']
+    
+    # Append-only: entries are written with the balance changes they record
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CreditSnapshot)
+class CreditSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['user', 'balance', 'last_entry_id', 'created_at']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+
+
+@admin.register(LeaderboardRank)
+class LeaderboardRankAdmin(admin.ModelAdmin):
+    list_display = ['user', 'all_time_rank', 'weekly_rank', 'monthly_rank', 'refreshed_at']
+    ordering = ['all_time_position']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+
+
+@admin.register(PointsEvent)
+class PointsEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'delta', 'reason', 'market', 'created_at']
+    list_filter = ['reason']
+    search_fields = ['user__username']
+    raw_id_fields = ['user', 'market']
+    
+    # Append-only, like the credit ledger
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class PointsWindowEntryInline(admin.TabularInline):
+    model = PointsWindowEntry
+    fields = ['rank', 'user', 'points']
+    readonly_fields = fields
+    ordering = ['rank']
+    extra = 0
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PointsWindow)
+class PointsWindowAdmin(admin.ModelAdmin):
+    list_display = ['window', 'period_start', 'period_end', 'rolled_at']
+    list_filter = ['window']
+    inlines = [PointsWindowEntryInline]
+
+
+@admin.register(RankHistory)
+class RankHistoryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'rank', 'points', 'accuracy', 'roi']
+    list_filter = ['day']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
@@ -0,0 +1,54 @@
+"""
+Order Escrow
+
+Placing an order locks its cost (quantity * limit price): the amount moves
+from User.credits (available) to User.reserved_credits (locked), and stays
+there until the order
+- fills: the filled part is spent and leaves reserved_credits
+- is cancelled, swept or expires unfilled: the unfilled part goes back to
+  credits
+
+so reserved_credits always equals the escrow of the user's open orders
+(reconcile_credits checks this). Both balances change with F() updates in
+the statement that touches the user's row anyway, so reading available /
+locked credits is a single-row read.
+
+Credits are stored to the cent, reserved credits exactly: the available
+balance is charged the escrow rounded to the cent.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Value, When
+
+from .models import User
+
+ZERO = Decimal('0')
+RESERVED_FIELD = DecimalField(max_digits=26, decimal_places=6)
+
+
+def reserve_credits(user_id, charge, escrow):
+    """
+    Take `charge` from a user's credits and lock `escrow` in their reserved
+    credits if they can afford it: one conditional UPDATE (no SELECT ... FOR
+    UPDATE), whose row lock is held for the rest of the transaction.
+    Returns False, changing nothing, on insufficient credits.
+    """
+    return bool(User.objects.filter(pk=user_id, credits__gte=charge).update(
+        credits=F('credits') - charge,
+        base_credits=F('credits') - charge,
+        reserved_credits=F('reserved_credits') + escrow,
+    ))
+
+
+def release_reserved_credits(releases):
+    """Unlock {user_id: amount} of reserved credits (spent on fills) in one UPDATE."""
+    releases = {user_id: amount for user_id, amount in releases.items() if amount}
+    if not releases:
+        return
+    User.objects.filter(pk__in=list(releases)).update(
+        reserved_credits=F('reserved_credits') - Case(
+            *[When(pk=user_id, then=Value(amount)) for user_id, amount in releases.items()],
+            default=Value(ZERO),
+            output_field=RESERVED_FIELD,
+        ),
+    )
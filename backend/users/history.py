@@ -0,0 +1,102 @@
+"""
+Rank History
+
+snapshot_leaderboard() stores one RankHistory row per trader for the current
+(local) day: their all-time rank, points, accuracy and ROI, from a single
+window pass over the users written back with chunked bulk_create (an upsert,
+so re-running it the same day refreshes the day's rows).
+
+run_scheduler takes the snapshot each night at local midnight. Each run
+also thins days older than RANK_HISTORY_DAILY_DAYS to one per week (the
+latest snapshot of each Monday-to-Sunday week), so a user's history stays
+small however long they trade.
+
+Profile pages read a user's history with one range scan of the
+(user, day) index.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Window
+from django.db.models.functions import Rank
+from django.utils import timezone
+
+from .leaderboard import ranked_users
+from .models import RankHistory
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CHUNK_SIZE = 5000
+HISTORY_FIELDS = ['rank', 'points', 'accuracy', 'roi']
+
+_last_snapshot_day = None
+
+
+def _upsert(rows):
+    if rows:
+        RankHistory.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'day'],
+            update_fields=HISTORY_FIELDS,
+        )
+    return len(rows)
+
+
+def downsample_history(today):
+    """Keep one snapshot per week for days before the daily window. Returns the number of rows deleted."""
+    cutoff = today - timedelta(days=settings.RANK_HISTORY_DAILY_DAYS)
+    old_days = list(RankHistory.objects.filter(day__lt=cutoff).order_by().values_list('day', flat=True).distinct())
+
+    latest_in_week = {}
+    for day in old_days:
+        week = day - timedelta(days=day.weekday())
+        latest_in_week[week] = max(day, latest_in_week.get(week, day))
+    keep = set(latest_in_week.values())
+    drop = [day for day in old_days if day not in keep]
+    if not drop:
+        return 0
+    deleted, _ = RankHistory.objects.filter(day__in=drop).delete()
+    return deleted
+
+
+def snapshot_leaderboard(now=None, chunk_size=HISTORY_CHUNK_SIZE):
+    """Snapshot every trader for today and downsample old days. Returns the number of rows written."""
+    global _last_snapshot_day
+    today = timezone.localdate(now or timezone.now())
+    rows = ranked_users().annotate(
+        rank=Window(Rank(), order_by=F('total_points').desc()),
+    ).order_by().values_list(
+        'pk', 'rank', 'total_points', 'accuracy_percentage', 'roi_percentage',
+    ).iterator(chunk_size=chunk_size)
+
+    written = 0
+    with transaction.atomic():
+        chunk = []
+        for user_id, rank, points, accuracy, roi in rows:
+            chunk.append(RankHistory(user_id=user_id, day=today, rank=rank, points=points, accuracy=accuracy, roi=roi))
+            if len(chunk) == chunk_size:
+                written += _upsert(chunk)
+                chunk = []
+        written += _upsert(chunk)
+        deleted = downsample_history(today)
+    logger.info(f"[rank history] {today}: {written} snapshot(s), {deleted} old row(s) thinned out")
+    _last_snapshot_day = today
+    return written
+
+
+def next_leaderboard_snapshot():
+    """When run_scheduler should snapshot next: local midnight after the last snapshot day."""
+    last_day = _last_snapshot_day or RankHistory.objects.aggregate(day=Max('day'))['day']
+    day = last_day + timedelta(days=1) if last_day else timezone.localdate()
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def user_history(user_id, since=None):
+    """A user's snapshots from `since` on, oldest first: one range scan of the (user, day) index."""
+    history = RankHistory.objects.filter(user_id=user_id)
+    if since is not None:
+        history = history.filter(day__gte=since)
+    return history.order_by('day').values('day', *HISTORY_FIELDS)
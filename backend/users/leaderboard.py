@@ -0,0 +1,180 @@
+"""
+Leaderboard Ranks
+
+LeaderboardRank holds every trader's (total_markets_traded > 0) place on
+the all-time, weekly and monthly boards, so pages and rank lookups read one
+indexed table instead of counting users per row.
+
+refresh_leaderboard_ranks() recomputes the whole table in a single window
+pass over the users:
+- *_rank     = RANK() OVER (ORDER BY points DESC); ties share a rank, as the
+               live COUNT(points > mine) + 1 did
+- *_position = ROW_NUMBER() OVER the board's page ordering (points, then
+               markets traded, accuracy and id)
+
+and upserts the rows in chunks inside one transaction, so readers see the
+old table or the new one. run_scheduler refreshes it every
+LEADERBOARD_REFRESH_SECONDS; users who started trading since the last
+refresh fall back to a live COUNT, and board pages merge them in by their
+current points.
+
+around_user() lists a user's neighbours on the all-time board by seeking
+from their (points, markets traded, accuracy, id) key along the matching
+index, so it costs the same at any rank.
+"""
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import Rank, RowNumber
+from django.utils import timezone
+
+from .models import LeaderboardRank, User
+
+# board -> points field it ranks by
+BOARDS = {
+    'all_time': 'total_points',
+    'weekly': 'weekly_points',
+    'monthly': 'monthly_points',
+}
+RANK_CHUNK_SIZE = 5000
+
+_last_refresh = None
+
+
+def board_ordering(board):
+    """The order a board's pages list users in."""
+    return [
+        F(BOARDS[board]).desc(),
+        F('total_markets_traded').desc(),
+        F('accuracy_percentage').desc(),
+        F('pk').asc(),
+    ]
+
+
+def ranked_users():
+    """Users who appear on the leaderboards."""
+    return User.objects.filter(total_markets_traded__gt=0)
+
+
+def board_page(board, limit=100):
+    """
+    The top `limit` users of a board (ranks attached): the rank table's page,
+    with users who aren't in it yet merged in at their current points (their
+    rank falls back to user_rank's live COUNT). Two indexed queries.
+    """
+    ranked = (
+        ranked_users()
+        .filter(leaderboard_rank__isnull=False)
+        .select_related('leaderboard_rank')
+        .order_by(f'leaderboard_rank__{board}_position')[:limit]
+    )
+    unranked = ranked_users().filter(leaderboard_rank__isnull=True).order_by(*board_ordering(board))[:limit]
+    points = BOARDS[board]
+
+    def key(user):
+        return (-getattr(user, points), -user.total_markets_traded, -user.accuracy_percentage, user.pk)
+
+    return list(heapq.merge(ranked, unranked, key=key))[:limit]
+
+
+def _seek(user, board, after):
+    """
+    Users listed after (or before) `user` on a board: the keyset predicate of
+    board_ordering, ANDed with a redundant bound on the points column so the
+    planner can start a range scan of the board index instead of filtering
+    every row through the OR.
+    """
+    past, pk_past = ('lt', 'gt') if after else ('gt', 'lt')
+    points = BOARDS[board]
+    key = [(points, past), ('total_markets_traded', past), ('accuracy_percentage', past), ('pk', pk_past)]
+    predicate = None
+    for field, lookup in reversed(key):
+        value = getattr(user, field)
+        step = Q(**{f'{field}__{lookup}': value})
+        if predicate is not None:
+            step |= Q(**{field: value}) & predicate
+        predicate = step
+    return Q(**{f'{points}__{past}e': getattr(user, points)}) & predicate
+
+
+def around_user(user, board='all_time', size=5):
+    """
+    The `size` users listed before `user` on a board, the user and the
+    `size` after, in board order (ranks attached): two index seeks. Users
+    who aren't on the board get its last `size`.
+    """
+    ordering = board_ordering(board)
+    users = ranked_users().select_related('leaderboard_rank')
+    reverse = [field.copy().reverse_ordering() for field in ordering]
+    if user.total_markets_traded <= 0:
+        # Not on the board: they sit below its last users
+        return list(users.order_by(*reverse)[:size])[::-1]
+    above = list(users.filter(_seek(user, board, after=False)).order_by(*reverse)[:size])
+    below = list(users.filter(_seek(user, board, after=True)).order_by(*ordering)[:size])
+    return above[::-1] + [user] + below
+
+
+def board_size():
+    """How many users the rank table lists (as of its last refresh): one index lookup."""
+    return LeaderboardRank.objects.order_by('-all_time_position').values_list('all_time_position', flat=True).first() or 0
+
+
+def user_rank(user, board='all_time'):
+    """A user's rank on a board, from the rank table (live COUNT if not ranked yet)."""
+    if user.total_markets_traded <= 0:
+        return None
+    entry = getattr(user, 'leaderboard_rank', None)
+    if entry is not None:
+        return getattr(entry, f'{board}_rank')
+    points_field = BOARDS[board]
+    return ranked_users().filter(**{f'{points_field}__gt': getattr(user, points_field)}).count() + 1
+
+
+def refresh_leaderboard_ranks(now=None, chunk_size=RANK_CHUNK_SIZE):
+    """Recompute the rank table (see module docstring). Returns the number of ranked users."""
+    global _last_refresh
+    now = now or timezone.now()
+
+    windows = {}
+    for board, points_field in BOARDS.items():
+        windows[f'{board}_rank'] = Window(Rank(), order_by=F(points_field).desc())
+        windows[f'{board}_position'] = Window(RowNumber(), order_by=board_ordering(board))
+    fields = list(windows)
+    rows = ranked_users().annotate(**windows).order_by().values_list('pk', *fields).iterator(chunk_size=chunk_size)
+
+    ranked = 0
+    with transaction.atomic():
+        chunk = []
+        for row in rows:
+            chunk.append(LeaderboardRank(user_id=row[0], refreshed_at=now, **dict(zip(fields, row[1:]))))
+            if len(chunk) == chunk_size:
+                ranked += _upsert_ranks(chunk, fields)
+                chunk = []
+        ranked += _upsert_ranks(chunk, fields)
+        # Whoever wasn't ranked this time has dropped off the boards
+        LeaderboardRank.objects.filter(refreshed_at__lt=now).delete()
+
+    _last_refresh = now
+    return ranked
+
+
+def _upsert_ranks(entries, fields):
+    if entries:
+        LeaderboardRank.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=fields + ['refreshed_at'],
+        )
+    return len(entries)
+
+
+def next_rank_refresh():
+    """When run_scheduler should refresh the ranks next (right away in a new scheduler process)."""
+    interval = timedelta(seconds=settings.LEADERBOARD_REFRESH_SECONDS)
+    if _last_refresh is None:
+        return timezone.now() - interval
+    return _last_refresh + interval
@@ -0,0 +1,157 @@
+"""
+Credit Ledger
+
+Every change to User.credits is also appended to CreditEntry, in the same
+transaction as the balance update:
+- order placement escrows the cost ('order_escrow'); cancels, sweeps and
+  unfilled IOC/AMM remainders refund it ('order_refund')
+- fills between users ('trade'), the AMM house's takings ('amm_fill'),
+  settlement payouts ('settlement') and admin edits ('adjustment')
+
+Entries hold the change of the stored (cent-rounded) balance, so a user's
+credits always equal their latest CreditSnapshot plus the deltas of the
+entries after it. Users without a snapshot replay from the opening balance
+new accounts get. take_snapshots() compacts the ledger so a replay only reads
+the entries since the last snapshot.
+
+Entries are written while the user's row is locked for the balance update,
+so one user's entries commit in id order and a snapshot taken mid-trading
+never skips an entry that commits later.
+
+Rows are never updated and every entry carries the month it was written in
+(`period`), so on Postgres the table can be range-partitioned by period and
+old months detached / archived without touching the live balance path.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CreditEntry, CreditSnapshot, User, round_credits
+
+ZERO = Decimal('0.00')
+SNAPSHOT_CHUNK_SIZE = 1000
+
+
+def ledger_period(when=None):
+    """The partition key of an entry written at `when`: the first day of its local month."""
+    return timezone.localtime(when or timezone.now()).date().replace(day=1)
+
+
+def opening_balance():
+    """What a new account starts with (the replay base for users without a snapshot)."""
+    return round_credits(User._meta.get_field('credits').default)
+
+
+def credit_entry(user_id, delta, reason, now=None, **refs):
+    """An unsaved entry; `refs` are any of order_id, trade_id and market_id."""
+    now = now or timezone.now()
+    return CreditEntry(user_id=user_id, delta=delta, reason=reason, period=ledger_period(now), created_at=now, **refs)
+
+
+def balance_entry(user_id, before, after, reason, now=None, **refs):
+    """The entry for a balance going from `before` to `after` (None if it didn't move)."""
+    delta = round_credits(after) - round_credits(before)
+    if not delta:
+        return None
+    return credit_entry(user_id, delta, reason, now=now, **refs)
+
+
+def record_credit_entries(entries):
+    """Append entries (Nones are skipped) with one INSERT per batch."""
+    entries = [entry for entry in entries if entry is not None]
+    if entries:
+        CreditEntry.objects.bulk_create(entries, batch_size=1000)
+    return entries
+
+
+def record_credit_change(user_id, before, after, reason, **refs):
+    return record_credit_entries([balance_entry(user_id, before, after, reason, **refs)])
+
+
+def _latest_snapshot(field, user_ref='user_id'):
+    """Subquery of `field` from the latest snapshot of the outer row's user."""
+    return Subquery(
+        CreditSnapshot.objects.filter(user_id=OuterRef(user_ref))
+        .order_by('-last_entry_id', '-id')
+        .values(field)[:1]
+    )
+
+
+def replay_balance(user_id):
+    """Rebuild one user's balance from the ledger: two indexed queries."""
+    snapshot = CreditSnapshot.objects.filter(user_id=user_id).order_by('-last_entry_id', '-id').first()
+    base, after_id = (snapshot.balance, snapshot.last_entry_id) if snapshot else (opening_balance(), 0)
+    replayed = CreditEntry.objects.filter(user_id=user_id, id__gt=after_id).aggregate(total=Sum('delta'))['total']
+    return round_credits(base + (replayed or ZERO))
+
+
+def replay_balances(user_ids):
+    """
+    Rebuild several users' balances: {user_id: (balance, last_entry_id)}.
+    Two queries however many users: the latest snapshots, then the entries
+    after each user's snapshot summed per user.
+    """
+    user_ids = list(user_ids)
+    snapshots = {
+        row['pk']: (row['snapshot_balance'], row['snapshot_entry_id'])
+        for row in User.objects.filter(pk__in=user_ids).annotate(
+            snapshot_balance=_latest_snapshot('balance', 'pk'),
+            snapshot_entry_id=_latest_snapshot('last_entry_id', 'pk'),
+        ).values('pk', 'snapshot_balance', 'snapshot_entry_id')
+        if row['snapshot_entry_id'] is not None
+    }
+    replayed = {
+        row['user_id']: (row['total'], row['last_id'])
+        for row in CreditEntry.objects.filter(user_id__in=user_ids)
+        .alias(after_id=Coalesce(_latest_snapshot('last_entry_id'), Value(0)))
+        .filter(id__gt=F('after_id'))
+        .values('user_id')
+        .annotate(total=Sum('delta'), last_id=Max('id'))
+    }
+
+    opening = opening_balance()
+    balances = {}
+    for user_id in user_ids:
+        base, after_id = snapshots.get(user_id, (opening, 0))
+        total, last_id = replayed.get(user_id, (ZERO, after_id))
+        balances[user_id] = (round_credits(base + total), last_id)
+    return balances
+
+
+def take_snapshots(user_ids=None, chunk_size=SNAPSHOT_CHUNK_SIZE):
+    """
+    Snapshot the replayed balance of every user (or `user_ids`) that has
+    entries since their last snapshot, `chunk_size` users at a time (five
+    queries per chunk). Snapshots only read the ledger, so this runs
+    alongside trading. Returns the number of snapshots written.
+    """
+    users = User.objects.order_by('pk')
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+
+    written = 0
+    after_pk = 0
+    while True:
+        chunk = list(users.filter(pk__gt=after_pk).values_list('pk', flat=True)[:chunk_size])
+        if not chunk:
+            return written
+        after_pk = chunk[-1]
+
+        new_snapshots = []
+        for user_id, (balance, last_entry_id) in replay_balances(chunk).items():
+            if last_entry_id:
+                new_snapshots.append(CreditSnapshot(user_id=user_id, balance=balance, last_entry_id=last_entry_id))
+        with transaction.atomic():
+            # Users whose snapshot is already current have nothing to compact
+            current = set(
+                CreditSnapshot.objects.filter(
+                    user_id__in=[snapshot.user_id for snapshot in new_snapshots],
+                    last_entry_id__in=[snapshot.last_entry_id for snapshot in new_snapshots],
+                ).values_list('user_id', 'last_entry_id')
+            )
+            new_snapshots = [s for s in new_snapshots if (s.user_id, s.last_entry_id) not in current]
+            CreditSnapshot.objects.bulk_create(new_snapshots)
+        written += len(new_snapshots)
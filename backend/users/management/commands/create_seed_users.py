@@ -13,7 +13,10 @@ from django.utils import timezone
 
 from markets.models import Market
 from trading.models import Order
-from users.models import UserProfile
+from trading.participation import record_participation
+from users.ledger import record_credit_change
+from users.models import UserProfile, round_credits
+from users.points import points_event, record_points_events
 
 User = get_user_model()
 
@@ -114,15 +117,20 @@ class Command(BaseCommand):
                     market=market,
                     user=user,
                     side=side,
-                    order_type='market',
+                    order_type='limit',
                     price=price,
                     quantity=quantity,
                     status='pending',
                 )
 
-                user.credits = max(Decimal('0.00'), user.credits - cost)
+                before = user.credits
+                user.credits = round_credits(max(Decimal('0.00'), user.credits - cost))
                 user.base_credits = user.credits
-                user.save(update_fields=['credits', 'base_credits'])
+                user.reserved_credits += cost
+                user.save(update_fields=['credits', 'base_credits', 'reserved_credits'])
+                record_credit_change(
+                    user.pk, before, user.credits, 'order_escrow', order_id=order.pk, market_id=market.pk
+                )
 
                 market.total_volume += cost
                 market.total_liquidity += cost
@@ -132,11 +140,11 @@ class Command(BaseCommand):
                 profile.total_volume_traded = Decimal(str(profile.total_volume_traded)) + cost
                 profile.save(update_fields=['total_volume_traded'])
 
-                user.total_markets_traded = Order.objects.filter(
-                    user=user
-                ).values('market').distinct().count()
+                user.total_markets_traded += record_participation(user.pk, [(market.pk, cost)])
+                points_before = user.total_points
                 user.total_points = user.calculate_points()
-                user.save(update_fields=['total_markets_traded', 'total_points'])
+                user.save(update_fields=['total_points'])
+                record_points_events([points_event(user.pk, points_before, user.total_points, 'order', market.pk)])
 
                 total_orders += 1
                 self.stdout.write(
@@ -0,0 +1,98 @@
+"""
+Check every user's stored credits against the balance their orders, fills,
+payouts and adjustments add up to, and their reserved credits against their
+open orders' escrow (see users/reconciliation.py):
+
+    python manage.py reconcile_credits
+    python manage.py reconcile_credits --csv /var/log/panra/drift.csv --fail-on-drift   # nightly
+    python manage.py reconcile_credits --fix-reserved   # reset drifted reserved credits
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.reconciliation import RECONCILE_CHUNK_SIZE, reconcile_credits, repair_reserved_credits
+
+CSV_FIELDS = ['user_id', 'username', 'stored', 'expected', 'drift', 'reserved', 'expected_reserved']
+
+
+class Command(BaseCommand):
+    help = 'Diff stored credits against the balances recomputed from trading activity.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=RECONCILE_CHUNK_SIZE,
+            help=f'Users per batch of aggregate queries (default {RECONCILE_CHUNK_SIZE}).',
+        )
+        parser.add_argument(
+            '--tolerance',
+            default='0',
+            help='Drift ignored on top of the per-user rounding slack (default 0).',
+        )
+        parser.add_argument('--show', type=int, default=20, help='How many of the largest drifts to list (default 20).')
+        parser.add_argument('--csv', dest='csv_path', help='Write every drifted user to this CSV file.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+        parser.add_argument('--fail-on-drift', action='store_true', help='Exit with an error if any user drifted.')
+        parser.add_argument(
+            '--fix-reserved',
+            action='store_true',
+            help="Reset drifted reserved credits to their open orders' escrow.",
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        try:
+            tolerance = Decimal(options['tolerance'])
+        except InvalidOperation:
+            raise CommandError(f"Invalid --tolerance: {options['tolerance']}")
+
+        csv_file = writer = None
+        if options['csv_path']:
+            csv_file = open(options['csv_path'], 'w', newline='')
+            writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+
+        started = time.monotonic()
+        try:
+            summary = reconcile_credits(
+                chunk_size=options['chunk_size'],
+                tolerance=tolerance,
+                on_drift=writer.writerow if writer else None,
+                worst=options['show'],
+            )
+        finally:
+            if csv_file:
+                csv_file.close()
+        summary['seconds'] = round(time.monotonic() - started, 3)
+        drifted_ids = summary.pop('reserved_drifted_ids')
+        if options['fix_reserved'] and drifted_ids:
+            summary['reserved_repaired'] = repair_reserved_credits(drifted_ids)
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, default=str, indent=2))
+        else:
+            self.stdout.write(
+                f"Checked {summary['users']} user(s) in {summary['seconds']}s: "
+                f"{summary['drifted']} drifted, total drift {summary['total_drift']:.2f}, "
+                f"net {summary['net_drift']:+.2f}; {summary['reserved_drifted']} with reserved credits "
+                f"off their open orders' escrow"
+            )
+            if 'reserved_repaired' in summary:
+                self.stdout.write(f"Repaired reserved credits of {summary['reserved_repaired']} user(s).")
+            for row in summary['worst']:
+                self.stdout.write(
+                    f"  {row['username']} (#{row['user_id']}): stored {row['stored']}, "
+                    f"expected {row['expected']:.2f}, drift {row['drift']:+.2f}"
+                )
+
+        drifted = summary['drifted'] + summary['reserved_drifted']
+        if drifted and options['fail_on_drift']:
+            raise CommandError(f"{summary['drifted']} balance / {summary['reserved_drifted']} reserved drift(s).")
+        if not drifted and not options['json']:
+            self.stdout.write(self.style.SUCCESS('All balances reconcile.'))
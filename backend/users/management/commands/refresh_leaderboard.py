@@ -0,0 +1,22 @@
+"""
+Recompute the leaderboard rank table now (run_scheduler also does this every
+LEADERBOARD_REFRESH_SECONDS):
+
+    python manage.py refresh_leaderboard
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.leaderboard import refresh_leaderboard_ranks
+
+
+class Command(BaseCommand):
+    help = 'Recompute all-time, weekly and monthly leaderboard ranks.'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        ranked = refresh_leaderboard_ranks()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ranked {ranked} user(s) in {time.monotonic() - started:.2f}s.'
+        ))
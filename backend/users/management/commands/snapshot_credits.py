@@ -0,0 +1,37 @@
+"""
+Snapshot replayed credit balances (see users/ledger.py) so later replays
+only read the ledger entries written since:
+
+    python manage.py snapshot_credits
+    python manage.py snapshot_credits --user alice
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from users.ledger import SNAPSHOT_CHUNK_SIZE, take_snapshots
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Snapshot credit balances from the ledger for users with new entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='Only this user (repeatable).')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=SNAPSHOT_CHUNK_SIZE,
+            help=f'Users replayed per batch (default {SNAPSHOT_CHUNK_SIZE}).',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(User.objects.filter(username__in=options['usernames']).values_list('pk', flat=True))
+            if not user_ids:
+                raise CommandError('No matching users.')
+
+        written = take_snapshots(user_ids=user_ids, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} credit snapshot(s).'))
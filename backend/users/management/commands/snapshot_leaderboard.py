@@ -0,0 +1,32 @@
+"""
+Snapshot every trader's rank, points, accuracy and ROI for today and thin
+out old days (run_scheduler does this each night at midnight):
+
+    python manage.py snapshot_leaderboard
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.history import HISTORY_CHUNK_SIZE, snapshot_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Store today's leaderboard rank history snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=HISTORY_CHUNK_SIZE,
+            help=f'Rows per bulk insert (default {HISTORY_CHUNK_SIZE}).',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        started = time.monotonic()
+        written = snapshot_leaderboard(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {written} snapshot(s) in {time.monotonic() - started:.2f}s.'
+        ))
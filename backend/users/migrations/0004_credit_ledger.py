@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def snapshot_opening_balances(apps, schema_editor):
+    """Start every existing user's ledger from their current balance."""
+    User = apps.get_model('users', 'User')
+    CreditSnapshot = apps.get_model('users', 'CreditSnapshot')
+    CreditSnapshot.objects.bulk_create(
+        [
+            CreditSnapshot(user_id=user_id, balance=credits, last_entry_id=0)
+            for user_id, credits in User.objects.values_list('pk', 'credits').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0008_scheduler'),
+        ('trading', '0006_portfolio_valuation'),
+        ('users', '0003_user_accuracy_percentage_user_best_win_streak_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('delta', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('reason', models.CharField(choices=[('order_escrow', 'Order escrow'), ('order_refund', 'Order refund'), ('trade', 'Trade'), ('amm_fill', 'AMM fill'), ('settlement', 'Settlement payout'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('period', models.DateField(help_text="First day of the (local) month of the entry; the ledger's partition key")),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('market', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='markets.market')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='trading.order')),
+                ('trade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='trading.trade')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'credit entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['user', 'id'], name='users_credi_user_id_7b0466_idx'), models.Index(fields=['period'], name='users_credi_period_00e2fe_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CreditSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_entry_id'], name='users_credi_user_id_126282_idx')],
+            },
+        ),
+        migrations.RunPython(snapshot_opening_balances, migrations.RunPython.noop),
+    ]
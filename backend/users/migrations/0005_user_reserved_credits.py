@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:18
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+
+def backfill_reserved_credits(apps, schema_editor):
+    """Lock the escrow of every open order."""
+    User = apps.get_model('users', 'User')
+    Order = apps.get_model('trading', 'Order')
+    rows = Order.objects.filter(status__in=['pending', 'partial']).order_by().values('user_id').annotate(
+        escrow=Sum((F('quantity') - F('filled_quantity')) * F('price'), output_field=DecimalField(max_digits=26, decimal_places=6)),
+    )
+    for row in rows:
+        User.objects.filter(pk=row['user_id']).update(reserved_credits=row['escrow'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0006_portfolio_valuation'),
+        ('users', '0004_credit_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='reserved_credits',
+            field=models.DecimalField(decimal_places=6, default=Decimal('0'), help_text='Credits locked in open orders (unfilled quantity * limit price)', max_digits=26),
+        ),
+        migrations.RunPython(backfill_reserved_credits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import Rank, RowNumber
+from django.utils import timezone
+
+
+def rank_traders(apps, schema_editor):
+    """Fill the rank table once; run_scheduler keeps it fresh from here."""
+    User = apps.get_model('users', 'User')
+    LeaderboardRank = apps.get_model('users', 'LeaderboardRank')
+
+    windows = {}
+    for board, points in (('all_time', 'total_points'), ('weekly', 'weekly_points'), ('monthly', 'monthly_points')):
+        windows[f'{board}_rank'] = Window(Rank(), order_by=F(points).desc())
+        windows[f'{board}_position'] = Window(RowNumber(), order_by=[
+            F(points).desc(), F('total_markets_traded').desc(), F('accuracy_percentage').desc(), F('pk').asc(),
+        ])
+    now = timezone.now()
+    rows = User.objects.filter(total_markets_traded__gt=0).annotate(**windows).values_list('pk', *windows)
+    LeaderboardRank.objects.bulk_create(
+        [LeaderboardRank(user_id=row[0], refreshed_at=now, **dict(zip(windows, row[1:]))) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_reserved_credits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('all_time_rank', models.PositiveIntegerField()),
+                ('all_time_position', models.PositiveIntegerField()),
+                ('weekly_rank', models.PositiveIntegerField()),
+                ('weekly_position', models.PositiveIntegerField()),
+                ('monthly_rank', models.PositiveIntegerField()),
+                ('monthly_position', models.PositiveIntegerField()),
+                ('refreshed_at', models.DateTimeField()),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_rank', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['all_time_position'], name='users_leade_all_tim_312953_idx'), models.Index(fields=['weekly_position'], name='users_leade_weekly__468394_idx'), models.Index(fields=['monthly_position'], name='users_leade_monthly_68688e_idx')],
+            },
+        ),
+        migrations.RunPython(rank_traders, migrations.RunPython.noop),
+    ]
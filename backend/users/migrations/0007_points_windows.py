@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0008_scheduler'),
+        ('users', '0006_leaderboard_rank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('period_end', models.DateTimeField()),
+                ('rolled_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'constraints': [models.UniqueConstraint(fields=('window', 'period_start'), name='unique_points_window')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PointsEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('delta', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('reason', models.CharField(choices=[('order', 'Order placed'), ('settlement', 'Market settled'), ('recalculation', 'Recalculation')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('market', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='markets.market')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='users_point_created_4af273_idx'), models.Index(fields=['user', 'created_at'], name='users_point_user_id_24c890_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PointsWindowEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('rank', models.PositiveIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_history', to=settings.AUTH_USER_MODEL)),
+                ('window', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='users.pointswindow')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['window', 'rank'], name='users_point_window__7c28a7_idx')],
+                'constraints': [models.UniqueConstraint(fields=('window', 'user'), name='unique_points_window_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0007_points_windows'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('total_markets_traded__gt', 0)), fields=['-total_points', '-total_markets_traded', '-accuracy_percentage', 'id'], name='users_user_board_order_idx'),
+        ),
+    ]
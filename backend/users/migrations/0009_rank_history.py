@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_user_board_order_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankHistory',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('rank', models.PositiveIntegerField()),
+                ('points', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('accuracy', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('roi', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rank_history', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'rank history',
+                'indexes': [models.Index(fields=['day'], name='users_rankh_day_796818_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_rank_history_day')],
+            },
+        ),
+    ]
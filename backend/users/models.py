@@ -1,10 +1,19 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 import math
 
 
+CREDIT_STEP = Decimal('0.01')
+
+
+def round_credits(amount):
+    """Round an amount to the cent, as credit columns store it."""
+    return Decimal(str(amount)).quantize(CREDIT_STEP, rounding=ROUND_HALF_UP)
+
+
 class User(AbstractUser):
     """Custom user model with practice credits."""
     # Practice credits (not real money)
@@ -31,6 +40,14 @@ class User(AbstractUser):
         help_text="Base credits amount (used to calculate regeneration)"
     )
     
+    # Escrow of open orders, kept in step with every place / fill / cancel
+    reserved_credits = models.DecimalField(
+        max_digits=26,
+        decimal_places=6,
+        default=Decimal('0'),
+        help_text="Credits locked in open orders (unfilled quantity * limit price)"
+    )
+    
     # Maximum credits cap
     max_credits = models.DecimalField(
         max_digits=20,
@@ -92,6 +109,17 @@ class User(AbstractUser):
         help_text="Return on investment percentage"
     )
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # The all-time board's ordering (users.leaderboard.board_ordering),
+            # so around-me can seek from a user's position in both directions
+            models.Index(
+                fields=['-total_points', '-total_markets_traded', '-accuracy_percentage', 'id'],
+                name='users_user_board_order_idx',
+                condition=Q(total_markets_traded__gt=0),
+            ),
+        ]
+    
     def __str__(self):
         return self.username
     
@@ -137,11 +165,24 @@ class User(AbstractUser):
         
         return current
     
-    def update_credits_from_trade(self, amount_change):
+    def update_credits_from_trade(self, amount_change, reason='trade', **refs):
         """
         Update credits when a trade happens.
         Uses raw stored credits (not decay/regen) so deductions are correct.
+        The change is written to the credit ledger with `reason` and any of
+        order_id / trade_id / market_id in `refs`.
         """
+        from .ledger import record_credit_change
+        
+        before = self.credits
+        self.apply_credits_change(amount_change)
+        self.save(update_fields=['credits', 'base_credits', 'last_activity_at', 'updated_at'])
+        record_credit_change(self.pk, before, self.credits, reason, **refs)
+        
+        return self.credits
+    
+    def apply_credits_change(self, amount_change, now=None):
+        """Apply a trade's credit change in memory (see update_credits_from_trade); doesn't save."""
         # Use raw stored credits - regeneration/decay are display-only
         current = self.credits
         
@@ -149,11 +190,9 @@ class User(AbstractUser):
         new_credits = current + Decimal(str(amount_change))
         
         # Update stored credits
-        self.credits = max(Decimal('0.00'), new_credits)
+        self.credits = round_credits(max(Decimal('0.00'), new_credits))
         self.base_credits = self.credits  # Update base for regeneration calculation
-        self.last_activity_at = timezone.now()  # Reset decay timer
-        self.save()
-        
+        self.last_activity_at = now or timezone.now()  # Reset decay timer
         return self.credits
     
     def calculate_points(self):
@@ -189,8 +228,12 @@ class User(AbstractUser):
     
     def update_points(self):
         """Recalculate and update total points."""
+        from .points import points_event, record_points_events
+        
+        before = self.total_points
         self.total_points = self.calculate_points()
         self.save(update_fields=['total_points'])
+        record_points_events([points_event(self.pk, before, self.total_points, 'recalculation')])
     
     def update_stats_after_market_resolution(self, market, was_correct):
         """
@@ -199,6 +242,18 @@ class User(AbstractUser):
         Note: total_markets_traded is computed from orders at order-placement time,
         so we don't increment it here.
         """
+        from .points import points_event, record_points_events
+        
+        points_before = self.total_points
+        self.apply_market_resolution(was_correct)
+        self.save(update_fields=[
+            'markets_predicted_correctly', 'win_streak', 'best_win_streak', 'accuracy_percentage',
+            'roi_percentage', 'total_points', 'last_activity_at', 'updated_at',
+        ])
+        record_points_events([points_event(self.pk, points_before, self.total_points, 'settlement', market.pk)])
+    
+    def apply_market_resolution(self, was_correct):
+        """Apply a market resolution to the stats in memory (see update_stats_after_market_resolution); doesn't save."""
         if was_correct:
             self.markets_predicted_correctly += 1
             self.win_streak += 1
@@ -224,7 +279,6 @@ class User(AbstractUser):
                 ).quantize(Decimal('0.01'))
         
         self.total_points = self.calculate_points()
-        self.save()
 
 
 class UserProfile(models.Model):
@@ -240,3 +294,181 @@ class UserProfile(models.Model):
 
 
 
+
+
+class CreditEntry(models.Model):
+    """
+    One change to a user's credits. The ledger is append-only: rows are
+    never updated or deleted and the id is the sequence number. A user's
+    balance is their latest CreditSnapshot plus the deltas after it (see
+    users/ledger.py).
+    """
+    REASON_CHOICES = [
+        ('order_escrow', 'Order escrow'),
+        ('order_refund', 'Order refund'),
+        ('trade', 'Trade'),
+        ('amm_fill', 'AMM fill'),
+        ('settlement', 'Settlement payout'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_entries')
+    delta = models.DecimalField(max_digits=20, decimal_places=2)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    order = models.ForeignKey('trading.Order', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    trade = models.ForeignKey('trading.Trade', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    market = models.ForeignKey('markets.Market', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    period = models.DateField(help_text="First day of the (local) month of the entry; the ledger's partition key")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = 'credit entries'
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['period']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.user_id} {self.delta:+} ({self.reason})"
+
+
+class CreditSnapshot(models.Model):
+    """A user's balance as of ledger entry last_entry_id (replay starts after it)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_snapshots')
+    balance = models.DecimalField(max_digits=20, decimal_places=2)
+    last_entry_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-last_entry_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.balance} @ #{self.last_entry_id}"
+
+
+class LeaderboardRank(models.Model):
+    """
+    A trader's place on each leaderboard, recomputed by
+    users.leaderboard.refresh_leaderboard_ranks. *_rank is the displayed rank
+    (ties share one); *_position orders the board's pages.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='leaderboard_rank')
+    all_time_rank = models.PositiveIntegerField()
+    all_time_position = models.PositiveIntegerField()
+    weekly_rank = models.PositiveIntegerField()
+    weekly_position = models.PositiveIntegerField()
+    monthly_rank = models.PositiveIntegerField()
+    monthly_position = models.PositiveIntegerField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['all_time_position']),
+            models.Index(fields=['weekly_position']),
+            models.Index(fields=['monthly_position']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: #{self.all_time_rank}"
+
+
+class PointsEvent(models.Model):
+    """
+    One change to a user's total_points. weekly_points / monthly_points are
+    the sums of these events since the current window started (see
+    users/points.py).
+    """
+    REASON_CHOICES = [
+        ('order', 'Order placed'),
+        ('settlement', 'Market settled'),
+        ('recalculation', 'Recalculation'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='points_events')
+    delta = models.DecimalField(max_digits=20, decimal_places=2)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    market = models.ForeignKey('markets.Market', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.delta:+} ({self.reason})"
+
+
+class PointsWindow(models.Model):
+    """A closed weekly / monthly points window, archived by the rollover job."""
+    WINDOW_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ]
+
+    window = models.CharField(max_length=10, choices=WINDOW_CHOICES)
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    rolled_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'period_start'], name='unique_points_window'),
+        ]
+
+    def __str__(self):
+        return f"{self.window} {self.period_start:%Y-%m-%d}"
+
+
+class PointsWindowEntry(models.Model):
+    """A user's points and rank in a closed window."""
+    window = models.ForeignKey(PointsWindow, on_delete=models.CASCADE, related_name='entries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='points_history')
+    points = models.DecimalField(max_digits=20, decimal_places=2)
+    rank = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'user'], name='unique_points_window_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['window', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.window}: {self.user_id} #{self.rank}"
+
+
+class RankHistory(models.Model):
+    """
+    A trader's all-time rank, points, accuracy and ROI as of one day, taken
+    by the nightly snapshot (users/history.py). Days older than
+    RANK_HISTORY_DAILY_DAYS are thinned to one per week.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rank_history')
+    day = models.DateField()
+    rank = models.PositiveIntegerField()
+    points = models.DecimalField(max_digits=20, decimal_places=2)
+    accuracy = models.DecimalField(max_digits=5, decimal_places=2)
+    roi = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name_plural = 'rank history'
+        constraints = [
+            # Also the (user, day) index history pages range-scan
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_rank_history_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day}: #{self.rank}"
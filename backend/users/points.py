@@ -0,0 +1,168 @@
+"""
+Weekly / Monthly Points
+
+Every change to a user's total_points (recomputed when they place orders and
+when their markets settle) is appended to PointsEvent, and the same delta is
+added to weekly_points and monthly_points with one CASE UPDATE per batch.
+
+Windows follow local time (TIME_ZONE, Africa/Nairobi): weeks start Monday
+00:00, months on the 1st. When one closes, roll_points_windows():
+1. archives it: per-user sums of the window's events, ranked, into
+   PointsWindow / PointsWindowEntry
+2. resets the running totals with one UPDATE to the sum of the events since
+   the new window started (normally nothing), so events that land between
+   the boundary and the job running count for the new window
+
+run_scheduler runs it at each boundary; missed windows are archived one by
+one the next time it runs.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import PointsEvent, PointsWindow, PointsWindowEntry, User
+
+ZERO = Decimal('0.00')
+POINTS_FIELD = DecimalField(max_digits=20, decimal_places=2)
+ARCHIVE_CHUNK_SIZE = 1000
+
+# window -> running total column
+WINDOWS = {
+    'weekly': 'weekly_points',
+    'monthly': 'monthly_points',
+}
+
+
+def window_start(window, when=None):
+    """Start of the weekly / monthly window containing `when` (local time)."""
+    tz = timezone.get_default_timezone()
+    day = timezone.localtime(when or timezone.now(), tz).date()
+    if window == 'weekly':
+        day -= timedelta(days=day.weekday())
+    else:
+        day = day.replace(day=1)
+    return timezone.make_aware(datetime.combine(day, time.min), tz)
+
+
+def next_window_start(window, start):
+    tz = timezone.get_default_timezone()
+    day = timezone.localtime(start, tz).date()
+    if window == 'weekly':
+        day += timedelta(days=7)
+    else:
+        day = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return timezone.make_aware(datetime.combine(day, time.min), tz)
+
+
+def previous_window_start(window, start):
+    return window_start(window, start - timedelta(days=1))
+
+
+def points_event(user_id, before, after, reason, market_id=None, now=None):
+    """The event for total_points going from `before` to `after` (None if unchanged)."""
+    delta = Decimal(str(after)) - Decimal(str(before))
+    if not delta:
+        return None
+    return PointsEvent(user_id=user_id, delta=delta, reason=reason, market_id=market_id, created_at=now or timezone.now())
+
+
+def record_points_events(events):
+    """
+    Append events (Nones are skipped) and add them to the users' weekly and
+    monthly points: one INSERT and one UPDATE.
+    """
+    events = [event for event in events if event is not None]
+    if not events:
+        return events
+
+    PointsEvent.objects.bulk_create(events, batch_size=1000)
+    deltas = {}
+    for event in events:
+        deltas[event.user_id] = deltas.get(event.user_id, ZERO) + event.delta
+    delta = Case(
+        *[When(pk=user_id, then=Value(amount)) for user_id, amount in deltas.items()],
+        default=Value(ZERO),
+        output_field=POINTS_FIELD,
+    )
+    User.objects.filter(pk__in=list(deltas)).update(
+        **{field: F(field) + delta for field in WINDOWS.values()}
+    )
+    return events
+
+
+def _archive_window(window, start, end):
+    """Rank the users' event sums for [start, end) into a PointsWindow."""
+    archived = PointsWindow.objects.create(window=window, period_start=start, period_end=end)
+    totals = (
+        PointsEvent.objects.filter(created_at__gte=start, created_at__lt=end)
+        .values('user_id')
+        .annotate(points=Sum('delta'))
+        .exclude(points=0)
+        .order_by('-points', 'user_id')
+    )
+
+    entries = []
+    rank = position = 0
+    last_points = None
+    for row in totals.iterator(chunk_size=ARCHIVE_CHUNK_SIZE):
+        position += 1
+        if row['points'] != last_points:
+            rank, last_points = position, row['points']
+        entries.append(PointsWindowEntry(window=archived, user_id=row['user_id'], points=row['points'], rank=rank))
+        if len(entries) == ARCHIVE_CHUNK_SIZE:
+            PointsWindowEntry.objects.bulk_create(entries)
+            entries = []
+    PointsWindowEntry.objects.bulk_create(entries)
+    return archived
+
+
+def _reset_window(window, start):
+    """Set the running totals to the events since `start` in one UPDATE."""
+    field = WINDOWS[window]
+    since_start = PointsEvent.objects.filter(created_at__gte=start)
+    current = (
+        since_start.filter(user_id=OuterRef('pk'))
+        .order_by()
+        .values('user_id')
+        .annotate(total=Sum('delta'))
+        .values('total')
+    )
+    User.objects.filter(
+        ~Q(**{field: 0}) | Q(pk__in=since_start.values('user_id'))
+    ).update(**{field: Coalesce(Subquery(current, output_field=POINTS_FIELD), Value(ZERO))})
+
+
+def roll_points_windows(now=None):
+    """Archive every window that has closed since the last rollover and reset its totals. Returns the archived windows."""
+    now = now or timezone.now()
+    rolled = []
+    for window in WINDOWS:
+        current = window_start(window, now)
+        last = PointsWindow.objects.filter(window=window).order_by('-period_start').first()
+        start = last.period_end if last else previous_window_start(window, current)
+        if start >= current:
+            continue
+
+        with transaction.atomic():
+            while start < current:
+                end = next_window_start(window, start)
+                rolled.append(_archive_window(window, start, end))
+                start = end
+            _reset_window(window, current)
+    return rolled
+
+
+def next_points_rollover():
+    """When run_scheduler should roll the windows next (now if one is overdue)."""
+    upcoming = []
+    for window in WINDOWS:
+        current = window_start(window)
+        last_end = PointsWindow.objects.filter(window=window).order_by('-period_start').values_list(
+            'period_end', flat=True
+        ).first()
+        upcoming.append(current if last_end is None or last_end < current else next_window_start(window, current))
+    return min(upcoming)
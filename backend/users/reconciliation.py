@@ -0,0 +1,253 @@
+"""
+Credit Reconciliation
+
+Recomputes every user's balance from their trading and diffs it against
+User.credits:
+
+    expected = opening balance
+             - escrow of open orders    (unfilled quantity * limit price)
+             - cost of filled shares    (filled quantity * limit price, or the
+                                         trade cost for AMM fills and market
+                                         orders, which pay each level's price)
+             + settlement payouts       (filled shares on the winning side of
+                                         resolved markets)
+             + AMM takings              (house account: cost of every AMM trade)
+             - AMM payouts              (house account: AMM shares sold on the
+                                         winning side of resolved markets)
+             + admin adjustments        (from the credit ledger)
+
+Cancelled / expired orders only count for their filled part, since their
+unfilled escrow was refunded. Payouts come from the filled orders, not from
+Position, because settlement zeroes the positions it pays out.
+
+The escrow of open orders is also exactly what User.reserved_credits must
+hold; users where it doesn't are reported too and repair_reserved_credits()
+resets them.
+
+Users are streamed in pk order (a server-side cursor on Postgres) and each
+chunk costs six aggregate queries bounded by the chunk's pk range, so
+memory stays flat however many users there are.
+
+Each credit write rounds the stored balance to the cent, so a correct balance
+can sit up to half a cent per write from the exact figure: placement and
+refund of each order, plus one. Those roundings go either way and mostly
+cancel out, so the slack is capped at MAX_ROUNDING_SLACK however many
+orders a user has; differences within it (plus `tolerance`) aren't
+reported as drift.
+"""
+import heapq
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+
+from .ledger import opening_balance
+from .models import CreditEntry, User
+
+ZERO = Decimal('0.00')
+HALF_CENT = Decimal('0.005')
+# Most rounding slack any user gets, so heavy traders can't hide drift in it
+MAX_ROUNDING_SLACK = Decimal('0.50')
+# Reserved credits are kept exact (6 places)
+RESERVED_TOLERANCE = Decimal('0.000001')
+RECONCILE_CHUNK_SIZE = 5000
+AMOUNT_FIELD = DecimalField(max_digits=26, decimal_places=6)
+
+
+def _amount(value):
+    return Decimal(str(value)) if value is not None else ZERO
+
+
+def expected_balances(first_pk, last_pk):
+    """
+    {user_id: (balance_change, rounding_slack, open_escrow)} for users with
+    first_pk <= pk <= last_pk; the change excludes the opening balance (see
+    module docstring).
+    """
+    from trading.models import Order, Trade
+    from trading.orderbook import OPEN_STATUSES
+
+    in_range = {'user_id__gte': first_pk, 'user_id__lte': last_pk}
+    totals = {}
+
+    orders = Order.objects.filter(**in_range).order_by().values('user_id').annotate(
+        orders=Count('id'),
+        open_escrow=Sum(
+            (F('quantity') - F('filled_quantity')) * F('price'),
+            filter=Q(status__in=OPEN_STATUSES),
+            output_field=AMOUNT_FIELD,
+        ),
+        filled_cost=Sum(
+            F('filled_quantity') * F('price'),
+            filter=~Q(market__pricing_mode='lmsr') & ~Q(order_type='market'),
+            output_field=AMOUNT_FIELD,
+        ),
+        payouts=Sum(
+            'filled_quantity',
+            filter=Q(market__status='resolved', side=F('market__resolution')),
+            output_field=AMOUNT_FIELD,
+        ),
+    )
+    for row in orders:
+        totals[row['user_id']] = [
+            _amount(row['payouts']) - _amount(row['open_escrow']) - _amount(row['filled_cost']),
+            HALF_CENT * (2 * row['orders'] + 1),
+            _amount(row['open_escrow']),
+        ]
+
+    # Market orders on the book: the YES side pays the trade price, the NO side the rest of its value
+    book_trades = Trade.objects.filter(sell_order__isnull=False).order_by()
+    for row in book_trades.filter(
+        buy_order__order_type='market', buyer_id__gte=first_pk, buyer_id__lte=last_pk,
+    ).values('buyer_id').annotate(
+        cost=Sum(F('price') * F('quantity'), output_field=AMOUNT_FIELD),
+    ):
+        totals.setdefault(row['buyer_id'], [ZERO, HALF_CENT, ZERO])[0] -= _amount(row['cost'])
+    for row in book_trades.filter(
+        sell_order__order_type='market', seller_id__gte=first_pk, seller_id__lte=last_pk,
+    ).values('seller_id').annotate(
+        cost=Sum(F('total_value') - F('price') * F('quantity'), output_field=AMOUNT_FIELD),
+    ):
+        totals.setdefault(row['seller_id'], [ZERO, HALF_CENT, ZERO])[0] -= _amount(row['cost'])
+
+    # AMM fills: the trade cost is what the buyer paid and the house received;
+    # the house pays the winning shares back at settlement
+    amm_trades = Trade.objects.filter(sell_order__isnull=True).order_by()
+    for row in amm_trades.filter(buyer_id__gte=first_pk, buyer_id__lte=last_pk).values('buyer_id').annotate(
+        cost=Sum('total_value'),
+    ):
+        totals.setdefault(row['buyer_id'], [ZERO, HALF_CENT, ZERO])[0] -= _amount(row['cost'])
+    for row in amm_trades.filter(seller_id__gte=first_pk, seller_id__lte=last_pk).values('seller_id').annotate(
+        takings=Sum('total_value'),
+        payouts=Sum('quantity', filter=Q(market__status='resolved', side=F('market__resolution'))),
+        trades=Count('id'),
+    ):
+        total = totals.setdefault(row['seller_id'], [ZERO, HALF_CENT, ZERO])
+        total[0] += _amount(row['takings']) - _amount(row['payouts'])
+        total[1] += HALF_CENT * row['trades']
+
+    for row in CreditEntry.objects.filter(reason='adjustment', **in_range).order_by().values('user_id').annotate(
+        adjusted=Sum('delta'),
+    ):
+        totals.setdefault(row['user_id'], [ZERO, HALF_CENT, ZERO])[0] += _amount(row['adjusted'])
+
+    return {
+        user_id: (change, min(slack, MAX_ROUNDING_SLACK), escrow)
+        for user_id, (change, slack, escrow) in totals.items()
+    }
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def open_escrow(user_ids):
+    """{user_id: escrow of their open orders} for `user_ids` (users without any are left out)."""
+    from trading.models import Order
+    from trading.orderbook import OPEN_STATUSES
+
+    return {
+        row['user_id']: _amount(row['escrow'])
+        for row in Order.objects.filter(user_id__in=user_ids, status__in=OPEN_STATUSES).order_by().values(
+            'user_id'
+        ).annotate(escrow=Sum((F('quantity') - F('filled_quantity')) * F('price'), output_field=AMOUNT_FIELD))
+    }
+
+
+def repair_reserved_credits(user_ids):
+    """
+    Reset reserved credits to the escrow of the users' open orders, with the
+    users locked (pk order) so no order moves it meanwhile. Returns the
+    number of users changed.
+    """
+    user_ids = sorted(user_ids)
+    repaired = 0
+    with transaction.atomic():
+        reserved = dict(
+            User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk', 'reserved_credits')
+        )
+        escrow = open_escrow(user_ids)
+        for user_id, current in reserved.items():
+            expected = escrow.get(user_id, ZERO)
+            if abs(_amount(current) - expected) > RESERVED_TOLERANCE:
+                User.objects.filter(pk=user_id).update(reserved_credits=expected)
+                repaired += 1
+    return repaired
+
+
+def reconcile_credits(chunk_size=RECONCILE_CHUNK_SIZE, tolerance=ZERO, on_drift=None, worst=20):
+    """
+    Diff every user's stored credits against their expected balance, and
+    their reserved credits against their open orders' escrow.
+
+    `on_drift(row)` is called for each drifted user as it is found (rows are
+    dicts of user_id, username, stored, expected, drift = stored - expected,
+    reserved, expected_reserved). Returns a summary: users checked, drifted,
+    total / net drift, reserved_drifted (with their ids) and the `worst`
+    largest drifts.
+    """
+    opening = opening_balance()
+    house_opening = {settings.AMM_HOUSE_USERNAME: ZERO}
+
+    summary = {
+        'users': 0,
+        'drifted': 0,
+        'total_drift': ZERO,
+        'net_drift': ZERO,
+        'reserved_drifted': 0,
+        'reserved_drifted_ids': [],
+        'worst': [],
+    }
+    worst_heap = []
+
+    users = User.objects.order_by('pk').values_list('pk', 'username', 'credits', 'reserved_credits').iterator(
+        chunk_size=chunk_size
+    )
+    for chunk in _chunks(users, chunk_size):
+        expected = expected_balances(chunk[0][0], chunk[-1][0])
+        for user_id, username, credits, reserved in chunk:
+            summary['users'] += 1
+            change, slack, escrow = expected.get(user_id, (ZERO, HALF_CENT, ZERO))
+            expected_balance = house_opening.get(username, opening) + change
+            drift = _amount(credits) - expected_balance
+            balance_drifted = abs(drift) > slack + tolerance
+            reserved_drifted = abs(_amount(reserved) - escrow) > RESERVED_TOLERANCE
+            if not balance_drifted and not reserved_drifted:
+                continue
+
+            row = {
+                'user_id': user_id,
+                'username': username,
+                'stored': _amount(credits),
+                'expected': expected_balance.quantize(Decimal('0.000001')),
+                'drift': drift.quantize(Decimal('0.000001')) if balance_drifted else ZERO,
+                'reserved': _amount(reserved),
+                'expected_reserved': escrow.quantize(Decimal('0.000001')),
+            }
+            if reserved_drifted:
+                summary['reserved_drifted'] += 1
+                summary['reserved_drifted_ids'].append(user_id)
+            if on_drift:
+                on_drift(row)
+            if not balance_drifted:
+                continue
+            summary['drifted'] += 1
+            summary['total_drift'] += abs(drift)
+            summary['net_drift'] += drift
+            if worst:
+                entry = (abs(drift), user_id, row)
+                if len(worst_heap) < worst:
+                    heapq.heappush(worst_heap, entry)
+                else:
+                    heapq.heappushpop(worst_heap, entry)
+
+    summary['worst'] = [row for _, _, row in sorted(worst_heap, reverse=True)]
+    return summary
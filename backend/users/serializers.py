@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
+from .leaderboard import user_rank
 from .models import UserProfile
 
 User = get_user_model()
@@ -55,6 +56,8 @@ class UserSerializer(serializers.ModelSerializer):
         return {
             'current': float(current),
             'stored': float(stored),
+            'available': float(stored),
+            'locked': float(obj.reserved_credits),
             'max': float(obj.max_credits),
             'days_inactive': round(days_inactive, 2),
             'next_decay_at': next_decay.isoformat() if next_decay else None,
@@ -64,14 +67,8 @@ class UserSerializer(serializers.ModelSerializer):
         }
     
     def get_rank(self, obj):
-        """Calculate user's rank. Anyone who has traded gets a rank."""
-        if obj.total_markets_traded <= 0:
-            return None
-        rank = User.objects.filter(
-            total_points__gt=obj.total_points,
-            total_markets_traded__gt=0,
-        ).count() + 1
-        return rank
+        """User's rank from the leaderboard rank table. Anyone who has traded gets a rank."""
+        return user_rank(obj, self.context.get('rank_board', 'all_time'))
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
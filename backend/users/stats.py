@@ -0,0 +1,123 @@
+"""
+User Stats
+
+The profile stats (`/api/auth/stats/...`) come from one query: the user row
+joined to their profile, portfolio valuation and leaderboard rank, with the
+position / trade / market counts as correlated subqueries. Trades are
+counted as buyer plus seller, so each side uses its own index instead of an
+OR over both.
+
+The result is cached per user for USER_STATS_CACHE_SECONDS and dropped when
+the user places an order, gets filled, has orders cancelled or a market of
+theirs settles (invalidate_user_stats, after the transaction commits).
+Price moves revalue portfolios without touching the cache, so the P&L
+figures can lag by up to the cache timeout.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Func, OuterRef, Q, Subquery
+
+from .leaderboard import user_rank
+from .models import User
+
+STATS_KEY = 'user-stats:{}'
+USERNAME_KEY = 'user-stats:username:{}'
+
+
+def _count(queryset):
+    """COUNT(*) of a correlated queryset as a subquery."""
+    return Subquery(queryset.order_by().annotate(n=Func(F('pk'), function='COUNT')).values('n'))
+
+
+def stats_queryset():
+    """Users with everything their stats need attached."""
+    from markets.models import Market
+    from trading.models import Position, Trade
+
+    bought = Trade.objects.filter(buyer_id=OuterRef('pk'))
+    sold = Trade.objects.filter(seller_id=OuterRef('pk')).exclude(buyer_id=OuterRef('pk'))
+    markets = Market.objects.filter(
+        Q(pk__in=Trade.objects.filter(buyer_id=OuterRef(OuterRef('pk'))).values('market_id'))
+        | Q(pk__in=Trade.objects.filter(seller_id=OuterRef(OuterRef('pk'))).values('market_id'))
+    )
+    return User.objects.select_related('profile', 'portfolio', 'leaderboard_rank').annotate(
+        active_positions=_count(Position.objects.filter(user_id=OuterRef('pk')).exclude(yes_shares=0, no_shares=0)),
+        bought_trades=_count(bought),
+        sold_trades=_count(sold),
+        markets_traded=_count(markets),
+    )
+
+
+def build_user_stats(user):
+    """The stats payload for a user loaded through stats_queryset()."""
+    from trading.models import PortfolioValuation
+
+    profile = getattr(user, 'profile', None)
+    portfolio = getattr(user, 'portfolio', None) or PortfolioValuation(user=user)
+    return {
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'total_points': float(user.total_points),
+            'weekly_points': float(user.weekly_points),
+            'monthly_points': float(user.monthly_points),
+            'rank': user_rank(user),
+        },
+        'trading': {
+            'win_streak': user.win_streak,
+            'best_win_streak': user.best_win_streak,
+            'markets_predicted_correctly': user.markets_predicted_correctly,
+            'total_markets_traded': user.total_markets_traded,
+            'accuracy_percentage': float(user.accuracy_percentage),
+            'roi_percentage': float(user.roi_percentage),
+            'total_trades': user.bought_trades + user.sold_trades,
+            'markets_traded': user.markets_traded,
+            'active_positions': user.active_positions,
+        },
+        'credits': {
+            'current': float(user.get_current_credits()),
+            'stored': float(user.credits),
+            'locked': float(user.reserved_credits),
+            'max': float(user.max_credits),
+        },
+        'volume': {
+            'total_volume_traded': float(profile.total_volume_traded) if profile else 0.0,
+            'total_profit_loss': float(profile.total_profit_loss) if profile else 0.0,
+            'unrealized_pnl': float(portfolio.unrealized_pnl),
+            'cost_basis': float(portfolio.cost_basis),
+            'market_value': float(portfolio.market_value),
+        }
+    }
+
+
+def user_stats(user_id):
+    """A user's stats, from the cache or one query (None if there is no such user)."""
+    key = STATS_KEY.format(user_id)
+    stats = cache.get(key)
+    if stats is None:
+        user = stats_queryset().filter(pk=user_id).first()
+        if user is None:
+            return None
+        stats = build_user_stats(user)
+        cache.set(key, stats, settings.USER_STATS_CACHE_SECONDS)
+    return stats
+
+
+def user_id_for_username(username):
+    """The id of the user with this username (any case), cached like the stats."""
+    key = USERNAME_KEY.format(username.lower())
+    user_id = cache.get(key)
+    if user_id is None:
+        user_id = User.objects.filter(username__iexact=username).values_list('pk', flat=True).first()
+        if user_id is None:
+            return None
+        cache.set(key, user_id, settings.USER_STATS_CACHE_SECONDS)
+    return user_id
+
+
+def invalidate_user_stats(user_ids):
+    """Drop the users' cached stats once the current transaction commits."""
+    keys = [STATS_KEY.format(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
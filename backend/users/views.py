@@ -6,7 +6,6 @@ from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.db.models import Q, F, Count, Sum
 from django.utils import timezone
 from django.contrib.auth import authenticate, login, logout
 from django.middleware.csrf import get_token
@@ -17,12 +16,13 @@ from allauth.socialaccount.providers.google.views import oauth2_login, OAuth2Cal
 from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 from allauth.socialaccount.models import SocialAccount
 from allauth.socialaccount.providers.google.provider import GoogleProvider
-from datetime import timedelta
-from decimal import Decimal
-from .models import User, UserProfile
+from datetime import datetime, timedelta
+from .history import user_history
+from .leaderboard import around_user, board_page, board_size, user_rank
+from .models import PointsWindow, User
+from .points import WINDOWS, window_start
 from .serializers import UserSerializer, UserProfileSerializer
-from trading.models import Trade, Position
-from markets.models import Market
+from .stats import user_id_for_username, user_stats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -47,11 +47,13 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'], url_path='credits')
     def credits(self, request):
-        """Get current user's credits. current_credits = raw stored (spendable)."""
+        """Get current user's credits. current_credits = raw stored (spendable); locked = held by open orders."""
         user = request.user
         return Response({
             'credits': float(user.credits),
             'current_credits': float(user.credits),  # Spendable = raw stored; matches order deduct
+            'available_credits': float(user.credits),
+            'locked_credits': float(user.reserved_credits),
             'credit_status': UserSerializer().get_credit_status(user)
         })
 
@@ -265,11 +267,9 @@ class LeaderboardViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'], url_path='all-time')
     def all_time(self, request):
         """Get all-time leaderboard (top 100). Includes anyone who has traded."""
-        users = User.objects.filter(
-            total_markets_traded__gt=0
-        ).order_by('-total_points', '-total_markets_traded', '-accuracy_percentage')[:100]
+        users = board_page('all_time')
         
-        serializer = UserSerializer(users, many=True)
+        serializer = UserSerializer(users, many=True, context={'rank_board': 'all_time'})
         return Response({
             'results': serializer.data,
             'type': 'all-time'
@@ -278,11 +278,9 @@ class LeaderboardViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'], url_path='weekly')
     def weekly(self, request):
         """Get weekly leaderboard (top 100). Includes anyone who has traded."""
-        users = User.objects.filter(
-            total_markets_traded__gt=0
-        ).order_by('-weekly_points', '-total_markets_traded', '-accuracy_percentage')[:100]
+        users = board_page('weekly')
         
-        serializer = UserSerializer(users, many=True)
+        serializer = UserSerializer(users, many=True, context={'rank_board': 'weekly'})
         return Response({
             'results': serializer.data,
             'type': 'weekly',
@@ -291,16 +289,51 @@ class LeaderboardViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'], url_path='monthly')
     def monthly(self, request):
         """Get monthly leaderboard (top 100). Includes anyone who has traded."""
-        users = User.objects.filter(
-            total_markets_traded__gt=0
-        ).order_by('-monthly_points', '-total_markets_traded', '-accuracy_percentage')[:100]
+        users = board_page('monthly')
         
-        serializer = UserSerializer(users, many=True)
+        serializer = UserSerializer(users, many=True, context={'rank_board': 'monthly'})
         return Response({
             'results': serializer.data,
             'type': 'monthly',
         })
     
+    @action(detail=False, methods=['get'], url_path='history')
+    def history(self, request):
+        """Get an archived weekly/monthly board (top 100): ?window=weekly|monthly&start=YYYY-MM-DD, latest by default."""
+        window = request.query_params.get('window', 'weekly')
+        if window not in WINDOWS:
+            return Response({'error': 'window must be weekly or monthly'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        windows = PointsWindow.objects.filter(window=window)
+        start = request.query_params.get('start')
+        if start:
+            try:
+                start_date = datetime.strptime(start, '%Y-%m-%d').date()
+            except ValueError:
+                return Response({'error': 'start must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+            windows = windows.filter(period_start=window_start(window, timezone.make_aware(
+                datetime.combine(start_date, datetime.min.time())
+            )))
+        archived = windows.order_by('-period_start').first()
+        if archived is None:
+            return Response({'error': 'No archived window found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        entries = archived.entries.select_related('user').order_by('rank', 'user_id')[:100]
+        return Response({
+            'results': [
+                {
+                    'rank': entry.rank,
+                    'user_id': entry.user_id,
+                    'username': entry.user.username,
+                    'points': float(entry.points),
+                }
+                for entry in entries
+            ],
+            'type': window,
+            'period_start': archived.period_start,
+            'period_end': archived.period_end,
+        })
+    
     @action(detail=False, methods=['get'], url_path='around-me')
     def around_me(self, request):
         """Get user's rank plus 5 users above and below."""
@@ -308,20 +341,14 @@ class LeaderboardViewSet(viewsets.ViewSet):
             return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
         
         user = request.user
-        user_rank = User.objects.filter(
-            total_points__gt=user.total_points
-        ).count() + 1
-        
-        # Get users around this rank
-        offset = max(0, user_rank - 6)
-        users = User.objects.filter(
-            total_markets_traded__gt=0
-        ).order_by('-total_points', '-total_markets_traded', '-accuracy_percentage')[offset:offset+11]
+        # Users who haven't traded sit just below the board
+        rank = user_rank(user) or board_size() + 1
+        users = around_user(user)
         
         serializer = UserSerializer(users, many=True)
         return Response({
             'results': serializer.data,
-            'user_rank': user_rank,
+            'user_rank': rank,
             'user_points': float(user.total_points)
         })
 
@@ -333,99 +360,49 @@ class UserStatsViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def me(self, request):
         """Get current user's stats."""
-        user = request.user
-        stats = self._calculate_user_stats(user)
-        return Response(stats)
+        return Response(user_stats(request.user.pk))
     
     @action(detail=True, methods=['get'])
     def stats(self, request, pk=None):
         """Get stats for a specific user by ID (public)."""
         try:
-            user = User.objects.get(pk=pk)
-            stats = self._calculate_user_stats(user)
-            return Response(stats)
-        except User.DoesNotExist:
+            stats = user_stats(int(pk))
+        except (TypeError, ValueError):
+            stats = None
+        if stats is None:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(stats)
+    
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def history(self, request, pk=None):
+        """Get a user's daily rank history (public, for profile charts): ?days=365 by default."""
+        try:
+            user_id = int(pk)
+            days = int(request.query_params.get('days', 365))
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid user id or days'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        since = timezone.localdate() - timedelta(days=max(days, 1))
+        return Response({
+            'user_id': user_id,
+            'results': [
+                {
+                    'day': row['day'],
+                    'rank': row['rank'],
+                    'points': float(row['points']),
+                    'accuracy': float(row['accuracy']),
+                    'roi': float(row['roi']),
+                }
+                for row in user_history(user_id, since)
+            ],
+        })
     
     @action(detail=False, methods=['get'], url_path='by-username/(?P<username>[^/.]+)',
             permission_classes=[AllowAny])
     def by_username(self, request, username=None):
         """Get stats for a user by username (public profile)."""
-        try:
-            user = User.objects.get(username__iexact=username)
-            stats = self._calculate_user_stats(user)
-            return Response(stats)
-        except User.DoesNotExist:
+        user_id = user_id_for_username(username)
+        stats = user_stats(user_id) if user_id is not None else None
+        if stats is None:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    def _calculate_user_stats(self, user):
-        """Calculate comprehensive user statistics."""
-        # Get positions
-        positions = Position.objects.filter(user=user)
-        active_positions = positions.exclude(
-            yes_shares=0,
-            no_shares=0
-        ).count()
-        
-        # Get trades
-        trades = Trade.objects.filter(
-            Q(buyer=user) | Q(seller=user)
-        )
-        total_trades = trades.count()
-        
-        # Get markets traded
-        markets_traded = Market.objects.filter(
-            Q(trades__buyer=user) | Q(trades__seller=user)
-        ).distinct().count()
-        
-        # Calculate unrealized P&L from positions
-        unrealized_pnl = Decimal('0.00')
-        for position in positions:
-            if position.yes_shares > 0:
-                current_value = position.yes_shares * position.market.yes_price
-                cost_basis = position.yes_shares * position.yes_avg_cost
-                unrealized_pnl += (current_value - cost_basis)
-            if position.no_shares > 0:
-                current_value = position.no_shares * position.market.no_price
-                cost_basis = position.no_shares * position.no_avg_cost
-                unrealized_pnl += (current_value - cost_basis)
-        
-        # Get rank
-        rank = User.objects.filter(
-            total_points__gt=user.total_points
-        ).count() + 1
-        
-        # Get profile
-        profile, _ = UserProfile.objects.get_or_create(user=user)
-        
-        return {
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'total_points': float(user.total_points),
-                'weekly_points': float(user.weekly_points),
-                'monthly_points': float(user.monthly_points),
-                'rank': rank,
-            },
-            'trading': {
-                'win_streak': user.win_streak,
-                'best_win_streak': user.best_win_streak,
-                'markets_predicted_correctly': user.markets_predicted_correctly,
-                'total_markets_traded': user.total_markets_traded,
-                'accuracy_percentage': float(user.accuracy_percentage),
-                'roi_percentage': float(user.roi_percentage),
-                'total_trades': total_trades,
-                'markets_traded': markets_traded,
-                'active_positions': active_positions,
-            },
-            'credits': {
-                'current': float(user.get_current_credits()),
-                'stored': float(user.credits),
-                'max': float(user.max_credits),
-            },
-            'volume': {
-                'total_volume_traded': float(profile.total_volume_traded),
-                'total_profit_loss': float(profile.total_profit_loss),
-                'unrealized_pnl': float(unrealized_pnl),
-            }
-        }
+        return Response(stats)